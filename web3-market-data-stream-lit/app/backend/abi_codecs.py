@@ -0,0 +1,116 @@
+"""
+Precompiled ABI codecs.
+
+Parses each ABI once into per-function codecs holding the selector and the
+input/output types, so calldata can be encoded and return data decoded
+directly with eth_abi instead of going through web3's per-call machinery.
+Events get the same treatment for decoding raw eth_getLogs entries.
+"""
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from eth_abi import decode, encode
+from eth_utils import keccak, to_checksum_address
+from eth_utils.abi import collapse_if_tuple
+from hexbytes import HexBytes
+
+
+def function_signature(abi_entry: Dict[str, Any]) -> str:
+    """Canonical signature of an ABI function entry, e.g. getPool(address,address,uint24)"""
+    return f"{abi_entry['name']}({','.join(collapse_if_tuple(p) for p in abi_entry.get('inputs', []))})"
+
+
+class FunctionCodec:
+    """Selector plus input/output types of one contract function."""
+
+    def __init__(self, abi_entry: Dict[str, Any]):
+        self.name = abi_entry["name"]
+        self.signature = function_signature(abi_entry)
+        self.selector = "0x" + keccak(text=self.signature)[:4].hex()
+        self.input_types = [collapse_if_tuple(p) for p in abi_entry.get("inputs", [])]
+        self.output_types = [collapse_if_tuple(p) for p in abi_entry.get("outputs", [])]
+        self._address_outputs = [t == "address" for t in self.output_types]
+
+    def encode(self, *args: Any) -> str:
+        """Calldata for a call with the given arguments"""
+        return self.selector + encode(self.input_types, list(args)).hex()
+
+    def decode(self, result: Any) -> Any:
+        """Decode return data; a single output is returned as a scalar, like ContractFunction.call()"""
+        values = decode(self.output_types, HexBytes(result))
+        values = [
+            to_checksum_address(value) if is_address else value
+            for is_address, value in zip(self._address_outputs, values)
+        ]
+        return values[0] if len(values) == 1 else values
+
+
+class EventCodec:
+    """Topic plus indexed/data argument types of one contract event."""
+
+    def __init__(self, abi_entry: Dict[str, Any]):
+        self.name = abi_entry["name"]
+        self.signature = function_signature(abi_entry)
+        self.topic = "0x" + keccak(text=self.signature).hex()
+        inputs = abi_entry.get("inputs", [])
+        self.indexed = [(p["name"], collapse_if_tuple(p)) for p in inputs if p.get("indexed")]
+        self.data = [(p["name"], collapse_if_tuple(p)) for p in inputs if not p.get("indexed")]
+
+    def decode(self, log: Dict[str, Any]) -> Dict[str, Any]:
+        """Decode the arguments of a raw log entry (hex topics and data) into a dict by name"""
+        pairs = [
+            (name, arg_type, decode([arg_type], HexBytes(topic))[0])
+            for (name, arg_type), topic in zip(self.indexed, log["topics"][1:])
+        ]
+        values = decode([arg_type for _, arg_type in self.data], HexBytes(log["data"]))
+        pairs += [(name, arg_type, value) for (name, arg_type), value in zip(self.data, values)]
+        return {
+            name: to_checksum_address(value) if arg_type == "address" else value
+            for name, arg_type, value in pairs
+        }
+
+
+class ABICodecs:
+    """Codecs for every function and event of one ABI, keyed by name (first overload wins)."""
+
+    def __init__(self, abi: List[Dict[str, Any]]):
+        self.functions: Dict[str, FunctionCodec] = {}
+        self.events: Dict[str, EventCodec] = {}
+        for entry in abi:
+            if entry.get("type") == "function" and entry["name"] not in self.functions:
+                self.functions[entry["name"]] = FunctionCodec(entry)
+            elif entry.get("type") == "event" and entry["name"] not in self.events:
+                self.events[entry["name"]] = EventCodec(entry)
+        self.events_by_topic = {codec.topic: codec for codec in self.events.values()}
+
+    def __getitem__(self, function_name: str) -> FunctionCodec:
+        return self.functions[function_name]
+
+    def event(self, event_name: str) -> EventCodec:
+        return self.events[event_name]
+
+    def decode_log(self, log: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(event name, arguments) of a raw log entry, or None for events not in the ABI"""
+        codec = self.events_by_topic.get(str(log["topics"][0]).lower()) if log.get("topics") else None
+        if codec is None:
+            return None
+        return codec.name, codec.decode(log)
+
+    def selector_names(self) -> Dict[str, str]:
+        return {codec.selector: codec.name for codec in self.functions.values()}
+
+
+# Codecs by id() of the ABI list; the ABI is kept alongside so its id stays unique
+_codecs: Dict[int, tuple] = {}
+_codecs_lock = threading.Lock()
+
+
+def get_codecs(abi: List[Dict[str, Any]]) -> ABICodecs:
+    """Parse an ABI once and return its codecs on every later call"""
+    entry = _codecs.get(id(abi))
+    if entry is not None and entry[0] is abi:
+        return entry[1]
+    with _codecs_lock:
+        codecs = ABICodecs(abi)
+        _codecs[id(abi)] = (abi, codecs)
+        return codecs
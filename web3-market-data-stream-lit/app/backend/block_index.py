@@ -0,0 +1,225 @@
+"""
+Block number / timestamp index.
+
+Every block header timestamp we read is kept in SQLite per network. Resolving
+a timestamp to a block starts from the closest indexed blocks on either side
+and interpolates between them, fetching the guessed block, its successor and
+two guard blocks around them in one batch: with regular block times the first
+guess is usually exact, the guards bound the answer tightly when it is not, and
+a timestamp between two adjacent indexed blocks needs no RPC at all.
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.backend.block_subscriber import current_heads
+from app.backend.rpc_batch import RPCBatch
+from app.backend.web3_provider import get_web3_instance
+
+# BLOCK_INDEX_DB_PATH overrides the location of the index
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                               "data", "block_index.sqlite")
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS blocks (
+        network TEXT NOT NULL,
+        number INTEGER NOT NULL,
+        timestamp INTEGER NOT NULL,
+        PRIMARY KEY (network, number)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS blocks_by_time ON blocks (network, timestamp)",
+]
+
+# Every few guesses fall back to bisection, in case block times are very irregular
+BISECT_EVERY = 3
+
+# Guard blocks are fetched this fraction of the bracket away from each guess
+GUARD_FRACTION = 256
+
+# Integers below this in an `at` parameter are block numbers, not unix timestamps
+MIN_TIMESTAMP = 1_000_000_000
+
+Block = Tuple[int, int]
+
+
+def parse_timestamp(value: str) -> int:
+    """Unix timestamp of "1735689600", "2025-01-01" or "2025-01-01T00:00:00Z" (naive times are UTC)"""
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+class BlockIndex:
+    """Persisted (network, block number) -> timestamp index with interpolation search."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("BLOCK_INDEX_DB_PATH", DEFAULT_DB_PATH)
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+        self.counters = {"lookups": 0, "rpc_batches": 0, "headers": 0}
+        self.lock = threading.Lock()
+
+    # Index
+
+    def _put(self, network: str, blocks: List[Block]) -> None:
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO blocks VALUES (?, ?, ?)", [(network, n, t) for n, t in blocks]
+            )
+            self.connection.commit()
+
+    def _get(self, network: str, number: int) -> Optional[int]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT timestamp FROM blocks WHERE network = ? AND number = ?", (network, number)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _bracket(self, network: str, timestamp: int) -> Tuple[Optional[Block], Optional[Block]]:
+        """Closest indexed blocks at or before, and after, a timestamp"""
+        with self.lock:
+            before = self.connection.execute(
+                "SELECT number, timestamp FROM blocks WHERE network = ? AND timestamp <= ? "
+                "ORDER BY timestamp DESC, number DESC LIMIT 1", (network, timestamp)
+            ).fetchone()
+            after = self.connection.execute(
+                "SELECT number, timestamp FROM blocks WHERE network = ? AND timestamp > ? "
+                "ORDER BY timestamp, number LIMIT 1", (network, timestamp)
+            ).fetchone()
+        return (tuple(before) if before else None), (tuple(after) if after else None)
+
+    def _fetch(self, network: str, numbers: List[int]) -> Dict[int, int]:
+        """Timestamps of blocks read in one batch and added to the index"""
+        numbers = sorted(set(numbers))
+        with RPCBatch(get_web3_instance(network)) as batch:
+            calls = [
+                (number, batch.add("eth_getBlockByNumber", [hex(number), False],
+                                   lambda header: int(header["timestamp"], 16)))
+                for number in numbers
+            ]
+        timestamps = {number: call.result() for number, call in calls}
+        self._put(network, list(timestamps.items()))
+        with self.lock:
+            self.counters["rpc_batches"] += 1
+            self.counters["headers"] += len(numbers)
+        return timestamps
+
+    # Lookups
+
+    def timestamp(self, network: str, number: int) -> int:
+        """Timestamp of a block, from the index when known"""
+        cached = self._get(network, number)
+        return cached if cached is not None else self._fetch(network, [number])[number]
+
+    def timestamps(self, network: str, numbers: Iterable[int]) -> Dict[int, int]:
+        """Timestamps of several blocks, fetching the ones not indexed yet in one batch"""
+        numbers = set(numbers)
+        timestamps = {}
+        for number in numbers:
+            cached = self._get(network, number)
+            if cached is not None:
+                timestamps[number] = cached
+        missing = [number for number in numbers if number not in timestamps]
+        if missing:
+            timestamps.update(self._fetch(network, missing))
+        return timestamps
+
+    def head(self, network: str) -> Block:
+        """Current head and its timestamp"""
+        heads = current_heads([network])
+        number = heads[network] if heads is not None else get_web3_instance(network).eth.block_number
+        return number, self.timestamp(network, number)
+
+    def block_at(self, network: str, timestamp: int) -> int:
+        """Last block with a timestamp at or before `timestamp` (clamped to genesis and the head)"""
+        with self.lock:
+            self.counters["lookups"] += 1
+        low, high = self._bracket(network, timestamp)
+        if high is None:
+            head = self.head(network)
+            if head[1] <= timestamp:
+                return head[0]
+            high = head
+        if low is None:
+            genesis = (0, self.timestamp(network, 0))
+            if genesis[1] > timestamp:
+                return 0
+            low = genesis
+
+        guesses = 0
+        while high[0] - low[0] > 1:
+            span = high[0] - low[0]
+            if guesses % BISECT_EVERY == BISECT_EVERY - 1:
+                guess = low[0] + span // 2
+            else:
+                guess = low[0] + (timestamp - low[1]) * span // max(high[1] - low[1], 1)
+            guess = min(max(guess, low[0] + 1), high[0] - 1)
+            guesses += 1
+
+            # The guess, its successor and guard blocks on either side go in one batch: the
+            # pair usually settles the answer, and the guards bound it tightly when it does not
+            margin = max(span // GUARD_FRACTION, 1)
+            numbers = [n for n in (guess - margin, guess, guess + 1, guess + 1 + margin) if low[0] < n < high[0]]
+            for number, block_timestamp in self._fetch(network, numbers).items():
+                if block_timestamp <= timestamp and number > low[0]:
+                    low = (number, block_timestamp)
+                elif block_timestamp > timestamp and number < high[0]:
+                    high = (number, block_timestamp)
+        return low[0]
+
+    def resolve(self, network: str, at: str) -> int:
+        """Block of an `at` parameter: a block number, a unix timestamp or an ISO date/time"""
+        at = at.strip()
+        if at.isdigit() and int(at) < MIN_TIMESTAMP:
+            return int(at)
+        return self.block_at(network, parse_timestamp(at))
+
+    # Reorgs
+
+    def invalidate_after(self, network: str, block_number: int) -> None:
+        """Drop timestamps of blocks after block_number (orphaned by a reorg)"""
+        with self.lock:
+            self.connection.execute("DELETE FROM blocks WHERE network = ? AND number > ?", (network, block_number))
+            self.connection.commit()
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT network, COUNT(*), MIN(number), MAX(number) FROM blocks GROUP BY network"
+            ).fetchall()
+            counters = dict(self.counters)
+        return {
+            "path": self.path,
+            "networks": [
+                {"network": network, "blocks": count, "first": first, "last": last}
+                for network, count, first, last in rows
+            ],
+            **counters
+        }
+
+
+_index: Optional[BlockIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_block_index() -> BlockIndex:
+    """Process-wide index, opened on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = BlockIndex()
+        return _index
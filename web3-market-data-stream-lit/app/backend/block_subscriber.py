@@ -0,0 +1,238 @@
+"""
+New-block subscriptions per network.
+
+Each network gets a BlockSubscriber that follows new block headers over a
+WebSocket eth_subscribe("newHeads") and falls back to polling eth_blockNumber
+when no WebSocket endpoint is configured or the connection drops. Listeners are
+called once per new head from a dispatch thread; heads arriving while listeners
+are still running are coalesced, so a burst triggers a single extra refresh for
+the latest block and quiet chains trigger none.
+
+Results computed at a block stay current until HEAD_TOLERANCE seconds after a
+newer head arrived, so fast chains (Arbitrum makes several blocks a second) can
+serve what the last refresh finished instead of requiring the exact live head.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+import websockets
+
+from app.backend.consts import WS_RPCS
+
+# Seconds between eth_blockNumber polls when no WebSocket is available
+POLL_INTERVAL = 2.0
+
+# Seconds to wait after a head for more heads of the same burst before refreshing
+COALESCE_WINDOW = 0.2
+
+# Seconds to poll after a WebSocket failure before reconnecting
+WS_RETRY_INTERVAL = 30.0
+
+# Reconnect when a WebSocket has been silent this long (seconds)
+WS_HEAD_TIMEOUT = 120.0
+
+# Seconds a block stays current after a newer head arrived (HEAD_TOLERANCE_SECONDS overrides)
+HEAD_TOLERANCE = float(os.getenv("HEAD_TOLERANCE_SECONDS", "5"))
+
+# Recent heads kept per network to tell how long ago a block was superseded
+HEAD_HISTORY = 256
+
+BlockListener = Callable[[str, int], None]
+
+
+def get_ws_url(network: str) -> Optional[str]:
+    """WebSocket URL for a network, or None to poll"""
+    # e.g. WS_URL_OVERRIDE=ws://127.0.0.1:8545/ws/{network} to use the replay server
+    override = os.getenv("WS_URL_OVERRIDE")
+    if override:
+        return override.format(network=network)
+    return WS_RPCS.get(network)
+
+
+class BlockSubscriber:
+    """Follows new block headers of one network and notifies listeners once per (coalesced) head."""
+
+    def __init__(
+        self,
+        network: str,
+        ws_url: Optional[str] = None,
+        poll_interval: float = POLL_INTERVAL,
+        coalesce_window: float = COALESCE_WINDOW
+    ):
+        self.network = network
+        self.ws_url = ws_url
+        self.poll_interval = poll_interval
+        self.coalesce_window = coalesce_window
+        self.listeners: List[BlockListener] = []
+        self.latest_block: Optional[int] = None
+        self.latest_hash: Optional[str] = None
+        self.latest_at: Optional[float] = None
+        # (block number, arrival time) of recent heads, oldest first
+        self.recent_heads: Deque[Tuple[int, float]] = deque(maxlen=HEAD_HISTORY)
+        self.mode = "stopped"
+        self.heads_received = 0
+        self.refreshes = 0
+        self._new_head = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def add_listener(self, listener: BlockListener) -> None:
+        self.listeners.append(listener)
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=lambda: asyncio.run(self._follow_heads()),
+                             name=f"heads-{self.network}", daemon=True),
+            threading.Thread(target=self._dispatch, name=f"refresh-{self.network}", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._new_head.set()
+        self._threads = []
+        self.mode = "stopped"
+
+    def on_head(self, block_number: int, block_hash: Optional[str] = None) -> None:
+        """Record a new head; older or repeated heads (reconnects, poll overlap) are ignored"""
+        if self.latest_block is not None and block_number <= self.latest_block:
+            # A different block at the current height is a reorg of the head and is dispatched again
+            if block_number < self.latest_block or block_hash is None or block_hash == self.latest_hash:
+                return
+        self.latest_block = block_number
+        self.latest_hash = block_hash
+        self.latest_at = time.time()
+        self.recent_heads.append((block_number, self.latest_at))
+        self.heads_received += 1
+        # Lazily imported to keep web3 out of this module's import
+        from app.backend.eth_call_cache import eth_call_cache
+        eth_call_cache.set_current_block(self.network, block_number)
+        self._new_head.set()
+
+    def seconds_behind(self, block_number: int) -> float:
+        """Seconds since a head newer than block_number arrived (0 at the head, inf when too old to tell)"""
+        if self.latest_block is None:
+            return float("inf")
+        if block_number >= self.latest_block:
+            return 0.0
+        heads = list(self.recent_heads)
+        # Before the oldest head seen, there is no telling when the block was superseded
+        if not heads or block_number < heads[0][0]:
+            return float("inf")
+        for number, arrived_at in heads:
+            if number > block_number:
+                return time.time() - arrived_at
+        return float("inf")
+
+    # Head sources
+
+    async def _follow_heads(self) -> None:
+        while not self._stop.is_set():
+            if self.ws_url:
+                try:
+                    await self._follow_websocket()
+                except Exception as e:
+                    print(f"newHeads subscription for {self.network} failed, polling: {e}")
+                await self._poll(until=time.monotonic() + WS_RETRY_INTERVAL)
+            else:
+                await self._poll()
+
+    async def _follow_websocket(self) -> None:
+        async with websockets.connect(self.ws_url) as ws:
+            await ws.send(json.dumps({"jsonrpc": "2.0", "id": 1, "method": "eth_subscribe", "params": ["newHeads"]}))
+            reply = json.loads(await asyncio.wait_for(ws.recv(), timeout=10))
+            if "error" in reply:
+                raise RuntimeError(reply["error"])
+            self.mode = "websocket"
+            print(f"Subscribed to newHeads on {self.network}")
+
+            while not self._stop.is_set():
+                message = json.loads(await asyncio.wait_for(ws.recv(), timeout=WS_HEAD_TIMEOUT))
+                head = message.get("params", {}).get("result", {})
+                if "number" in head:
+                    self.on_head(int(head["number"], 16), head.get("hash"))
+
+    async def _poll(self, until: Optional[float] = None) -> None:
+        from app.backend.web3_provider import get_web3_instance
+        self.mode = "polling"
+        web3 = get_web3_instance(self.network)
+        while not self._stop.is_set() and (until is None or time.monotonic() < until):
+            try:
+                result = await asyncio.to_thread(web3.manager.request_blocking, "eth_blockNumber", [])
+                self.on_head(int(result, 16) if isinstance(result, str) else int(result))
+            except Exception as e:
+                print(f"Error polling block number on {self.network}: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    # Refresh dispatch
+
+    def _dispatch(self) -> None:
+        while not self._stop.is_set():
+            if not self._new_head.wait(timeout=1):
+                continue
+            # Let the rest of a burst arrive, then refresh once for the latest head
+            time.sleep(self.coalesce_window)
+            self._new_head.clear()
+            if self._stop.is_set():
+                return
+            block_number = self.latest_block
+            for listener in list(self.listeners):
+                try:
+                    listener(self.network, block_number)
+                except Exception as e:
+                    print(f"Error in block listener for {self.network} at block {block_number}: {e}")
+            self.refreshes += 1
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "network": self.network,
+            "mode": self.mode,
+            "ws_url": self.ws_url.split("/v2/")[0] if self.ws_url else None,
+            "latest_block": self.latest_block,
+            "seconds_since_head": time.time() - self.latest_at if self.latest_at else None,
+            "heads_received": self.heads_received,
+            "refreshes": self.refreshes,
+            "coalesced_heads": max(0, self.heads_received - self.refreshes),
+        }
+
+
+# Subscribers by network
+subscribers: Dict[str, BlockSubscriber] = {}
+_subscribers_lock = threading.Lock()
+
+
+def get_block_subscriber(network: str) -> BlockSubscriber:
+    """Get or create the (not yet started) subscriber for a network"""
+    with _subscribers_lock:
+        if network not in subscribers:
+            subscribers[network] = BlockSubscriber(network, ws_url=get_ws_url(network))
+        return subscribers[network]
+
+
+def is_current(blocks: Dict[str, int], tolerance: float = HEAD_TOLERANCE) -> bool:
+    """Whether results computed at `blocks` are current: each block is its network's head, or was superseded recently"""
+    for network, block_number in blocks.items():
+        subscriber = subscribers.get(network)
+        if subscriber is None or subscriber.mode == "stopped" or subscriber.seconds_behind(block_number) > tolerance:
+            return False
+    return True
+
+
+def current_heads(networks: Iterable[str]) -> Optional[Dict[str, int]]:
+    """Latest block of each network, or None unless all of them are followed and have seen a head"""
+    heads = {}
+    for network in networks:
+        subscriber = subscribers.get(network)
+        if subscriber is None or subscriber.mode == "stopped" or subscriber.latest_block is None:
+            return None
+        heads[network] = subscriber.latest_block
+    return heads
@@ -0,0 +1,87 @@
+"""
+Persistent store of eth_call results at finalized blocks.
+
+A call pinned to a block that can no longer be reorganized always returns the
+same data, so archive reads (fee growth samples, past pool state) are kept in
+SQLite and survive restarts: each historical read is paid for once.
+"""
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+# CALL_HISTORY_DB_PATH overrides the location of the store
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                               "data", "eth_call_history.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    network TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    data TEXT NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (network, block, address, data)
+) WITHOUT ROWID
+"""
+
+
+class CallHistoryStore:
+    """eth_call results keyed by (network, block, address, calldata)."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("CALL_HISTORY_DB_PATH", DEFAULT_DB_PATH)
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+        self.lock = threading.Lock()
+
+    def get(self, network: str, block: int, address: str, data: str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT result FROM calls WHERE network = ? AND block = ? AND address = ? AND data = ?",
+                (network, block, address, data)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, network: str, block: int, address: str, data: str, result: str) -> None:
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO calls VALUES (?, ?, ?, ?, ?)", (network, block, address, data, result)
+            )
+            self.connection.commit()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM calls")
+            self.connection.commit()
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT network, COUNT(*), MIN(block), MAX(block) FROM calls GROUP BY network"
+            ).fetchall()
+        return {
+            "path": self.path,
+            "networks": [
+                {"network": network, "calls": count, "first_block": first, "last_block": last}
+                for network, count, first, last in rows
+            ]
+        }
+
+
+_store: Optional[CallHistoryStore] = None
+_store_lock = threading.Lock()
+
+
+def get_call_history_store() -> CallHistoryStore:
+    """Process-wide store, opened on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CallHistoryStore()
+        return _store
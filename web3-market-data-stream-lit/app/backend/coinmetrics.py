@@ -1,60 +1,238 @@
 import aiohttp
 import os
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, AsyncIterator, Iterator
 import asyncio
+import time
 import requests
 
+from app.backend.metrics import observe_coinmetrics_call
+from app.backend.rate_limiter import get_coinmetrics_limiter
+from app.backend.timeseries_store import get_timeseries_store
+
+# Points per asset returned from the store for a market data request
+RESPONSE_POINTS_PER_ASSET = 100
+
+# Records per CoinMetrics page (the API maximum)
+PAGE_SIZE = 10000
+
+# Pages fetched ahead of the consumer while paging through a query
+PREFETCH_PAGES = 2
+
+# Seconds a blocking CoinMetrics request may take before it is abandoned
+REQUEST_TIMEOUT = 15.0
+
+# CoinMetrics timestamp format (nanosecond precision), so stored times compare as strings
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.000000000Z"
+
+class CoinMetricsError(Exception):
+    """A CoinMetrics request failed (HTTP error or transport exception)"""
+
+def coinmetrics_asset(symbol: str) -> str:
+    """CoinMetrics asset of a token symbol: lowercase, without the 'W' of wrapped tokens (WETH -> eth)"""
+    normalized = symbol.lower()
+    if normalized.startswith('w') and len(normalized) > 1:
+        normalized = normalized[1:]
+    return normalized
+
 class CoinMetricsService:
     """Service for handling CoinMetrics API calls and data processing."""
     
     def __init__(self):
         self.api_key = os.getenv("COINMETRICS_API_KEY")
-        self.api_url = "https://api.coinmetrics.io/v4/timeseries/asset-metrics"
-        
-    async def fetch_metric_data(self, session: aiohttp.ClientSession, metric: str, frequency: str, assets: List[str]):
-        """Fetch data for a specific metric and frequency."""
-        today = datetime.now().strftime("%Y-%m-%d")
-        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-        
-        # Convert assets to a comma-separated string
-        assets_str = ",".join(assets)
-        
-        # Log what we're requesting
-        print(f"Fetching {metric} with frequency {frequency} for assets: {assets_str}")
+        # COINMETRICS_API_URL can point at the replay server for offline runs
+        self.api_url = os.getenv("COINMETRICS_API_URL", "https://api.coinmetrics.io/v4/timeseries/asset-metrics")
+        # Earliest start already backfilled per (metric, frequency, asset), so assets whose
+        # history starts later than asked for are not queried again on every call
+        self.backfilled: Dict[tuple, str] = {}
         
+    def metric_params(
+        self,
+        metric: str,
+        frequency: str,
+        assets: List[str],
+        start_time: str,
+        end_time: Optional[str] = None,
+        start_inclusive: bool = True,
+        ignore_unsupported: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Query parameters for one metric of some assets, paged from the start of the interval.
+        With ignore_unsupported, assets CoinMetrics does not support are left out of the
+        response instead of failing the whole query.
+        """
         params = {
-            "assets": assets_str,
+            "assets": ",".join(assets),
             "metrics": metric,
-            "start_time": yesterday,
-            "end_time": today,
+            "start_time": start_time,
             "api_key": self.api_key,
-            "frequency": frequency
+            "frequency": frequency,
+            "page_size": PAGE_SIZE,
+            "paging_from": "start"
         }
+        if end_time:
+            params["end_time"] = end_time
+        if not start_inclusive:
+            params["start_inclusive"] = "false"
+        if ignore_unsupported:
+            params["ignore_unsupported_errors"] = "true"
+        return params
+
+    async def fetch_page(self, session: aiohttp.ClientSession, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Fetch a single page of a CoinMetrics query."""
+        metric = params.get("metrics", "unknown")
         
         # Log the full request URL for debugging
         full_url = f"{self.api_url}?{'&'.join([f'{key}={value}' for key, value in params.items() if key != 'api_key'])}"
         print(f"Making API request to: {full_url}")
         
+        started = time.perf_counter()
         try:
-            async with session.get(self.api_url, params=params) as response:
+            async with get_coinmetrics_limiter().async_slot() as slot, \
+                    session.get(self.api_url, params=params) as response:
                 if response.status != 200:
+                    if response.status == 429:
+                        slot.throttled()
+                    observe_coinmetrics_call(metric, time.perf_counter() - started, False)
                     print(f"Error response for {metric}: {response.status}")
-                    return {"error": f"API request failed for {metric} with status {response.status}"}
-                
-                data = await response.json()
+                    raise CoinMetricsError(f"API request failed for {metric} with status {response.status}")
                 
-                if not data.get("data"):
-                    print(f"No data returned for {metric}")
-                    return {"error": f"No data available for {metric}"}
-                    
-                print(f"Got {len(data['data'])} records for {metric}")
-                if data["data"]:
-                    print(f"Sample record for {metric}: {data['data'][0]}")
-                return data
+                page = await response.json()
+                observe_coinmetrics_call(metric, time.perf_counter() - started, True)
+                return page
+        except CoinMetricsError:
+            raise
         except Exception as e:
-            print(f"Exception fetching {metric}: {e}")
-            return {"error": f"Exception fetching {metric}: {e}"}
+            observe_coinmetrics_call(metric, time.perf_counter() - started, False)
+            raise CoinMetricsError(f"Exception fetching {metric}: {e}") from e
+
+    async def iter_pages(
+        self,
+        session: aiohttp.ClientSession,
+        params: Dict[str, Any],
+        prefetch: int = PREFETCH_PAGES
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield the records of every page of a query, following next_page_token.
+        
+        Up to `prefetch` pages are fetched ahead of the consumer, so the next
+        request is in flight while a page is processed and memory stays bounded.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=prefetch)
+        
+        async def produce():
+            page_params = dict(params)
+            try:
+                while True:
+                    page = await self.fetch_page(session, page_params)
+                    await queue.put(page.get("data", []))
+                    token = page.get("next_page_token")
+                    if not token:
+                        break
+                    page_params = {**params, "next_page_token": token}
+            except Exception as e:
+                await queue.put(e)
+                return
+            await queue.put(None)
+        
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            producer.cancel()
+
+    def iter_pages_sync(self, params: Dict[str, Any]) -> Iterator[List[Dict[str, Any]]]:
+        """Yield the records of every page of a query, following next_page_token (blocking)"""
+        metric = params.get("metrics", "unknown")
+        page_params = dict(params)
+        while True:
+            started = time.perf_counter()
+            try:
+                with get_coinmetrics_limiter().slot() as slot:
+                    response = requests.get(self.api_url, params=page_params, timeout=REQUEST_TIMEOUT)
+                    if response.status_code == 429:
+                        slot.throttled()
+            except requests.RequestException as e:
+                observe_coinmetrics_call(metric, time.perf_counter() - started, False)
+                raise CoinMetricsError(f"Exception fetching {metric}: {e}") from e
+            observe_coinmetrics_call(metric, time.perf_counter() - started, response.status_code == 200)
+            if response.status_code != 200:
+                error_msg = f"Error fetching {metric}: {response.status_code}"
+                try:
+                    error_details = response.json()
+                    error_msg += f" - {error_details}"
+                except:
+                    pass
+                raise CoinMetricsError(error_msg)
+            
+            page = response.json()
+            yield page.get("data", [])
+            token = page.get("next_page_token")
+            if not token:
+                return
+            page_params = {**params, "next_page_token": token}
+
+    async def fetch_metric_data(self, session: aiohttp.ClientSession, metric: str, frequency: str, assets: List[str]):
+        """Fetch data for a specific metric and frequency, only requesting points newer than the local store."""
+        today = datetime.now().strftime("%Y-%m-%d")
+        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        store = get_timeseries_store()
+        
+        # Assets without recent history need the whole window, the rest only what follows their last point
+        last_times = store.last_times(metric, frequency, assets)
+        missing = [asset for asset in assets if last_times.get(asset, "") < yesterday]
+        known = [asset for asset in assets if asset not in missing]
+        
+        queries = []
+        if missing:
+            queries.append(self.metric_params(metric, frequency, missing, yesterday, today))
+        if known:
+            queries.append(self.metric_params(
+                metric, frequency, known, min(last_times[asset] for asset in known), start_inclusive=False
+            ))
+        
+        errors = []
+        for params in queries:
+            print(f"Fetching {metric} with frequency {frequency} for assets: {params['assets']} since {params['start_time']}")
+            stored = 0
+            try:
+                # Pages go straight into the store, so memory does not grow with the window
+                async for records in self.iter_pages(session, params):
+                    stored += store.put_records(metric, frequency, records)
+            except CoinMetricsError as e:
+                print(f"Exception fetching {metric}: {e}")
+                errors.append(str(e))
+            print(f"Stored {stored} new {metric} points")
+        
+        # Serve the window from the store; the latest points per asset are all consumers use
+        records = store.get_records(
+            metric, frequency, assets, start_time=yesterday, limit_per_asset=RESPONSE_POINTS_PER_ASSET
+        )
+        if not records:
+            return {"error": errors[0] if errors else f"No data available for {metric}"}
+        return {"data": records}
+
+    async def stream_metric_data(
+        self,
+        metric: str,
+        frequency: str,
+        assets: List[str],
+        start_time: str,
+        end_time: Optional[str] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Stream every page of a (possibly multi-day) query, storing each page on the way through"""
+        store = get_timeseries_store()
+        async with aiohttp.ClientSession() as session:
+            params = self.metric_params(metric, frequency, assets, start_time, end_time)
+            async for records in self.iter_pages(session, params):
+                store.put_records(metric, frequency, records)
+                yield records
 
     async def fetch_market_data(self, metrics: List[str], metric_frequencies: Dict[str, str], assets: List[str]):
         """Fetch market data for multiple metrics with their frequencies."""
@@ -79,90 +257,104 @@ class CoinMetricsService:
             
         return {"data": combined_data}
     
-    def fetch_token_prices_sync(self, token_symbols: List[str]) -> Dict[str, float]:
+    def ensure_history(self, metric: str, frequency: str, assets: List[str], start_time: str, end_time: str) -> None:
         """
-        Fetch token prices synchronously for a list of token symbols.
-        Returns a dictionary of token symbols and their prices.
+        Top up the local store so every asset covers [start_time, end_time]
+        (CoinMetrics-format times), fetching only what is missing (blocking).
+        """
+        store = get_timeseries_store()
+        first_times = store.first_times(metric, frequency, assets)
+        last_times = store.last_times(metric, frequency, assets)
         
-        Note: This method will raise exceptions if prices cannot be fetched.
-        No fallback prices are used to ensure data accuracy.
+        queries = []
+        backfill = [
+            asset for asset in assets
+            if first_times.get(asset, "~") > start_time
+            and self.backfilled.get((metric, frequency, asset), "~") > start_time
+        ]
+        if backfill:
+            queries.append(self.metric_params(metric, frequency, backfill, start_time, end_time, ignore_unsupported=True))
+        forward = [asset for asset in assets if asset not in backfill and last_times.get(asset, end_time) < end_time]
+        if forward:
+            queries.append(self.metric_params(
+                metric, frequency, forward, min(last_times[asset] for asset in forward),
+                start_inclusive=False, ignore_unsupported=True
+            ))
+        
+        for params in queries:
+            print(f"Fetching {metric} history with frequency {frequency} for assets: {params['assets']} since {params['start_time']}")
+            stored = 0
+            for records in self.iter_pages_sync(params):
+                stored += store.put_records(metric, frequency, records)
+            print(f"Stored {stored} new {metric} points")
+        for asset in backfill:
+            self.backfilled[(metric, frequency, asset)] = start_time
+    
+    def fetch_latest_prices(self, token_symbols: List[str]) -> Dict[str, float]:
+        """
+        Fetch the latest ReferenceRate of several token symbols in one query.
+        Returns prices for the symbols CoinMetrics knows; others are left out.
         """
         # Lowercase tokens and remove the 'W' prefix from wrapped tokens
-        normalized_symbols = []
-        symbol_map = {}  # Maps normalized symbol to original symbol
+        symbol_map: Dict[str, List[str]] = {}  # Maps normalized symbol to original symbols
         
         for symbol in token_symbols:
-            normalized = symbol.lower()
             # Handle wrapped tokens (WETH -> eth, WBTC -> btc, etc.)
-            if normalized.startswith('w') and len(normalized) > 1:
-                base_symbol = normalized[1:]
-                normalized_symbols.append(base_symbol)
-                symbol_map[base_symbol] = symbol
-            else:
-                normalized_symbols.append(normalized)
-                symbol_map[normalized] = symbol
-        
-        # Remove duplicates
-        normalized_symbols = list(set(normalized_symbols))
-        
-        # Current time and one hour ago
+            symbol_map.setdefault(coinmetrics_asset(symbol), []).append(symbol)
+        
+        # Current time and one minute ago
         end_time = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
         start_time = (datetime.now() - timedelta(minutes=1)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
         
         # Use ReferenceRate metric with 1s frequency
-        params = {
-            "assets": ",".join(normalized_symbols),
-            "metrics": "ReferenceRate",
-            "frequency": "1s",
-            "api_key": self.api_key,
-            "start_time": start_time,
-            "end_time": end_time,
-            "page_size": 100  # Use pagination parameters that are supported
-        }
+        params = self.metric_params(
+            "ReferenceRate", "1s", sorted(symbol_map), start_time, end_time, ignore_unsupported=True
+        )
         
-        response = requests.get(self.api_url, params=params)
-        if response.status_code != 200:
-            error_msg = f"Error fetching token prices: {response.status_code}"
-            try:
-                error_details = response.json()
-                error_msg += f" - {error_details}"
-            except:
-                pass
-            raise Exception(error_msg)
-        
-        data = response.json()
-        if not data.get("data"):
-            raise Exception("No price data returned from CoinMetrics API")
-        
-        # Process the results - get the most recent price for each asset
-        result = {}
+        # Go through every page (a single page would truncate all but the first assets),
+        # keeping only the most recent price for each asset
         asset_latest_data = {}
+        received = 0
+        for records in self.iter_pages_sync(params):
+            received += len(records)
+            get_timeseries_store().put_records("ReferenceRate", "1s", records)
+            for item in records:
+                if "asset" in item and "ReferenceRate" in item and "time" in item:
+                    normalized_symbol = item["asset"]
+                    time_str = item["time"]
+                    
+                    # Update if this is the first entry or a more recent one
+                    if normalized_symbol not in asset_latest_data or time_str > asset_latest_data[normalized_symbol]["time"]:
+                        asset_latest_data[normalized_symbol] = {
+                            "time": time_str,
+                            "price": float(item["ReferenceRate"])
+                        }
         
-        # Group by asset and find the latest data point for each
-        for item in data["data"]:
-            if "asset" in item and "ReferenceRate" in item and "time" in item:
-                normalized_symbol = item["asset"]
-                time_str = item["time"]
-                
-                # Update if this is the first entry or a more recent one
-                if normalized_symbol not in asset_latest_data or time_str > asset_latest_data[normalized_symbol]["time"]:
-                    asset_latest_data[normalized_symbol] = {
-                        "time": time_str,
-                        "price": float(item["ReferenceRate"])
-                    }
+        if not received:
+            raise Exception("No price data returned from CoinMetrics API")
         
         # Map the normalized symbols back to original symbols
+        result = {}
         for normalized_symbol, data_point in asset_latest_data.items():
-            if normalized_symbol in symbol_map:
-                original_symbol = symbol_map[normalized_symbol]
+            for original_symbol in symbol_map.get(normalized_symbol, []):
                 result[original_symbol] = data_point["price"]
+        return result
+    
+    def fetch_token_prices_sync(self, token_symbols: List[str]) -> Dict[str, float]:
+        """
+        Fetch token prices synchronously for a list of token symbols.
+        Returns a dictionary of token symbols and their prices.
+        
+        Note: This method will raise exceptions if prices cannot be fetched.
+        No fallback prices are used to ensure data accuracy.
+        """
+        result = self.fetch_latest_prices(token_symbols)
         
         # Check if we got all requested tokens
         missing_tokens = [symbol for symbol in token_symbols if symbol not in result]
         if missing_tokens:
             raise Exception(f"Could not fetch prices for these tokens: {', '.join(missing_tokens)}")
         
-        
         print(f"fetch_token_prices_sync() {result}")
             
-        return result 
\ No newline at end of file
+        return result
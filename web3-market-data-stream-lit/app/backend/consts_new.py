@@ -35,6 +35,8 @@ BASE_URLS = {
 }
 
 # All these fields are for on-chain data jobs
+# Each network accepts a single URL or a list of URLs; with several URLs requests
+# are routed to the fastest healthy endpoint and slow calls are hedged to the next one
 RPCS = {
     "arbitrum" : "https://arb-mainnet.g.alchemy.com/v2/DaboUGjPdJKw2UY-R1TUCrZhV-q30azQ",  
     "polygon" : "https://polygon-mainnet.g.alchemy.com/v2/DaboUGjPdJKw2UY-R1TUCrZhV-q30azQ",
@@ -42,6 +44,15 @@ RPCS = {
     "base" : "https://base-mainnet.g.alchemy.com/v2/DaboUGjPdJKw2UY-R1TUCrZhV-q30azQ",
 }
 
+# WebSocket endpoints used to follow new block headers (eth_subscribe newHeads);
+# networks without one fall back to polling eth_blockNumber
+WS_RPCS = {
+    "arbitrum" : "wss://arb-mainnet.g.alchemy.com/v2/DaboUGjPdJKw2UY-R1TUCrZhV-q30azQ",
+    "polygon" : "wss://polygon-mainnet.g.alchemy.com/v2/DaboUGjPdJKw2UY-R1TUCrZhV-q30azQ",
+    "optimism" : "wss://optimism-mainnet.g.alchemy.com/v2/DaboUGjPdJKw2UY-R1TUCrZhV-q30azQ",
+    "base" : "wss://base-mainnet.g.alchemy.com/v2/DaboUGjPdJKw2UY-R1TUCrZhV-q30azQ",
+}
+
 # TODO always update wallets 
 PORTFOLIOS = {
     "FDA_PORTOLFIO_3" : {
@@ -2,7 +2,7 @@
 Uniswap V3 Contract ABIs for position data retrieval
 """
 
-# Uniswap v3 Pool ABI (minimal for slot0)
+# Uniswap v3 Pool ABI (minimal for slot0, liquidity and the events that move them)
 UNISWAP_V3_POOL_ABI = [
     {
         "inputs": [],
@@ -18,6 +18,94 @@ UNISWAP_V3_POOL_ABI = [
         ],
         "stateMutability": "view",
         "type": "function"
+    },
+    {
+        "inputs": [],
+        "name": "liquidity",
+        "outputs": [{"internalType": "uint128", "name": "", "type": "uint128"}],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [],
+        "name": "feeGrowthGlobal0X128",
+        "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [],
+        "name": "feeGrowthGlobal1X128",
+        "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [{"internalType": "int24", "name": "tick", "type": "int24"}],
+        "name": "ticks",
+        "outputs": [
+            {"internalType": "uint128", "name": "liquidityGross", "type": "uint128"},
+            {"internalType": "int128", "name": "liquidityNet", "type": "int128"},
+            {"internalType": "uint256", "name": "feeGrowthOutside0X128", "type": "uint256"},
+            {"internalType": "uint256", "name": "feeGrowthOutside1X128", "type": "uint256"},
+            {"internalType": "int56", "name": "tickCumulativeOutside", "type": "int56"},
+            {"internalType": "uint160", "name": "secondsPerLiquidityOutsideX128", "type": "uint160"},
+            {"internalType": "uint32", "name": "secondsOutside", "type": "uint32"},
+            {"internalType": "bool", "name": "initialized", "type": "bool"}
+        ],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [{"internalType": "uint32[]", "name": "secondsAgos", "type": "uint32[]"}],
+        "name": "observe",
+        "outputs": [
+            {"internalType": "int56[]", "name": "tickCumulatives", "type": "int56[]"},
+            {"internalType": "uint160[]", "name": "secondsPerLiquidityCumulativeX128s", "type": "uint160[]"}
+        ],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "address", "name": "sender", "type": "address"},
+            {"indexed": True, "internalType": "address", "name": "recipient", "type": "address"},
+            {"indexed": False, "internalType": "int256", "name": "amount0", "type": "int256"},
+            {"indexed": False, "internalType": "int256", "name": "amount1", "type": "int256"},
+            {"indexed": False, "internalType": "uint160", "name": "sqrtPriceX96", "type": "uint160"},
+            {"indexed": False, "internalType": "uint128", "name": "liquidity", "type": "uint128"},
+            {"indexed": False, "internalType": "int24", "name": "tick", "type": "int24"}
+        ],
+        "name": "Swap",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": False, "internalType": "address", "name": "sender", "type": "address"},
+            {"indexed": True, "internalType": "address", "name": "owner", "type": "address"},
+            {"indexed": True, "internalType": "int24", "name": "tickLower", "type": "int24"},
+            {"indexed": True, "internalType": "int24", "name": "tickUpper", "type": "int24"},
+            {"indexed": False, "internalType": "uint128", "name": "amount", "type": "uint128"},
+            {"indexed": False, "internalType": "uint256", "name": "amount0", "type": "uint256"},
+            {"indexed": False, "internalType": "uint256", "name": "amount1", "type": "uint256"}
+        ],
+        "name": "Mint",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "address", "name": "owner", "type": "address"},
+            {"indexed": True, "internalType": "int24", "name": "tickLower", "type": "int24"},
+            {"indexed": True, "internalType": "int24", "name": "tickUpper", "type": "int24"},
+            {"indexed": False, "internalType": "uint128", "name": "amount", "type": "uint128"},
+            {"indexed": False, "internalType": "uint256", "name": "amount0", "type": "uint256"},
+            {"indexed": False, "internalType": "uint256", "name": "amount1", "type": "uint256"}
+        ],
+        "name": "Burn",
+        "type": "event"
     }
 ]
 
@@ -61,7 +149,7 @@ ERC20_ABI = [
     }
 ]
 
-# Uniswap V3 Position Manager ABI (relevant subset)
+# Uniswap V3 Position Manager ABI (relevant subset, with the events that change a position)
 POSITION_MANAGER_ABI = [
     {
         "inputs": [{"internalType": "uint256", "name": "tokenId", "type": "uint256"}],
@@ -82,6 +170,49 @@ POSITION_MANAGER_ABI = [
         ],
         "stateMutability": "view",
         "type": "function"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "uint256", "name": "tokenId", "type": "uint256"},
+            {"indexed": False, "internalType": "uint128", "name": "liquidity", "type": "uint128"},
+            {"indexed": False, "internalType": "uint256", "name": "amount0", "type": "uint256"},
+            {"indexed": False, "internalType": "uint256", "name": "amount1", "type": "uint256"}
+        ],
+        "name": "IncreaseLiquidity",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "uint256", "name": "tokenId", "type": "uint256"},
+            {"indexed": False, "internalType": "uint128", "name": "liquidity", "type": "uint128"},
+            {"indexed": False, "internalType": "uint256", "name": "amount0", "type": "uint256"},
+            {"indexed": False, "internalType": "uint256", "name": "amount1", "type": "uint256"}
+        ],
+        "name": "DecreaseLiquidity",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "uint256", "name": "tokenId", "type": "uint256"},
+            {"indexed": False, "internalType": "address", "name": "recipient", "type": "address"},
+            {"indexed": False, "internalType": "uint256", "name": "amount0", "type": "uint256"},
+            {"indexed": False, "internalType": "uint256", "name": "amount1", "type": "uint256"}
+        ],
+        "name": "Collect",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "address", "name": "from", "type": "address"},
+            {"indexed": True, "internalType": "address", "name": "to", "type": "address"},
+            {"indexed": True, "internalType": "uint256", "name": "tokenId", "type": "uint256"}
+        ],
+        "name": "Transfer",
+        "type": "event"
     }
 ]
 
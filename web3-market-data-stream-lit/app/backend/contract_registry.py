@@ -0,0 +1,52 @@
+"""
+Registry of contract objects and a low-level call fast path.
+
+Each (network, address, abi) contract is built once and reused, and
+fast_call() encodes calldata and decodes return data with precompiled codecs,
+skipping web3's per-call ABI resolution while still going through the Web3
+middleware stack (eth_call cache, batching, routing, rate limiting).
+"""
+import threading
+from typing import Any, Dict, List, Tuple, Union
+
+from web3 import Web3
+
+from app.backend.abi_codecs import get_codecs
+from app.backend.rpc_batch import to_block_param
+from app.backend.web3_provider import get_web3_instance
+
+# Contracts by (network, address, id(abi))
+contracts: Dict[Tuple[str, str, int], Any] = {}
+_contracts_lock = threading.Lock()
+
+
+def get_contract(network: str, address: str, abi: List[Dict[str, Any]]) -> Any:
+    """Get or build the web3 contract object for an address and ABI on a network"""
+    key = (network, address, id(abi))
+    contract = contracts.get(key)
+    if contract is not None:
+        return contract
+
+    with _contracts_lock:
+        if key not in contracts:
+            contracts[key] = get_web3_instance(network).eth.contract(address=address, abi=abi)
+            # Parse the ABI codecs up front so fast_call never pays for it
+            get_codecs(abi)
+        return contracts[key]
+
+
+def fast_call(
+    network: str,
+    address: str,
+    abi: List[Dict[str, Any]],
+    function_name: str,
+    *args: Any,
+    block_identifier: Union[str, int] = "latest"
+) -> Any:
+    """Call a view function with precompiled codecs, e.g. fast_call(net, pool, POOL_ABI, "slot0")"""
+    codec = get_codecs(abi)[function_name]
+    result = get_web3_instance(network).manager.request_blocking(
+        "eth_call",
+        [{"to": address, "data": codec.encode(*args)}, to_block_param(block_identifier)]
+    )
+    return codec.decode(result)
@@ -0,0 +1,225 @@
+"""
+Block-keyed eth_call result cache.
+
+Results are keyed by (network, block, to, calldata) so identical reads within a
+block - decimals(), getPool, slot0 across wallets, endpoints and the Excel
+report - are only sent once. Calls that can never change (token metadata,
+pool immutables) go to a permanent tier that ignores the block, and calls
+pinned to finalized blocks (archive reads) are also persisted to disk.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from cachetools import LRUCache
+
+from app.backend.call_history_store import get_call_history_store
+from web3 import Web3
+from web3.middleware.base import Web3Middleware
+from web3.types import RPCEndpoint, RPCResponse
+
+# Entries kept for block-scoped results
+BLOCK_CACHE_SIZE = 10_000
+
+# Entries kept for results that never change
+PERMANENT_CACHE_SIZE = 50_000
+
+# How long a fetched block number is used to pin "latest" calls (seconds)
+BLOCK_NUMBER_TTL = 1.0
+
+# Blocks this far below the latest known head are treated as final
+FINALITY_DEPTH = 64
+
+ZERO_ADDRESS_RESULT = "0x" + "0" * 64
+
+
+def function_selector(signature: str) -> str:
+    """4-byte selector of a function signature as a 0x-prefixed hex string"""
+    return Web3.to_hex(Web3.keccak(text=signature)[:4])
+
+
+# Functions whose result never changes for a given contract and arguments
+IMMUTABLE_SELECTORS = {
+    function_selector(signature): signature
+    for signature in [
+        "name()",
+        "symbol()",
+        "decimals()",
+        "token0()",
+        "token1()",
+        "fee()",
+        "tickSpacing()",
+        "factory()",
+        "getPool(address,address,uint24)",
+    ]
+}
+
+CacheKey = Tuple[str, Optional[int], str, str]
+
+
+class EthCallCache:
+    """Size-bounded LRU cache of eth_call responses with a permanent tier for immutable calls."""
+
+    def __init__(self, block_cache_size: int = BLOCK_CACHE_SIZE, permanent_cache_size: int = PERMANENT_CACHE_SIZE):
+        self.block_cache = LRUCache(maxsize=block_cache_size)
+        self.permanent_cache = LRUCache(maxsize=permanent_cache_size)
+        self.block_numbers: Dict[str, Tuple[int, float]] = {}
+        self.hits = 0
+        self.permanent_hits = 0
+        self.history_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def current_block(self, network: str, fetch_block_number: Callable[[], int]) -> int:
+        """Latest block number of a network, refreshed at most every BLOCK_NUMBER_TTL seconds"""
+        cached = self.block_numbers.get(network)
+        if cached and time.monotonic() - cached[1] < BLOCK_NUMBER_TTL:
+            return cached[0]
+        block_number = fetch_block_number()
+        self.block_numbers[network] = (block_number, time.monotonic())
+        return block_number
+
+    def set_current_block(self, network: str, block_number: int) -> None:
+        """Pin "latest" to a block announced by a new-head subscription, saving an eth_blockNumber call"""
+        cached = self.block_numbers.get(network)
+        if cached is None or block_number >= cached[0]:
+            self.block_numbers[network] = (block_number, time.monotonic())
+
+    def make_key(
+        self,
+        network: str,
+        params: Any,
+        fetch_block_number: Callable[[], int]
+    ) -> Optional[Tuple[CacheKey, Any]]:
+        """
+        Build the cache key for eth_call params.
+
+        Returns the key and the params to send on a miss ("latest" is pinned to
+        the block in the key so the cached result matches it), or None if the
+        call is not cacheable.
+        """
+        if not isinstance(params, (list, tuple)) or not params or not isinstance(params[0], dict):
+            return None
+
+        transaction = params[0]
+        to = transaction.get("to")
+        data = transaction.get("data") or transaction.get("input")
+        # Calls with a sender, value or state overrides depend on more than (to, data)
+        if not to or not data or len(params) > 2 or any(k in transaction for k in ("from", "value")):
+            return None
+        to = str(to).lower()
+        data = data.lower() if isinstance(data, str) else Web3.to_hex(data)
+
+        if data[:10] in IMMUTABLE_SELECTORS:
+            return (network, None, to, data), params
+
+        block = params[1] if len(params) > 1 else "latest"
+        if block == "latest":
+            block_number = self.current_block(network, fetch_block_number)
+            return (network, block_number, to, data), [transaction, hex(block_number)]
+        if isinstance(block, str) and block.startswith("0x"):
+            return (network, int(block, 16), to, data), params
+        if isinstance(block, int):
+            return (network, block, to, data), params
+
+        # "pending", "safe", "finalized" and block hashes are not cached
+        return None
+
+    def is_final(self, key: CacheKey) -> bool:
+        """Whether a block-scoped key is deep enough below the known head to never change"""
+        cached = self.block_numbers.get(key[0])
+        return key[1] is not None and cached is not None and key[1] <= cached[0] - FINALITY_DEPTH
+
+    def get(self, key: CacheKey) -> Optional[RPCResponse]:
+        with self.lock:
+            if key[1] is None:
+                response = self.permanent_cache.get(key)
+                if response is not None:
+                    self.permanent_hits += 1
+                    return response
+            else:
+                response = self.block_cache.get(key)
+                if response is not None:
+                    self.hits += 1
+                    return response
+            if not self.is_final(key):
+                self.misses += 1
+                return None
+
+        # Historical reads survive restarts in the call history store
+        result = get_call_history_store().get(*key)
+        with self.lock:
+            if result is None:
+                self.misses += 1
+                return None
+            response = {"jsonrpc": "2.0", "id": 0, "result": result}
+            self.block_cache[key] = response
+            self.history_hits += 1
+            return response
+
+    def put(self, key: CacheKey, response: RPCResponse) -> None:
+        if response.get("error") or "result" not in response:
+            return
+        with self.lock:
+            if key[1] is None:
+                # A zero getPool result means "not deployed yet", which can change
+                if response["result"] != ZERO_ADDRESS_RESULT:
+                    self.permanent_cache[key] = response
+            else:
+                self.block_cache[key] = response
+        if key[1] is not None and self.is_final(key):
+            get_call_history_store().put(*key, response["result"])
+
+    def invalidate_after(self, network: str, block_number: int) -> None:
+        """Drop block-scoped results of blocks after block_number (orphaned by a reorg)"""
+        with self.lock:
+            for key in [key for key in self.block_cache if key[0] == network and key[1] > block_number]:
+                self.block_cache.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and sizes of both tiers"""
+        with self.lock:
+            lookups = self.hits + self.permanent_hits + self.history_hits + self.misses
+            return {
+                "hits": self.hits,
+                "permanent_hits": self.permanent_hits,
+                "history_hits": self.history_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.permanent_hits + self.history_hits) / lookups if lookups else 0.0,
+                "block_entries": len(self.block_cache),
+                "permanent_entries": len(self.permanent_cache),
+            }
+
+
+# Process-wide cache shared by every network's Web3 instance
+eth_call_cache = EthCallCache()
+
+
+class EthCallCacheMiddleware(Web3Middleware):
+    """Web3 middleware serving repeated eth_call requests from eth_call_cache."""
+
+    def wrap_make_request(self, make_request: Callable[[RPCEndpoint, Any], RPCResponse]):
+        provider = self._w3.provider
+        network = getattr(provider, "network", str(provider))
+
+        def fetch_block_number() -> int:
+            return int(make_request(RPCEndpoint("eth_blockNumber"), [])["result"], 16)
+
+        def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+            if method != "eth_call":
+                return make_request(method, params)
+
+            cache_entry = eth_call_cache.make_key(network, params, fetch_block_number)
+            if cache_entry is None:
+                return make_request(method, params)
+
+            key, request_params = cache_entry
+            cached = eth_call_cache.get(key)
+            if cached is not None:
+                return dict(cached)
+
+            response = make_request(method, request_params)
+            eth_call_cache.put(key, response)
+            return response
+
+        return middleware
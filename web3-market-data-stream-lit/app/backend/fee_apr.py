@@ -0,0 +1,200 @@
+"""
+Fee APR of Uniswap V3 positions from sampled pool fee growth.
+
+Fees a position earns between two blocks are its liquidity times the growth of
+feeGrowthInside over its tick range, which follows from the pool's
+feeGrowthGlobal0/1X128 and the feeGrowthOutside of the range's ticks. The pool
+is sampled at the current head and at a past block per window; samples are
+taken per pool (and tick) in one batch per block and shared by every position
+in the pool. Past sample times are aligned to SAMPLE_STEP and resolved to
+blocks with the block index, so they stay the same across requests, and reads
+at finalized blocks are kept permanently by the eth_call cache, so each
+historical sample is paid for once.
+
+The position's current liquidity is assumed over the whole window; positions
+whose range did not exist at the start of a window get no APR for it.
+"""
+import re
+import threading
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from web3 import Web3
+
+from app.backend.block_index import get_block_index
+from app.backend.contract_abis.uniswapv3_position_calculator_minimal_abis import UNISWAP_V3_POOL_ABI
+from app.backend.eth_call_cache import eth_call_cache
+from app.backend.rpc_batch import RPCBatch
+from app.backend.web3_provider import get_web3_instance
+
+# Past sample times are aligned to this many seconds so their blocks are reused
+SAMPLE_STEP = 3600
+
+SECONDS_PER_YEAR = 365 * 86400
+
+Q128 = 2 ** 128
+UINT256 = 2 ** 256
+
+WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_window(label: str) -> int:
+    """Window length in seconds of a label such as 12h, 1d or 7d"""
+    match = re.fullmatch(r"(\d+)([smhdw])", label.strip().lower())
+    if not match:
+        raise ValueError(f"Invalid APR window '{label}' (expected e.g. 12h, 1d, 7d)")
+    return int(match.group(1)) * WINDOW_UNITS[match.group(2)]
+
+
+def fee_growth_inside(
+    tick: int,
+    tick_lower: int,
+    tick_upper: int,
+    fee_growth_global: int,
+    lower_outside: int,
+    upper_outside: int
+) -> int:
+    """feeGrowthInsideX128 of a tick range, as computed by the pool (modulo 2**256)"""
+    below = lower_outside if tick >= tick_lower else (fee_growth_global - lower_outside) % UINT256
+    above = upper_outside if tick < tick_upper else (fee_growth_global - upper_outside) % UINT256
+    return (fee_growth_global - below - above) % UINT256
+
+
+PoolSample = Dict[str, Any]
+
+
+class FeeAprEngine:
+    """Samples pool fee growth at past blocks and turns it into per-position fee APRs."""
+
+    def __init__(self):
+        self.counters = {"samples": 0, "batches": 0, "positions": 0}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def sample_block(network: str, head_time: int, seconds: int) -> int:
+        """Block at about `seconds` before head_time, aligned to SAMPLE_STEP so it is stable between requests"""
+        return get_block_index().block_at(network, (head_time - seconds) // SAMPLE_STEP * SAMPLE_STEP)
+
+    # Pool samples
+
+    def _sample(self, network: str, block: int, pool_ticks: Dict[str, Set[int]]) -> Dict[str, Optional[PoolSample]]:
+        """feeGrowthGlobal, current tick and feeGrowthOutside of the given ticks per pool, in one batch at a block"""
+        with RPCBatch(get_web3_instance(network), block_identifier=block) as batch:
+            calls = {
+                pool: (
+                    batch.fast_call(pool, UNISWAP_V3_POOL_ABI, "feeGrowthGlobal0X128"),
+                    batch.fast_call(pool, UNISWAP_V3_POOL_ABI, "feeGrowthGlobal1X128"),
+                    batch.fast_call(pool, UNISWAP_V3_POOL_ABI, "slot0"),
+                    {tick: batch.fast_call(pool, UNISWAP_V3_POOL_ABI, "ticks", tick) for tick in ticks}
+                )
+                for pool, ticks in pool_ticks.items()
+            }
+
+        samples: Dict[str, Optional[PoolSample]] = {}
+        for pool, (global0, global1, slot0, ticks) in calls.items():
+            try:
+                samples[pool] = {
+                    "block": block,
+                    "global": (global0.result(), global1.result()),
+                    "tick": slot0.result()[1],
+                    # tick -> (feeGrowthOutside0X128, feeGrowthOutside1X128, initialized)
+                    "outside": {tick: (call.result()[2], call.result()[3], call.result()[7]) for tick, call in ticks.items()}
+                }
+            except Exception as e:
+                print(f"Error sampling fee growth of pool {pool} on {network} at block {block}: {e}")
+                samples[pool] = None
+        with self.lock:
+            self.counters["batches"] += 1
+            self.counters["samples"] += len(pool_ticks)
+        return samples
+
+    # Positions
+
+    def add_fee_aprs(
+        self,
+        network: str,
+        positions: List[Dict[str, Any]],
+        windows: Iterable[str],
+        block: Optional[int] = None
+    ) -> None:
+        """Attach a "fee_apr" entry per window label to each valid position of a network (windows ending at `block`)"""
+        valid = [p for p in positions if "error" not in p and int(p["position"]["liquidity"]) > 0]
+        windows = {label: parse_window(label) for label in windows}
+        if not valid or not windows:
+            return
+
+        block_index = get_block_index()
+        head, head_time = block_index.head(network)
+        # Lets the eth_call cache recognise the past samples as final and persist them
+        eth_call_cache.set_current_block(network, head)
+        if block is not None:
+            head, head_time = block, block_index.timestamp(network, block)
+
+        pool_ticks: Dict[str, Set[int]] = {}
+        for position in valid:
+            pool = Web3.to_checksum_address(position["pool"]["address"])
+            pool_ticks.setdefault(pool, set()).update(
+                [position["position"]["tick_lower"], position["position"]["tick_upper"]]
+            )
+
+        current = self._sample(network, head, pool_ticks)
+        for position in valid:
+            position["fee_apr"] = {}
+        for label, seconds in windows.items():
+            past_block = self.sample_block(network, head_time, seconds)
+            past = self._sample(network, past_block, pool_ticks)
+            elapsed = head_time - block_index.timestamp(network, past_block)
+            for position in valid:
+                pool = Web3.to_checksum_address(position["pool"]["address"])
+                position["fee_apr"][label] = self._position_apr(position, past.get(pool), current.get(pool), elapsed)
+        with self.lock:
+            self.counters["positions"] += len(valid)
+
+    @staticmethod
+    def _position_apr(
+        position: Dict[str, Any],
+        past: Optional[PoolSample],
+        current: Optional[PoolSample],
+        elapsed: int
+    ) -> Optional[Dict[str, Any]]:
+        """Fees earned by a position between two pool samples, annualised against its current value"""
+        if past is None or current is None or elapsed <= 0:
+            return None
+        tick_lower = position["position"]["tick_lower"]
+        tick_upper = position["position"]["tick_upper"]
+        # The range has to exist at both ends of the window
+        if not (past["outside"][tick_lower][2] and past["outside"][tick_upper][2]):
+            return None
+
+        token0, token1 = position["token0"], position["token1"]
+        liquidity = int(position["position"]["liquidity"])
+        fees = []
+        for i in (0, 1):
+            inside_then = fee_growth_inside(past["tick"], tick_lower, tick_upper, past["global"][i],
+                                            past["outside"][tick_lower][i], past["outside"][tick_upper][i])
+            inside_now = fee_growth_inside(current["tick"], tick_lower, tick_upper, current["global"][i],
+                                           current["outside"][tick_lower][i], current["outside"][tick_upper][i])
+            fees.append(liquidity * ((inside_now - inside_then) % UINT256) // Q128)
+
+        fees0 = Decimal(fees[0]) / Decimal(10 ** token0["decimals"])
+        fees1 = Decimal(fees[1]) / Decimal(10 ** token1["decimals"])
+        # Value fees and position in token1 at the current price, so no external prices are needed
+        sqrt_price = Decimal(position["pool"]["current_sqrt_price_x96"]) / Decimal(2 ** 96)
+        price0 = sqrt_price * sqrt_price * Decimal(10) ** (token0["decimals"] - token1["decimals"])
+        value = Decimal(position["token0"]["amount"]) * price0 + Decimal(position["token1"]["amount"])
+        fees_value = fees0 * price0 + fees1
+        return {
+            "apr": float(fees_value / value * SECONDS_PER_YEAR / elapsed * 100) if value > 0 else None,
+            "fees0": str(fees0),
+            "fees1": str(fees1),
+            "from_block": past["block"],
+            "to_block": current["block"],
+            "elapsed": elapsed
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            return dict(self.counters)
+
+
+fee_apr_engine = FeeAprEngine()
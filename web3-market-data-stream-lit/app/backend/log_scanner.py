@@ -0,0 +1,163 @@
+"""
+Adaptive, parallel eth_getLogs scanning.
+
+Providers cap eth_getLogs by block range and by result size, with limits that
+differ per provider and per contract activity. LogScanner walks a block range
+in chunks: a chunk the provider rejects as too large is halved and retried,
+every successful chunk grows the next one, and the chunk size learned per
+network is kept for later scans. Chunks are fetched in parallel (each request
+still goes through the RPC router's adaptive rate limiter) and yielded in
+block order, so long backfills stream at the provider's sustainable rate.
+"""
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Deque, Dict, Iterator, List, Optional, Union
+
+from app.backend.abi_codecs import ABICodecs
+from app.backend.web3_provider import get_web3_instance
+
+# Block range of the first chunk on a network
+INITIAL_CHUNK_SIZE = 2_000
+
+# Chunk size bounds (blocks)
+MIN_CHUNK_SIZE = 1
+MAX_CHUNK_SIZE = 100_000
+
+# Growth factor applied to the chunk size after a successful chunk
+GROWTH_FACTOR = 1.5
+
+# Chunks fetched concurrently
+SCAN_WORKERS = 4
+
+# Error fragments providers use when a range or its result set is too large
+RANGE_ERROR_FRAGMENTS = [
+    "query returned more than",
+    "too many",
+    "block range",
+    "range is too large",
+    "range too large",
+    "exceed",
+    "response size",
+    "limited to",
+    "too wide",
+]
+
+# Learned chunk size per network, shared by all scanners
+chunk_sizes: Dict[str, int] = {}
+counters = {"scans": 0, "requests": 0, "splits": 0, "logs": 0}
+_lock = threading.Lock()
+
+
+def is_range_error(error: BaseException) -> bool:
+    """Whether an eth_getLogs error means the range should be split"""
+    message = str(error).lower()
+    return any(fragment in message for fragment in RANGE_ERROR_FRAGMENTS)
+
+
+class LogScanner:
+    """Streams the logs of some contracts and topics over a block range, in block order."""
+
+    def __init__(
+        self,
+        network: str,
+        addresses: Union[str, List[str]],
+        topics: Optional[List[Any]] = None,
+        codecs: Optional[ABICodecs] = None,
+        workers: int = SCAN_WORKERS
+    ):
+        self.network = network
+        self.addresses = addresses
+        self.topics = topics
+        self.codecs = codecs
+        self.workers = workers
+
+    @property
+    def chunk_size(self) -> int:
+        return chunk_sizes.get(self.network, INITIAL_CHUNK_SIZE)
+
+    def _adjust_chunk_size(self, blocks: int, succeeded: bool) -> None:
+        with _lock:
+            current = chunk_sizes.get(self.network, INITIAL_CHUNK_SIZE)
+            if succeeded:
+                # Only grow from chunks that were at least as large as the current size
+                if blocks >= current:
+                    chunk_sizes[self.network] = min(int(current * GROWTH_FACTOR) + 1, MAX_CHUNK_SIZE)
+            else:
+                chunk_sizes[self.network] = max(min(current, blocks) // 2, MIN_CHUNK_SIZE)
+                counters["splits"] += 1
+
+    def _get_logs(self, from_block: int, to_block: int) -> List[Dict[str, Any]]:
+        log_filter: Dict[str, Any] = {
+            "address": self.addresses,
+            "fromBlock": hex(from_block),
+            "toBlock": hex(to_block)
+        }
+        if self.topics is not None:
+            log_filter["topics"] = self.topics
+        with _lock:
+            counters["requests"] += 1
+        return get_web3_instance(self.network).manager.request_blocking("eth_getLogs", [log_filter])
+
+    def fetch_range(self, from_block: int, to_block: int) -> List[Dict[str, Any]]:
+        """Logs of a block range, halving it for as long as the provider rejects it as too large"""
+        try:
+            logs = self._get_logs(from_block, to_block)
+        except Exception as e:
+            if to_block <= from_block or not is_range_error(e):
+                raise
+            self._adjust_chunk_size(to_block - from_block + 1, False)
+            middle = (from_block + to_block) // 2
+            return self.fetch_range(from_block, middle) + self.fetch_range(middle + 1, to_block)
+        self._adjust_chunk_size(to_block - from_block + 1, True)
+        return logs
+
+    def scan(self, from_block: int, to_block: int) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every log in [from_block, to_block] in (block, log index) order.
+
+        With codecs, logs are decoded and yielded with "event" and "args" added;
+        logs the codecs do not know are skipped.
+        """
+        with _lock:
+            counters["scans"] += 1
+        if to_block < from_block:
+            return
+
+        # Per-block updates fit in one chunk and need no worker threads
+        if to_block - from_block < self.chunk_size:
+            yield from self._ordered(self.fetch_range(from_block, to_block))
+            return
+
+        pending: Deque[Future] = deque()
+        next_block = from_block
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"logs-{self.network}") as executor:
+            try:
+                while pending or next_block <= to_block:
+                    # Keep the workers busy with the next chunks, sized by what has been learned so far
+                    while next_block <= to_block and len(pending) < self.workers:
+                        chunk_end = min(next_block + self.chunk_size - 1, to_block)
+                        pending.append(executor.submit(self.fetch_range, next_block, chunk_end))
+                        next_block = chunk_end + 1
+                    yield from self._ordered(pending.popleft().result())
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _ordered(self, logs: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Logs of one chunk in (block, log index) order, decoded when the scanner has codecs"""
+        logs.sort(key=lambda log: (int(log["blockNumber"], 16), int(log["logIndex"], 16)))
+        with _lock:
+            counters["logs"] += len(logs)
+        for log in logs:
+            if self.codecs is None:
+                yield log
+                continue
+            decoded = self.codecs.decode_log(log)
+            if decoded is not None:
+                yield {**log, "event": decoded[0], "args": decoded[1]}
+
+
+def scanner_summary() -> Dict[str, Any]:
+    with _lock:
+        return {"chunk_sizes": dict(chunk_sizes), **counters}
@@ -1,27 +1,28 @@
+import asyncio
+import functools
 import os
 import sys
+import threading
 from dotenv import load_dotenv
-import pandas as pd
 from io import BytesIO
 from fastapi import FastAPI, Query, Response
-from fastapi.responses import StreamingResponse
-from typing import Optional, List, Dict, Any
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Callable, Optional, List, Dict, Any, Tuple
 import json
+import time
 from datetime import datetime
 
 # Fix import paths by adding the current directory to the Python path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
-# Import FastAPI and other modules
-from fastapi import FastAPI, Query
-from typing import Optional, List, Dict, Any
-
-# Now import local modules
+# Now import local modules. pandas, web3 and the position calculators are heavy
+# and are imported inside the endpoints that need them so the server starts fast.
 from consts import DEFAULT_ASSETS, METRIC_FREQUENCIES, PORTFOLIOS
 from coinmetrics import CoinMetricsService
-from web3_uniswap_position_calculator import get_uniswap_wallet_addresses, process_positions
-from web3_aave_position_calculator import get_aave_wallet_addresses, get_wallet_aave_positions
+from app.backend import rate_limiter
+from app.backend.metrics import HTTP_REQUEST_LATENCY, mark_snapshot
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 load_dotenv()
 
@@ -30,6 +31,247 @@ app = FastAPI()
 # Initialize services
 coinmetrics_service = CoinMetricsService()
 
+# Modules preloaded in the background once the server is accepting requests
+PRELOAD_MODULES = [
+    "app.backend.web3_uniswap_position_calculator",
+    "app.backend.web3_aave_position_calculator",
+    "pandas",
+    "xlsxwriter",
+]
+
+# Startup progress reported by the health endpoints
+startup_state: Dict[str, Any] = {
+    "process_started_at": time.time(),
+    "ready_at": None,
+    "warm_at": None,
+    "warm_snapshots": 0,
+    "preload_errors": []
+}
+
+def preload_modules():
+    """Import the heavy modules so the first position or report request does not pay for it"""
+    import importlib
+    for module_name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(module_name)
+        except Exception as e:
+            print(f"Error preloading {module_name}: {e}")
+            startup_state["preload_errors"].append(f"{module_name}: {e}")
+    startup_state["warm_at"] = time.time()
+    print(f"Backend warm after {startup_state['warm_at'] - startup_state['process_started_at']:.2f}s")
+
+    # BLOCK_SUBSCRIPTIONS=0 disables block-driven snapshot refreshes (endpoints then always compute live)
+    if os.getenv("BLOCK_SUBSCRIPTIONS", "1") != "0":
+        try:
+            start_block_subscriptions()
+        except Exception as e:
+            print(f"Error starting block subscriptions: {e}")
+
+def wallet_snapshot_key(wallet_info: Dict[str, Any]) -> str:
+    return f"{wallet_info['portfolio']}:{wallet_info.get('strategy', '')}:{wallet_info['address'].lower()}"
+
+def recorded(kind: str, wallet_info: Dict[str, Any], compute: Callable[[], Any]) -> Callable[[], Any]:
+    """Wrap a snapshot computation so each completed snapshot is also appended to the snapshot history"""
+    def compute_and_record():
+        from app.backend.block_subscriber import current_heads
+        from app.backend.snapshot_history import get_snapshot_history, wallet_networks
+        # Tagged with the heads the computation starts from, like the snapshot cache
+        blocks = current_heads(wallet_networks(wallet_info)) or {}
+        data = compute()
+        try:
+            get_snapshot_history().record(kind, wallet_info, data, blocks)
+        except Exception as e:
+            print(f"Error recording {kind} snapshot of {wallet_info['address']}: {e}")
+        return data
+    return compute_and_record
+
+def load_warm_snapshots() -> int:
+    """Seed the snapshot cache with the last persisted snapshot of every wallet, served as stale until refreshed"""
+    from app.backend.snapshot_cache import snapshot_cache
+    from app.backend.snapshot_history import get_snapshot_history
+
+    snapshots = get_snapshot_history().latest()
+    for kind, portfolio, strategy, wallet, taken_at, blocks, data in snapshots:
+        # Tagged so endpoints can tell the response is not live yet
+        for item in (data if isinstance(data, list) else [data]):
+            item["stale_since"] = taken_at
+        key = wallet_snapshot_key({"portfolio": portfolio, "strategy": strategy, "address": wallet})
+        snapshot_cache.put_stale(kind, key, blocks, data, taken_at)
+    return len(snapshots)
+
+def uniswap_wallet_positions(wallet_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Positions of a wallet from the incremental tracker when it is synced, read directly otherwise"""
+    from app.backend.onchain_prices import onchain_price_engine
+    from app.backend.position_tracker import position_tracker
+    from app.backend.web3_uniswap_position_calculator import process_positions
+
+    positions = position_tracker.wallet_positions(wallet_info)
+    if positions is None:
+        positions = list(process_positions(wallet_info))
+    # The pools just read feed the on-chain fallback prices
+    onchain_price_engine.observe_positions(wallet_info["network"], positions)
+    return positions
+
+def resolve_blocks(networks: List[str], at: str) -> Dict[str, int]:
+    """Block of each network at an `at` parameter (block number, unix timestamp or ISO date/time)"""
+    from app.backend.block_index import MIN_TIMESTAMP, get_block_index
+    from app.backend.eth_call_cache import eth_call_cache
+
+    networks = sorted(set(networks))
+    if len(networks) > 1 and at.strip().isdigit() and int(at) < MIN_TIMESTAMP:
+        raise ValueError(f"Block number {at} is ambiguous across networks {networks}; filter by wallet or pass a time")
+    block_index = get_block_index()
+    blocks = {}
+    for network in networks:
+        # Knowing the head lets the eth_call cache recognise the archive reads as final and persist them
+        eth_call_cache.set_current_block(network, block_index.head(network)[0])
+        blocks[network] = block_index.resolve(network, at)
+    return blocks
+
+def rollback_network(network: str, fork_block: int):
+    """Undo state and cached results derived from blocks after fork_block, orphaned by a reorg"""
+    from app.backend.eth_call_cache import eth_call_cache
+    from app.backend.position_tracker import position_tracker
+    from app.backend.snapshot_cache import snapshot_cache
+
+    eth_call_cache.invalidate_after(network, fork_block)
+    snapshot_cache.invalidate_after(network, fork_block)
+    twap_service = sys.modules.get("app.backend.twap_service")
+    if twap_service is not None:
+        twap_service.twap_service.invalidate_after(network, fork_block)
+    block_index = sys.modules.get("app.backend.block_index")
+    if block_index is not None:
+        block_index.get_block_index().invalidate_after(network, fork_block)
+    position_ledger = sys.modules.get("app.backend.position_ledger")
+    if position_ledger is not None:
+        position_ledger.get_position_ledger().invalidate_after(network, fork_block)
+    position_tracker.rollback(network, fork_block)
+
+def refresh_network_snapshots(
+    network: str,
+    block_number: int,
+    uniswap_wallets: List[Dict[str, Any]],
+    aave_wallets: List[Dict[str, Any]]
+):
+    """
+    Block listener: check for reorgs, advance the position tracker, then recompute
+    the snapshots of the given wallets on a network. A failing wallet is logged
+    and does not keep the others from refreshing.
+    """
+    from app.backend.position_tracker import position_tracker
+    from app.backend.reorg_detector import reorg_detector
+    from app.backend.snapshot_cache import refresh_snapshot
+    from app.backend.web3_aave_position_calculator import get_wallet_aave_positions
+
+    fork_block = reorg_detector.check(network, block_number)
+    if fork_block is not None:
+        rollback_network(network, fork_block)
+    position_tracker.on_block(network, block_number)
+    for wallet_info in uniswap_wallets:
+        try:
+            refresh_snapshot("uniswap", wallet_snapshot_key(wallet_info), [network],
+                             recorded("uniswap", wallet_info,
+                                      lambda wallet_info=wallet_info: uniswap_wallet_positions(wallet_info)))
+        except Exception as e:
+            print(f"Error refreshing Uniswap snapshot of {wallet_info['address']} on {network}: {e}")
+    for wallet_info in aave_wallets:
+        try:
+            refresh_snapshot("aave", wallet_snapshot_key(wallet_info), wallet_info["networks"],
+                             recorded("aave", wallet_info,
+                                      lambda wallet_info=wallet_info: get_wallet_aave_positions(wallet_info)))
+        except Exception as e:
+            print(f"Error refreshing Aave snapshot of {wallet_info['address']} on {network}: {e}")
+    print(f"Refreshed {network} snapshots at block {block_number}")
+
+def start_block_subscriptions():
+    """Follow new heads on every network with tracked wallets, refreshing their snapshots once per block"""
+    from app.backend.block_subscriber import get_block_subscriber
+    from app.backend.position_tracker import position_tracker
+    from app.backend.web3_aave_position_calculator import get_aave_wallet_addresses
+    from app.backend.web3_uniswap_position_calculator import get_uniswap_wallet_addresses
+
+    uniswap_wallets = get_uniswap_wallet_addresses()
+    for wallet_info in uniswap_wallets:
+        try:
+            position_tracker.track_wallet(wallet_info)
+        except Exception as e:
+            print(f"Error tracking Uniswap positions of {wallet_info['address']}: {e}")
+
+    # Wallet lists are built once here rather than re-read from the config on every block
+    aave_wallets = get_aave_wallet_addresses()
+    networks = {w["network"] for w in uniswap_wallets}
+    networks |= {network for w in aave_wallets for network in w["networks"]}
+    for network in sorted(networks):
+        subscriber = get_block_subscriber(network)
+        subscriber.add_listener(functools.partial(
+            refresh_network_snapshots,
+            uniswap_wallets=[w for w in uniswap_wallets if w["network"] == network],
+            aave_wallets=[w for w in aave_wallets if network in w["networks"]]
+        ))
+        subscriber.start()
+
+@app.on_event("startup")
+async def on_startup():
+    # SNAPSHOT_WARM_START=0 makes the first requests after a restart compute live instead
+    if os.getenv("SNAPSHOT_WARM_START", "1") != "0":
+        try:
+            startup_state["warm_snapshots"] = load_warm_snapshots()
+        except Exception as e:
+            print(f"Error loading persisted snapshots: {e}")
+    startup_state["ready_at"] = time.time()
+    print(f"Backend ready after {startup_state['ready_at'] - startup_state['process_started_at']:.2f}s")
+    threading.Thread(target=preload_modules, name="preload-modules", daemon=True).start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    block_subscriber = sys.modules.get("app.backend.block_subscriber")
+    if block_subscriber is not None:
+        for subscriber in block_subscriber.subscribers.values():
+            subscriber.stop()
+
+@app.get("/api/health/live")
+async def health_live():
+    """Liveness probe: the process is up and serving"""
+    return {"status": "alive"}
+
+@app.get("/api/health/ready")
+async def health_ready():
+    """
+    Readiness probe: 200 once startup has finished, 503 before.
+    
+    Returns:
+        Dictionary with startup timings and whether heavy modules are preloaded yet
+    """
+    ready = startup_state["ready_at"] is not None
+    started = startup_state["process_started_at"]
+    body = {
+        "status": "ready" if ready else "starting",
+        "warm": startup_state["warm_at"] is not None,
+        "ready_after_seconds": startup_state["ready_at"] - started if ready else None,
+        "warm_after_seconds": startup_state["warm_at"] - started if startup_state["warm_at"] else None,
+        "warm_snapshots": startup_state["warm_snapshots"],
+        "preload_errors": startup_state["preload_errors"]
+    }
+    return JSONResponse(content=body, status_code=200 if ready else 503)
+
+@app.middleware("http")
+async def record_request_latency(request, call_next):
+    """Record request latency per route template (not per raw path, to keep label cardinality bounded)"""
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    HTTP_REQUEST_LATENCY.labels(
+        route.path if route is not None else "unmatched",
+        request.method,
+        str(response.status_code)
+    ).observe(time.perf_counter() - started)
+    return response
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/api/market-data")
 async def get_market_data(
     metrics: List[str] = Query(default=["ReferenceRate"]),
@@ -45,12 +287,187 @@ async def get_market_data(
         metric_frequencies=METRIC_FREQUENCIES,
         assets=assets
     )
+    mark_snapshot("market")
     return data
 
+@app.get("/api/market-data/history")
+async def stream_market_data_history(
+    metric: str = Query(default="ReferenceRate"),
+    assets: List[str] = Query(default=DEFAULT_ASSETS),
+    frequency: Optional[str] = Query(default=None),
+    start_time: str = Query(...),
+    end_time: Optional[str] = Query(default=None)
+):
+    """
+    Stream the full history of one metric as newline-delimited JSON records.
+    
+    Pages are pulled from CoinMetrics as the response is written (with bounded
+    prefetch), so multi-day 1s queries run at constant memory.
+    
+    Args:
+        metric: CoinMetrics metric name
+        assets: Assets to include
+        frequency: Metric frequency (defaults to METRIC_FREQUENCIES)
+        start_time: Start of the interval (ISO date or timestamp)
+        end_time: Optional end of the interval
+    
+    Returns:
+        application/x-ndjson stream of CoinMetrics records
+    """
+    frequency = frequency or METRIC_FREQUENCIES.get(metric, "1d")
+    
+    async def records():
+        try:
+            async for page in coinmetrics_service.stream_metric_data(metric, frequency, assets, start_time, end_time):
+                yield "".join(json.dumps(record) + "\n" for record in page)
+        except Exception as e:
+            yield json.dumps({"error": f"Error streaming {metric}: {str(e)}"}) + "\n"
+    
+    return StreamingResponse(records(), media_type="application/x-ndjson")
+
+@app.get("/api/prices")
+async def get_prices(symbols: List[str] = Query(...)):
+    """
+    Latest USD prices of token symbols from the shared price service.
+    
+    Every page and report reads prices here, so concurrent requests share one
+    batched CoinMetrics query per TTL instead of each issuing their own.
+    
+    Args:
+        symbols: Token symbols (wrapped tokens resolve to their underlying asset)
+    
+    Returns:
+        Dictionary with prices by upper-case symbol and the symbols without a price
+    """
+    from app.backend.price_service import price_service
+    try:
+        prices = await asyncio.to_thread(price_service.get_prices, symbols)
+    except Exception as e:
+        return {"error": f"Error fetching prices: {str(e)}"}
+    return {
+        "status": "success",
+        "prices": {symbol: price for symbol, price in prices.items() if price is not None},
+        "missing": [symbol for symbol, price in prices.items() if price is None],
+        "as_of": datetime.now().isoformat()
+    }
+
+@app.get("/api/blocks/at")
+async def get_block_at(network: str = Query(...), at: str = Query(...)):
+    """
+    Resolve a time to the last block at or before it.
+    
+    Args:
+        network: Network name
+        at: Unix timestamp or ISO date/time (UTC when no offset is given)
+    
+    Returns:
+        Dictionary with the block number and its timestamp
+    """
+    from app.backend.block_index import get_block_index, parse_timestamp
+    try:
+        timestamp = parse_timestamp(at)
+        block_index = get_block_index()
+        block = await asyncio.to_thread(block_index.block_at, network, timestamp)
+        block_timestamp = await asyncio.to_thread(block_index.timestamp, network, block)
+    except Exception as e:
+        return {"error": f"Error resolving block at {at} on {network}: {str(e)}"}
+    return {"status": "success", "network": network, "block": block, "timestamp": block_timestamp}
+
+def history_range(start: Optional[str], end: Optional[str]) -> Tuple[int, int]:
+    """Unix range of the history endpoints' start/end parameters (default: the last 7 days)"""
+    from app.backend.block_index import parse_timestamp
+    end_time = parse_timestamp(end) if end else int(time.time())
+    start_time = parse_timestamp(start) if start else end_time - 7 * 86400
+    if start_time > end_time:
+        raise ValueError(f"start {start} is after end {end}")
+    return start_time, end_time
+
+@app.get("/api/history/nav")
+async def get_nav_history(
+    portfolio: Optional[str] = Query(default=None),
+    strategy: Optional[str] = Query(default=None),
+    kind: Optional[str] = Query(default=None),
+    start: Optional[str] = Query(default=None),
+    end: Optional[str] = Query(default=None),
+    points: int = Query(default=500)
+):
+    """
+    NAV per portfolio/strategy over time from the local snapshot history.
+
+    Served entirely from storage (no on-chain reads). The range is split into at
+    most `points` buckets; each bucket sums the last recorded value of every
+    wallet, carrying wallets without a snapshot in it forward.
+
+    Args:
+        portfolio: Optional portfolio filter
+        strategy: Optional strategy filter
+        kind: Optional position kind filter ("uniswap" or "aave")
+        start: Start of the range (unix timestamp or ISO date/time, default 7 days before end)
+        end: End of the range (default now)
+        points: Maximum number of points per series
+
+    Returns:
+        Dictionary with the bucket width and a NAV series per portfolio/strategy
+    """
+    from app.backend.snapshot_history import get_snapshot_history
+    try:
+        start_time, end_time = history_range(start, end)
+        history = await asyncio.to_thread(
+            get_snapshot_history().nav, start_time, end_time, points, portfolio, strategy, kind
+        )
+    except Exception as e:
+        return {"error": f"Error reading NAV history: {str(e)}"}
+    return {"status": "success", "start": start_time, "end": end_time, **history}
+
+@app.get("/api/history/positions")
+async def get_position_history(
+    portfolio: Optional[str] = Query(default=None),
+    strategy: Optional[str] = Query(default=None),
+    wallet_address: Optional[str] = Query(default=None),
+    kind: Optional[str] = Query(default=None),
+    start: Optional[str] = Query(default=None),
+    end: Optional[str] = Query(default=None),
+    points: int = Query(default=500),
+    details: bool = Query(default=False)
+):
+    """
+    USD value of each position over time from the local snapshot history.
+
+    Served entirely from storage (no on-chain reads), keeping the last recorded
+    snapshot of each position per bucket.
+
+    Args:
+        portfolio: Optional portfolio filter
+        strategy: Optional strategy filter
+        wallet_address: Optional wallet filter
+        kind: Optional position kind filter ("uniswap" or "aave")
+        start: Start of the range (unix timestamp or ISO date/time, default 7 days before end)
+        end: End of the range (default now)
+        points: Maximum number of points per series
+        details: Include the full recorded position with each point
+
+    Returns:
+        Dictionary with the bucket width and a value series per position
+    """
+    from app.backend.snapshot_history import get_snapshot_history
+    try:
+        start_time, end_time = history_range(start, end)
+        history = await asyncio.to_thread(
+            get_snapshot_history().positions, start_time, end_time, points,
+            portfolio, strategy, wallet_address, kind, details
+        )
+    except Exception as e:
+        return {"error": f"Error reading position history: {str(e)}"}
+    return {"status": "success", "start": start_time, "end": end_time, **history}
+
 @app.get("/api/uniswap/positions")
 async def get_uniswap_positions(
     portfolio: Optional[str] = Query(default=None),
-    wallet_address: Optional[str] = Query(default=None)
+    wallet_address: Optional[str] = Query(default=None),
+    twap_window: Optional[int] = Query(default=None),
+    apr_windows: List[str] = Query(default=[]),
+    pnl: bool = Query(default=False),
+    at: Optional[str] = Query(default=None)
 ):
     """
     Get Uniswap V3 position data for all wallets or filter by portfolio/wallet.
@@ -58,11 +475,21 @@ async def get_uniswap_positions(
     Args:
         portfolio: Optional filter by portfolio name
         wallet_address: Optional filter by specific wallet address
+        twap_window: TWAP window in seconds for the "twap" valuation (0 disables it)
+        apr_windows: Fee APR windows to report per position (e.g. 1d, 7d)
+        pnl: Add cost basis, realized/unrealized PnL and impermanent loss per position
+        at: Value the positions at a past block instead of the head: a block number,
+            unix timestamp or ISO date/time (needs an archive RPC)
     
     Returns:
-        List of Uniswap V3 positions
+        List of Uniswap V3 positions, each valued at spot and at the pool's TWAP
+        (flagged `stale` while a snapshot persisted before a restart is refreshed)
     """
     try:
+        from app.backend.snapshot_cache import cached_snapshot
+        from app.backend.twap_service import TWAP_WINDOW, add_twap_marks
+        from app.backend.fee_apr import fee_apr_engine
+        from app.backend.web3_uniswap_position_calculator import get_uniswap_wallet_addresses, process_positions
         # Get wallet addresses with associated NFT IDs
         wallet_addresses = get_uniswap_wallet_addresses()
         
@@ -87,10 +514,30 @@ async def get_uniswap_positions(
             if not wallet_addresses:
                 return {"error": f"Wallet address '{wallet_address_str}' not found or has no Uniswap positions"}
         
+        # Historical mode: resolve the block of every network involved
+        blocks: Optional[Dict[str, int]] = None
+        if at is not None:
+            try:
+                blocks = await asyncio.to_thread(resolve_blocks, [w["network"] for w in wallet_addresses], str(at))
+            except ValueError as e:
+                return {"error": str(e)}
+        
         # Process all positions across wallets
         all_positions: List[Dict[str, Any]] = []
+        network_positions: Dict[str, List[Dict[str, Any]]] = {}
         for wallet_info in wallet_addresses:
-            positions_data = list(process_positions(wallet_info))
+            if blocks is not None:
+                # Read at the block directly; archive reads at final blocks are persisted by the eth_call cache
+                positions_data = await asyncio.to_thread(
+                    lambda wallet_info=wallet_info: list(process_positions(wallet_info, blocks[wallet_info["network"]]))
+                )
+            else:
+                # Computing a snapshot reads the chain, which must not block the event loop
+                positions_data = await asyncio.to_thread(
+                    cached_snapshot, "uniswap", wallet_snapshot_key(wallet_info), [wallet_info["network"]],
+                    recorded("uniswap", wallet_info,
+                             lambda wallet_info=wallet_info: uniswap_wallet_positions(wallet_info))
+                )
             
             # Add wallet info to each position
             for position in positions_data:
@@ -99,15 +546,61 @@ async def get_uniswap_positions(
                     position["portfolio"] = wallet_info["portfolio"]
                     if "strategy" in wallet_info:
                         position["strategy"] = wallet_info["strategy"]
+                    if blocks is not None:
+                        position["block"] = blocks[wallet_info["network"]]
             
             all_positions.extend(positions_data)
+            network_positions.setdefault(wallet_info["network"], []).extend(positions_data)
+        
+        # TWAP marks: one observe() batch per network, cached per block
+        window = TWAP_WINDOW if twap_window is None else twap_window
+        if window > 0:
+            for network, positions_data in network_positions.items():
+                try:
+                    await asyncio.to_thread(
+                        add_twap_marks, network, positions_data, window, blocks[network] if blocks else None
+                    )
+                except Exception as e:
+                    print(f"Error reading TWAPs on {network}: {e}")
+        
+        # Persisted snapshots served after a restart skip the archive-heavy fee APR and PnL
+        # enrichment; the next request after the background refresh gets them
+        stale_since = min((p["stale_since"] for p in all_positions if "stale_since" in p), default=None)
+        
+        # Fee APRs from sampled fee growth, shared by every position in a pool
+        if apr_windows and stale_since is None:
+            for network, positions_data in network_positions.items():
+                try:
+                    await asyncio.to_thread(
+                        fee_apr_engine.add_fee_aprs, network, positions_data, apr_windows,
+                        blocks[network] if blocks else None
+                    )
+                except ValueError as e:
+                    return {"error": str(e)}
+                except Exception as e:
+                    print(f"Error computing fee APRs on {network}: {e}")
+        
+        # PnL from the stored liquidity events, valued at historical and current prices
+        if pnl and blocks is None and stale_since is None:
+            from app.backend.pnl_engine import pnl_engine
+            for network, positions_data in network_positions.items():
+                try:
+                    await asyncio.to_thread(pnl_engine.add_pnl, network, positions_data)
+                except Exception as e:
+                    print(f"Error computing PnL on {network}: {e}")
         
         # Filter out positions with errors
         valid_positions = [p for p in all_positions if "error" not in p]
+        if blocks is not None:
+            return {"count": len(valid_positions), "positions": valid_positions, "blocks": blocks}
+        if stale_since is None:
+            mark_snapshot("uniswap")
         
         return {
             "count": len(valid_positions),
-            "positions": valid_positions
+            "positions": valid_positions,
+            "stale": stale_since is not None,
+            "stale_since": stale_since
         }
         
     except Exception as e:
@@ -117,7 +610,8 @@ async def get_uniswap_positions(
 async def get_aave_positions(
     portfolio: Optional[str] = Query(default=None),
     wallet_address: Optional[str] = Query(default=None),
-    aave_protocol_only: bool = Query(default=False)
+    aave_protocol_only: bool = Query(default=False),
+    at: Optional[str] = Query(default=None)
 ):
     """
     Get Aave token positions data for wallets.
@@ -126,11 +620,16 @@ async def get_aave_positions(
         portfolio: Optional filter by portfolio name
         wallet_address: Optional filter by specific wallet address
         aave_protocol_only: If True, only return positions from wallets where Aave is listed as an active protocol
+        at: Balances at a past block instead of the head: a block number, unix timestamp
+            or ISO date/time (needs an archive RPC)
     
     Returns:
-        List of Aave token positions
+        List of Aave token positions (flagged `stale` while a snapshot persisted
+        before a restart is refreshed)
     """
     try:
+        from app.backend.snapshot_cache import cached_snapshot
+        from app.backend.web3_aave_position_calculator import get_aave_wallet_addresses, get_wallet_aave_positions
         # Get wallet addresses with Aave tokens or with active Aave protocol
         wallet_addresses = get_aave_wallet_addresses()
         
@@ -167,18 +666,41 @@ async def get_aave_positions(
             if not wallet_addresses:
                 return {"error": f"Wallet address '{wallet_address_str}' not found or has no Aave positions"}
         
+        # Historical mode: resolve the block of every network involved
+        blocks: Optional[Dict[str, int]] = None
+        if at is not None:
+            try:
+                networks = [network for w in wallet_addresses for network in w["networks"]]
+                blocks = await asyncio.to_thread(resolve_blocks, networks, str(at))
+            except ValueError as e:
+                return {"error": str(e)}
+        
         # Process all Aave positions across wallets
         all_positions = []
         for wallet_info in wallet_addresses:
-            position_data = get_wallet_aave_positions(wallet_info)
+            if blocks is not None:
+                position_data = await asyncio.to_thread(get_wallet_aave_positions, wallet_info, blocks)
+            else:
+                position_data = await asyncio.to_thread(
+                    cached_snapshot, "aave", wallet_snapshot_key(wallet_info), wallet_info["networks"],
+                    recorded("aave", wallet_info,
+                             lambda wallet_info=wallet_info: get_wallet_aave_positions(wallet_info))
+                )
             
             # Only include positions with tokens
             if position_data["tokens"]:
                 all_positions.append(position_data)
+        if blocks is not None:
+            return {"count": len(all_positions), "wallets": all_positions, "blocks": blocks}
+        stale_since = min((w["stale_since"] for w in all_positions if "stale_since" in w), default=None)
+        if stale_since is None:
+            mark_snapshot("aave")
         
         return {
             "count": len(all_positions),
-            "wallets": all_positions
+            "wallets": all_positions,
+            "stale": stale_since is not None,
+            "stale_since": stale_since
         }
         
     except Exception as e:
@@ -187,7 +709,8 @@ async def get_aave_positions(
 @app.get("/api/aave/positions/protocol-only")
 async def get_aave_protocol_positions(
     portfolio: Optional[str] = Query(default=None),
-    wallet_address: Optional[str] = Query(default=None)
+    wallet_address: Optional[str] = Query(default=None),
+    at: Optional[str] = Query(default=None)
 ):
     """
     Get Aave token positions data only for wallets where Aave is listed as an active protocol.
@@ -195,6 +718,7 @@ async def get_aave_protocol_positions(
     Args:
         portfolio: Optional filter by portfolio name
         wallet_address: Optional filter by specific wallet address
+        at: Optional past block number, unix timestamp or ISO date/time
     
     Returns:
         List of Aave token positions
@@ -202,9 +726,10 @@ async def get_aave_protocol_positions(
     # Convert Query objects to strings if needed
     portfolio_str = str(portfolio) if portfolio else None
     wallet_address_str = str(wallet_address) if wallet_address else None
+    at_str = str(at) if at else None
     
     # Reuse the existing endpoint with aave_protocol_only set to True
-    return await get_aave_positions(portfolio_str, wallet_address_str, aave_protocol_only=True)
+    return await get_aave_positions(portfolio_str, wallet_address_str, aave_protocol_only=True, at=at_str)
 
 @app.get("/api/report/positions-excel")
 async def generate_excel_report(
@@ -224,6 +749,10 @@ async def generate_excel_report(
         Excel file as a streaming response
     """
     try:
+        import pandas as pd
+        from app.backend.snapshot_cache import cached_snapshot
+        from app.backend.web3_aave_position_calculator import get_aave_wallet_addresses, get_wallet_aave_positions
+        from app.backend.web3_uniswap_position_calculator import get_uniswap_wallet_addresses
         # Convert Query objects to their string values if needed
         portfolio_str = str(portfolio) if portfolio is not None else None
         
@@ -276,7 +805,13 @@ async def generate_excel_report(
                     all_positions = []
                     for wallet_info in wallet_addresses:
                         try:
-                            position_data = get_wallet_aave_positions(wallet_info)
+                            position_data = await asyncio.to_thread(
+                                cached_snapshot,
+                                "aave", wallet_snapshot_key(wallet_info), wallet_info["networks"],
+                                recorded("aave", wallet_info,
+                                         lambda wallet_info=wallet_info: get_wallet_aave_positions(wallet_info)),
+                                allow_stale=False
+                            )
                             
                             # Only include positions with tokens
                             if position_data["tokens"]:
@@ -368,7 +903,13 @@ async def generate_excel_report(
                     
                     for wallet_info in wallet_addresses:
                         print(f"Processing Uniswap wallet: {wallet_info['address']}")
-                        positions_data = list(process_positions(wallet_info))
+                        positions_data = await asyncio.to_thread(
+                            cached_snapshot,
+                            "uniswap", wallet_snapshot_key(wallet_info), [wallet_info["network"]],
+                            recorded("uniswap", wallet_info,
+                                     lambda wallet_info=wallet_info: uniswap_wallet_positions(wallet_info)),
+                            allow_stale=False
+                        )
                         
                         # Add wallet info to each position
                         for position in positions_data:
@@ -389,7 +930,7 @@ async def generate_excel_report(
                     
                     print(f"FOUND {positions_count} UNISWAP POSITIONS DIRECTLY")
                     
-                    # Calculate USD values using the CoinMetricsService
+                    # Calculate USD values using the shared price service
                     if positions_count > 0:
                         # Extract token symbols from positions
                         token_symbols = set()
@@ -403,9 +944,11 @@ async def generate_excel_report(
                         token_prices = {}
                         if token_symbols:
                             try:
-                                from coinmetrics import CoinMetricsService
-                                coinmetrics = CoinMetricsService()
-                                token_prices = coinmetrics.fetch_token_prices_sync(list(token_symbols))
+                                from app.backend.price_service import price_service
+                                prices = await asyncio.to_thread(price_service.get_prices, token_symbols)
+                                token_prices = {
+                                    symbol: price for symbol, price in prices.items() if price is not None
+                                }
                                 print(f"Fetched prices for {len(token_prices)} tokens")
                             except Exception as e:
                                 print(f"Error fetching token prices: {e}")
@@ -672,6 +1215,7 @@ async def test_uniswap_config():
         Dictionary with configuration info
     """
     try:
+        from app.backend.web3_uniswap_position_calculator import get_uniswap_wallet_addresses
         # Get wallet addresses with Uniswap V3 positions
         wallet_addresses = get_uniswap_wallet_addresses()
         
@@ -685,3 +1229,135 @@ async def test_uniswap_config():
         }
     except Exception as e:
         return {"error": f"Error in test_uniswap_config: {str(e)}"}
+
+@app.get("/api/test/eth-call-cache")
+async def test_eth_call_cache():
+    """
+    Test endpoint to inspect the eth_call result cache.
+    
+    Returns:
+        Dictionary with hit/miss counters, cache sizes and the persisted historical calls
+    """
+    from app.backend.call_history_store import get_call_history_store
+    from app.backend.eth_call_cache import eth_call_cache
+    return {
+        "status": "success",
+        "cache": eth_call_cache.stats(),
+        "history": get_call_history_store().summary()
+    }
+
+@app.get("/api/test/block-subscriptions")
+async def test_block_subscriptions():
+    """
+    Test endpoint to inspect the new-block subscriptions driving snapshot refreshes.
+    
+    Returns:
+        Dictionary with head source, latest block and refresh counts per network
+    """
+    block_subscriber = sys.modules.get("app.backend.block_subscriber")
+    snapshot_cache = sys.modules.get("app.backend.snapshot_cache")
+    position_tracker = sys.modules.get("app.backend.position_tracker")
+    pool_tracker = sys.modules.get("app.backend.pool_tracker")
+    twap_service = sys.modules.get("app.backend.twap_service")
+    fee_apr = sys.modules.get("app.backend.fee_apr")
+    log_scanner = sys.modules.get("app.backend.log_scanner")
+    reorg_detector = sys.modules.get("app.backend.reorg_detector")
+    return {
+        "status": "success",
+        "subscriptions": [s.summary() for s in block_subscriber.subscribers.values()] if block_subscriber else [],
+        "snapshots": snapshot_cache.snapshot_cache.stats() if snapshot_cache else None,
+        "position_tracker": position_tracker.position_tracker.summary() if position_tracker else None,
+        "pool_tracker": pool_tracker.pool_tracker.summary() if pool_tracker else None,
+        "twap": twap_service.twap_service.summary() if twap_service else None,
+        "fee_apr": fee_apr.fee_apr_engine.summary() if fee_apr else None,
+        "log_scanner": log_scanner.scanner_summary() if log_scanner else None,
+        "reorgs": reorg_detector.reorg_detector.summary() if reorg_detector else None
+    }
+
+@app.get("/api/test/timeseries-store")
+async def test_timeseries_store():
+    """
+    Test endpoint to inspect the local CoinMetrics time-series store.
+    
+    Returns:
+        Dictionary with point counts and time range per stored series
+    """
+    from app.backend.timeseries_store import get_timeseries_store
+    return {
+        "status": "success",
+        "store": get_timeseries_store().summary()
+    }
+
+@app.get("/api/test/price-service")
+async def test_price_service():
+    """
+    Test endpoint to inspect the shared token price cache.
+    
+    Returns:
+        Dictionary with cached prices, their age, counters and the on-chain pool graph quotes
+    """
+    price_service = sys.modules.get("app.backend.price_service")
+    onchain_prices = sys.modules.get("app.backend.onchain_prices")
+    return {
+        "status": "success",
+        "prices": price_service.price_service.summary() if price_service else None,
+        "onchain": onchain_prices.onchain_price_engine.summary() if onchain_prices else None,
+        "onchain_quotes": onchain_prices.onchain_price_engine.quotes() if onchain_prices else None
+    }
+
+@app.get("/api/test/block-index")
+async def test_block_index():
+    """
+    Test endpoint to inspect the block number / timestamp index.
+    
+    Returns:
+        Dictionary with indexed block ranges per network and lookup counters
+    """
+    from app.backend.block_index import get_block_index
+    return {
+        "status": "success",
+        "index": get_block_index().summary()
+    }
+
+@app.get("/api/test/pnl")
+async def test_pnl():
+    """
+    Test endpoint to inspect the position event ledger and PnL engine.
+    
+    Returns:
+        Dictionary with ledger coverage per network and PnL counters
+    """
+    position_ledger = sys.modules.get("app.backend.position_ledger")
+    pnl_engine = sys.modules.get("app.backend.pnl_engine")
+    return {
+        "status": "success",
+        "ledger": position_ledger.get_position_ledger().summary() if position_ledger else None,
+        "pnl": pnl_engine.pnl_engine.summary() if pnl_engine else None
+    }
+
+@app.get("/api/test/snapshot-history")
+async def test_snapshot_history():
+    """
+    Test endpoint to inspect the persisted snapshot history.
+
+    Returns:
+        Dictionary with recorded snapshots per kind and recording counters
+    """
+    from app.backend.snapshot_history import get_snapshot_history
+    return {
+        "status": "success",
+        "history": get_snapshot_history().summary()
+    }
+
+@app.get("/api/test/rate-limits")
+async def test_rate_limits():
+    """
+    Test endpoint to inspect the adaptive rate limiters of each provider.
+    
+    Returns:
+        Dictionary with current rate, concurrency and throttle counts per provider
+    """
+    return {
+        "status": "success",
+        "limiters": [limiter.summary() for limiter in rate_limiter.limiters.values()]
+    }
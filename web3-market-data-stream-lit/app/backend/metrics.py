@@ -0,0 +1,153 @@
+"""
+Prometheus metrics for the backend.
+
+Exposes request latency per FastAPI route, RPC call counts/latency per
+(network, contract method), CoinMetrics call counts/latency per metric,
+eth_call cache hit ratios and the age of the latest snapshot of each kind.
+"""
+import functools
+import time
+from typing import Any, Dict, List
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HTTP_REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latency of backend HTTP requests by route",
+    ["route", "method", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+RPC_CALLS = Counter(
+    "rpc_calls_total",
+    "JSON-RPC calls sent upstream by network and contract method",
+    ["network", "method", "outcome"]
+)
+
+RPC_LATENCY = Histogram(
+    "rpc_call_duration_seconds",
+    "Latency of upstream JSON-RPC requests by network and contract method (batches as method=batch)",
+    ["network", "method"],
+    buckets=LATENCY_BUCKETS
+)
+
+COINMETRICS_CALLS = Counter(
+    "coinmetrics_calls_total",
+    "CoinMetrics API calls by metric",
+    ["metric", "outcome"]
+)
+
+COINMETRICS_LATENCY = Histogram(
+    "coinmetrics_call_duration_seconds",
+    "Latency of CoinMetrics API calls by metric",
+    ["metric"],
+    buckets=LATENCY_BUCKETS
+)
+
+
+def eth_call_cache_stats() -> Dict[str, Any]:
+    """Stats of the eth_call cache, imported on first scrape so web3 stays out of startup"""
+    from app.backend.eth_call_cache import eth_call_cache
+    return eth_call_cache.stats()
+
+
+ETH_CALL_CACHE_HIT_RATIO = Gauge("eth_call_cache_hit_ratio", "Share of eth_call lookups served from cache")
+ETH_CALL_CACHE_HIT_RATIO.set_function(lambda: eth_call_cache_stats()["hit_ratio"])
+
+
+def build_selector_names(abis: List[List[Dict[str, Any]]]) -> Dict[str, str]:
+    """Map 4-byte selectors of every function in the given ABIs to function names"""
+    from app.backend.abi_codecs import get_codecs
+    names = {}
+    for abi in abis:
+        names.update(get_codecs(abi).selector_names())
+    return names
+
+
+@functools.lru_cache(maxsize=None)
+def selector_names() -> Dict[str, str]:
+    """Function names for every selector our contracts are called with, built on first RPC call"""
+    from app.backend.contract_abis.aave_abis import ERC20_ABI
+    from app.backend.contract_abis.uniswapv3_nft_abi import uniswapv3_nft_abi
+    from app.backend.contract_abis.uniswapv3_position_calculator_minimal_abis import (
+        UNISWAP_V3_POOL_ABI,
+        UNISWAP_V3_FACTORY_ABI,
+        POSITION_MANAGER_ABI,
+        ERC721_ABI
+    )
+    return build_selector_names([
+        ERC20_ABI, uniswapv3_nft_abi, UNISWAP_V3_POOL_ABI, UNISWAP_V3_FACTORY_ABI, POSITION_MANAGER_ABI, ERC721_ABI
+    ])
+
+
+def rpc_method_label(method: str, params: Any) -> str:
+    """Label an RPC request by contract method for eth_call, by JSON-RPC method otherwise"""
+    if method != "eth_call":
+        return method
+    try:
+        data = params[0].get("data") or params[0].get("input")
+        return selector_names().get(str(data)[:10].lower(), "eth_call:unknown")
+    except (IndexError, AttributeError, TypeError):
+        return "eth_call:unknown"
+
+
+def observe_rpc_call(network: str, method: str, params: Any, latency: float, ok: bool) -> None:
+    label = rpc_method_label(method, params)
+    RPC_CALLS.labels(network, label, "success" if ok else "error").inc()
+    RPC_LATENCY.labels(network, label).observe(latency)
+
+
+def observe_rpc_batch(network: str, requests: List[Any], latency: float, ok: bool) -> None:
+    for method, params in requests:
+        RPC_CALLS.labels(network, rpc_method_label(method, params), "success" if ok else "error").inc()
+    RPC_LATENCY.labels(network, "batch").observe(latency)
+
+
+def observe_coinmetrics_call(metric: str, latency: float, ok: bool) -> None:
+    COINMETRICS_CALLS.labels(metric, "success" if ok else "error").inc()
+    COINMETRICS_LATENCY.labels(metric).observe(latency)
+
+
+# Completion time of the latest snapshot of each kind (uniswap, aave, market)
+snapshot_times: Dict[str, float] = {}
+
+
+def mark_snapshot(kind: str) -> None:
+    """Record that a fresh snapshot of `kind` has just been produced"""
+    snapshot_times[kind] = time.time()
+
+
+class SnapshotAgeCollector:
+    """Reports seconds since the latest snapshot of each kind at scrape time"""
+
+    def collect(self):
+        family = GaugeMetricFamily("snapshot_age_seconds", "Seconds since the latest snapshot", labels=["kind"])
+        now = time.time()
+        for kind, taken_at in snapshot_times.items():
+            family.add_metric([kind], now - taken_at)
+        yield family
+
+
+class EthCallCacheCollector:
+    """Reports eth_call cache counters and tier sizes at scrape time"""
+
+    def collect(self):
+        stats = eth_call_cache_stats()
+        # Exposed as eth_call_cache_lookups_total, a counter that rate() can be taken of
+        lookups = CounterMetricFamily("eth_call_cache_lookups", "eth_call cache lookups by result", labels=["result"])
+        lookups.add_metric(["hit"], stats["hits"])
+        lookups.add_metric(["permanent_hit"], stats["permanent_hits"])
+        lookups.add_metric(["history_hit"], stats["history_hits"])
+        lookups.add_metric(["miss"], stats["misses"])
+        yield lookups
+        entries = GaugeMetricFamily("eth_call_cache_entries", "eth_call cache entries by tier", labels=["tier"])
+        entries.add_metric(["block"], stats["block_entries"])
+        entries.add_metric(["permanent"], stats["permanent_entries"])
+        yield entries
+
+
+REGISTRY.register(SnapshotAgeCollector())
+REGISTRY.register(EthCallCacheCollector())
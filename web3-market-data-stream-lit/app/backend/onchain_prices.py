@@ -0,0 +1,182 @@
+"""
+USD prices derived from Uniswap V3 pool state.
+
+Every pool a position is read from contributes an edge between its two tokens,
+priced by the pool's sqrtPriceX96 (kept current by the Swap-driven pool tracker
+when it follows the pool). Prices are routed outward from USD stablecoins, and
+from any externally priced anchor tokens, over the fewest hops; among routes of
+equal length the deepest one wins, depth being the smallest in-range virtual
+reserve (in USD) along the route. No RPC or API calls are made: the graph only
+holds state the position reads already fetched.
+"""
+import os
+import threading
+import time
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from web3 import Web3
+
+# Tokens assumed to trade at 1 USD
+USD_STABLECOINS = {"USDC", "USDC.E", "USDBC", "USDT", "USDT0", "USD₮0", "DAI", "FRAX", "LUSD"}
+
+# Comma-separated symbols priced on-chain first (long-tail tokens CoinMetrics does not cover well)
+ONCHAIN_PRIMARY_SYMBOLS = {
+    symbol.strip().upper() for symbol in os.getenv("ONCHAIN_PRIMARY_SYMBOLS", "").split(",") if symbol.strip()
+}
+
+Q96 = Decimal(2 ** 96)
+
+TokenKey = Tuple[str, str]
+
+
+class OnchainPriceEngine:
+    """Token graph over observed Uniswap V3 pools, priced by routing to USD anchors."""
+
+    def __init__(self):
+        # (network, pool) -> {"token0", "token1" (address/symbol/decimals), "sqrt_price_x96", "observed_at"}
+        self.pools: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.counters = {"observed": 0, "queries": 0, "priced": 0}
+        self.lock = threading.Lock()
+
+    def observe_positions(self, network: str, positions: Iterable[Dict[str, Any]]) -> None:
+        """Record the pools (tokens and current price) of position details"""
+        with self.lock:
+            for position in positions:
+                if "error" in position or "pool" not in position:
+                    continue
+                pool = Web3.to_checksum_address(position["pool"]["address"])
+                self.pools[(network, pool)] = {
+                    "token0": self._token(position["token0"]),
+                    "token1": self._token(position["token1"]),
+                    "sqrt_price_x96": int(position["pool"]["current_sqrt_price_x96"]),
+                    "observed_at": time.time()
+                }
+                self.counters["observed"] += 1
+
+    @staticmethod
+    def _token(info: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "address": Web3.to_checksum_address(info["address"]),
+            "symbol": info["symbol"].upper(),
+            "decimals": int(info["decimals"])
+        }
+
+    def _graph(self) -> Tuple[Dict[TokenKey, List[Dict[str, Any]]], Dict[TokenKey, str]]:
+        """Adjacency list and token symbols of the pool graph, using the pool tracker's state where it is newer"""
+        # Imported here: the pool tracker is only loaded once block subscriptions start
+        from app.backend.pool_tracker import pool_tracker
+
+        edges: Dict[TokenKey, List[Dict[str, Any]]] = {}
+        symbols: Dict[TokenKey, str] = {}
+        with self.lock:
+            pools = list(self.pools.items())
+        for (network, pool), state in pools:
+            sqrt_price_x96 = state["sqrt_price_x96"]
+            liquidity = None
+            tracked = pool_tracker.pools.get((network, pool))
+            if tracked is not None:
+                sqrt_price_x96 = tracked["sqrt_price_x96"]
+                liquidity = tracked["liquidity"]
+            if not sqrt_price_x96:
+                continue
+
+            token0, token1 = state["token0"], state["token1"]
+            sqrt_price = Decimal(sqrt_price_x96) / Q96
+            # Price of one token0 in token1, in whole tokens
+            price0 = float(sqrt_price * sqrt_price * Decimal(10) ** (token0["decimals"] - token1["decimals"]))
+            # In-range virtual reserves (whole tokens); unknown liquidity counts as no depth
+            reserve0 = float(Decimal(liquidity) / sqrt_price / Decimal(10) ** token0["decimals"]) if liquidity else 0.0
+            reserve1 = float(Decimal(liquidity) * sqrt_price / Decimal(10) ** token1["decimals"]) if liquidity else 0.0
+
+            key0 = (network, token0["address"])
+            key1 = (network, token1["address"])
+            symbols[key0] = token0["symbol"]
+            symbols[key1] = token1["symbol"]
+            # rate: price of the source token in the target token; reserve: source-side reserve
+            edges.setdefault(key0, []).append({"to": key1, "rate": price0, "reserve": reserve0})
+            edges.setdefault(key1, []).append({"to": key0, "rate": 1 / price0, "reserve": reserve1})
+        return edges, symbols
+
+    def quotes(self, anchors: Optional[Dict[str, float]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Best on-chain quote per token symbol.
+
+        Args:
+            anchors: Known USD prices by symbol (e.g. from CoinMetrics); stablecoins are always anchors
+
+        Returns:
+            symbol -> {"price", "network", "route" (symbols), "depth_usd"}
+        """
+        anchors = {symbol.upper(): price for symbol, price in (anchors or {}).items() if price}
+        edges, symbols = self._graph()
+
+        # Breadth-first from every anchor: fewest hops first, deepest bottleneck among equal hops
+        best: Dict[TokenKey, Dict[str, Any]] = {}
+        frontier = []
+        for key, symbol in symbols.items():
+            price = 1.0 if symbol in USD_STABLECOINS else anchors.get(symbol)
+            if price:
+                best[key] = {"price": price, "route": [symbol], "depth_usd": float("inf"), "hops": 0}
+                frontier.append(key)
+
+        hops = 0
+        while frontier:
+            hops += 1
+            candidates: Dict[TokenKey, Dict[str, Any]] = {}
+            for key in frontier:
+                source = best[key]
+                for edge in edges.get(key, []):
+                    target = edge["to"]
+                    if target in best:
+                        continue
+                    depth = min(source["depth_usd"], edge["reserve"] * source["price"])
+                    current = candidates.get(target)
+                    if current is None or depth > current["depth_usd"]:
+                        candidates[target] = {
+                            "price": source["price"] / edge["rate"],
+                            "route": source["route"] + [symbols[target]],
+                            "depth_usd": depth,
+                            "hops": hops
+                        }
+            best.update(candidates)
+            frontier = list(candidates)
+
+        # The same symbol can be priced on several networks; keep the deepest route
+        result: Dict[str, Dict[str, Any]] = {}
+        for (network, _), quote in best.items():
+            if quote["hops"] == 0:
+                continue
+            symbol = quote["route"][-1]
+            if symbol not in result or quote["depth_usd"] > result[symbol]["depth_usd"]:
+                result[symbol] = {
+                    "price": quote["price"],
+                    "network": network,
+                    "route": list(reversed(quote["route"])),
+                    "depth_usd": quote["depth_usd"]
+                }
+        with self.lock:
+            self.counters["queries"] += 1
+            self.counters["priced"] = len(result)
+        return result
+
+    def usd_prices(self, symbols: Iterable[str], anchors: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        """On-chain USD prices of the symbols that have a route to an anchor"""
+        quotes = self.quotes(anchors)
+        return {
+            symbol: quotes[symbol.upper()]["price"]
+            for symbol in symbols if symbol.upper() in quotes
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            pools = [
+                {"network": network, "pool": pool,
+                 "pair": f"{state['token0']['symbol']}/{state['token1']['symbol']}"}
+                for (network, pool), state in self.pools.items()
+            ]
+            counters = dict(self.counters)
+        return {"pools": pools, **counters}
+
+
+onchain_price_engine = OnchainPriceEngine()
@@ -0,0 +1,230 @@
+"""
+Cost basis, PnL and impermanent loss of Uniswap V3 positions.
+
+Deposits (IncreaseLiquidity), withdrawals (DecreaseLiquidity) and collections
+(Collect) come from the position ledger and are valued at the hourly CoinMetrics
+ReferenceRate of their block's time, topped up into the local time-series store;
+the current side is valued with the price service. All positions of a network
+are computed together with pandas:
+
+* cost basis: USD value of the deposits; withdrawals release it pro rata to the
+  liquidity they remove
+* collected fees: Collect amounts beyond the principal withdrawn (the position
+  manager moves withdrawn principal to tokensOwed, so Collect pays out both)
+* realized PnL: withdrawals + collected fees - cost basis released
+* unrealized PnL: current value + uncollected fees - remaining cost basis
+* impermanent loss: current value against holding the net deposited tokens
+
+Positions with an event that has no price within PRICE_TOLERANCE get no PnL.
+"""
+import threading
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from app.backend.block_index import get_block_index
+from app.backend.coinmetrics import TIME_FORMAT, CoinMetricsService, coinmetrics_asset
+from app.backend.eth_call_cache import eth_call_cache
+from app.backend.position_ledger import get_position_ledger
+from app.backend.price_service import price_service
+from app.backend.timeseries_store import get_timeseries_store
+
+# Historical prices: hourly reference rates, each used for up to PRICE_TOLERANCE after its time
+PRICE_METRIC = "ReferenceRate"
+PRICE_FREQUENCY = "1h"
+PRICE_TOLERANCE = pd.Timedelta(hours=2)
+
+# Event and price times share one resolution so merge_asof can join them
+TIME_DTYPE = "datetime64[ns, UTC]"
+
+EVENT_COLUMNS = ["manager", "token_id", "block", "log_index", "event", "liquidity", "amount0", "amount1"]
+PNL_FIELDS = [
+    "cost_basis_usd",
+    "withdrawn_usd",
+    "fees_collected_usd",
+    "uncollected_fees_usd",
+    "value_usd",
+    "hodl_value_usd",
+    "realized_pnl_usd",
+    "unrealized_pnl_usd",
+    "total_pnl_usd",
+    "impermanent_loss_usd",
+    "impermanent_loss_pct",
+]
+
+
+class PnlEngine:
+    """Joins ledger events with historical prices and computes PnL for many positions at once."""
+
+    def __init__(self):
+        self.coinmetrics = CoinMetricsService()
+        self.counters = {"requests": 0, "positions": 0, "events": 0, "unpriced_positions": 0, "price_errors": 0}
+        self.lock = threading.Lock()
+
+    # Inputs
+
+    def _events(self, network: str, positions: List[Dict[str, Any]]) -> pd.DataFrame:
+        """Ledger events of the positions, synced to the head, in token units with their block times"""
+        block_index = get_block_index()
+        head, _ = block_index.head(network)
+        # Lets the eth_call cache persist the archive reads of mint block searches
+        eth_call_cache.set_current_block(network, head)
+
+        ledger = get_position_ledger()
+        token_ids: Dict[str, List[int]] = {}
+        decimals = {}
+        for position in positions:
+            token_ids.setdefault(position["position_manager"], []).append(position["token_id"])
+            decimals[(position["position_manager"], position["token_id"])] = (
+                10 ** position["token0"]["decimals"], 10 ** position["token1"]["decimals"]
+            )
+
+        rows = []
+        for manager, ids in token_ids.items():
+            ledger.sync(network, manager, ids, head)
+            for token_id, block, log_index, event, liquidity, amount0, amount1 in ledger.events(network, manager, ids):
+                scale0, scale1 = decimals[(manager, token_id)]
+                # Raw uint256 amounts are scaled in Python, they do not fit numpy integers
+                rows.append((manager, token_id, block, log_index, event, float(liquidity),
+                             amount0 / scale0, amount1 / scale1))
+
+        events = pd.DataFrame(rows, columns=EVENT_COLUMNS)
+        times = block_index.timestamps(network, events["block"].tolist())
+        events["time"] = pd.to_datetime(events["block"].map(times), unit="s", utc=True).astype(TIME_DTYPE)
+        return events
+
+    def _historical_prices(self, assets: List[str], start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        """(asset, time, price) rows covering [start, end], fetched into the store when missing"""
+        start_time = (start - PRICE_TOLERANCE).strftime(TIME_FORMAT)
+        # The hourly point at or before the last event is all that is needed
+        end_time = end.floor("h").strftime(TIME_FORMAT)
+        try:
+            self.coinmetrics.ensure_history(PRICE_METRIC, PRICE_FREQUENCY, assets, start_time, end_time)
+        except Exception as e:
+            print(f"Error fetching {PRICE_METRIC} history for {assets}: {e}")
+            with self.lock:
+                self.counters["price_errors"] += 1
+
+        records = get_timeseries_store().get_records(PRICE_METRIC, PRICE_FREQUENCY, assets, start_time=start_time)
+        prices = pd.DataFrame(records, columns=["asset", "time", PRICE_METRIC])
+        prices["time"] = pd.to_datetime(prices["time"], utc=True).astype(TIME_DTYPE)
+        prices["price"] = pd.to_numeric(prices[PRICE_METRIC], errors="coerce")
+        return prices.dropna(subset=["price"]).sort_values("time")[["asset", "time", "price"]]
+
+    # PnL
+
+    def add_pnl(self, network: str, positions: List[Dict[str, Any]]) -> None:
+        """Attach a "pnl" entry to each valid position of a network (None where prices are missing)"""
+        valid = [p for p in positions if "error" not in p]
+        if not valid:
+            return
+
+        current = pd.DataFrame([
+            {
+                "manager": p["position_manager"],
+                "token_id": p["token_id"],
+                "asset0": coinmetrics_asset(p["token0"]["symbol"]),
+                "asset1": coinmetrics_asset(p["token1"]["symbol"]),
+                "symbol0": p["token0"]["symbol"].upper(),
+                "symbol1": p["token1"]["symbol"].upper(),
+                "amount0": float(p["token0"]["amount"]),
+                "amount1": float(p["token1"]["amount"]),
+                "owed0": float(p["token0"]["uncollected_fees"]),
+                "owed1": float(p["token1"]["uncollected_fees"]),
+            }
+            for p in valid
+        ]).set_index(["manager", "token_id"])
+        prices_now = price_service.get_prices(set(current["symbol0"]) | set(current["symbol1"]))
+        current["price0"] = current["symbol0"].map(prices_now).astype(float)
+        current["price1"] = current["symbol1"].map(prices_now).astype(float)
+
+        events = self._events(network, valid)
+        totals = self._event_totals(events, current)
+        pnl = self._compute(current.join(totals))
+
+        records = pnl[PNL_FIELDS].astype(object).where(pnl[PNL_FIELDS].notna(), None)
+        for position in valid:
+            key = (position["position_manager"], position["token_id"])
+            position["pnl"] = {**records.loc[key].to_dict(), "events": int(pnl.at[key, "events"])}
+        with self.lock:
+            self.counters["requests"] += 1
+            self.counters["positions"] += len(valid)
+            self.counters["events"] += len(events)
+            self.counters["unpriced_positions"] += int(pnl["total_pnl_usd"].isna().sum())
+
+    def _event_totals(self, events: pd.DataFrame, current: pd.DataFrame) -> pd.DataFrame:
+        """Per position and event type: liquidity, token amounts and their USD value at event time"""
+        fields = ["liquidity", "amount0", "amount1", "usd0", "usd1"]
+        if events.empty:
+            return pd.DataFrame({"events": 0, "priced": True}, index=current.index)
+
+        events = events.join(current[["asset0", "asset1"]], on=["manager", "token_id"]).sort_values("time")
+        prices = self._historical_prices(
+            sorted(set(current["asset0"]) | set(current["asset1"])), events["time"].min(), events["time"].max()
+        )
+        for i in (0, 1):
+            events = pd.merge_asof(
+                events, prices.rename(columns={"asset": f"asset{i}", "price": f"price{i}"}),
+                on="time", by=f"asset{i}", direction="backward", tolerance=PRICE_TOLERANCE
+            )
+            # Zero amounts need no price
+            events[f"usd{i}"] = (events[f"amount{i}"] * events[f"price{i}"]).where(events[f"amount{i}"] != 0, 0.0)
+        events["priced"] = events[["usd0", "usd1"]].notna().all(axis=1)
+
+        grouped = events.groupby(["manager", "token_id"])
+        totals = events.groupby(["manager", "token_id", "event"])[fields].sum().unstack("event", fill_value=0.0)
+        totals.columns = [f"{event}_{field}" for field, event in totals.columns]
+        totals["events"] = grouped.size()
+        totals["priced"] = grouped["priced"].all()
+        return totals
+
+    @staticmethod
+    def _compute(frame: pd.DataFrame) -> pd.DataFrame:
+        """Vectorised PnL columns of a frame of current state joined with event totals"""
+        def total(event: str, field: str) -> pd.Series:
+            column = f"{event}_{field}"
+            return frame[column].fillna(0.0) if column in frame else pd.Series(0.0, index=frame.index)
+
+        frame["events"] = frame["events"].fillna(0).astype(int)
+        deposited_liquidity = total("IncreaseLiquidity", "liquidity")
+        cost_basis = total("IncreaseLiquidity", "usd0") + total("IncreaseLiquidity", "usd1")
+        released = cost_basis * total("DecreaseLiquidity", "liquidity") / deposited_liquidity.where(deposited_liquidity > 0)
+        frame["cost_basis_usd"] = cost_basis - released
+        frame["withdrawn_usd"] = total("DecreaseLiquidity", "usd0") + total("DecreaseLiquidity", "usd1")
+
+        frame["fees_collected_usd"] = 0.0
+        frame["uncollected_fees_usd"] = 0.0
+        frame["value_usd"] = 0.0
+        frame["hodl_value_usd"] = 0.0
+        for i in ("0", "1"):
+            withdrawn = total("DecreaseLiquidity", f"amount{i}")
+            collected = total("Collect", f"amount{i}")
+            fees = (collected - withdrawn).clip(lower=0)
+            # Fees are valued at the average price they were collected at
+            collect_price = total("Collect", f"usd{i}") / collected.where(collected > 0)
+            frame["fees_collected_usd"] += (fees * collect_price).fillna(0.0)
+            # Withdrawn principal not collected yet sits in tokensOwed next to the fees
+            owed_principal = (withdrawn - collected).clip(lower=0)
+            frame["uncollected_fees_usd"] += (frame[f"owed{i}"] - owed_principal).clip(lower=0) * frame[f"price{i}"]
+            frame["value_usd"] += frame[f"amount{i}"] * frame[f"price{i}"]
+            frame["hodl_value_usd"] += (total("IncreaseLiquidity", f"amount{i}") - withdrawn) * frame[f"price{i}"]
+
+        frame["realized_pnl_usd"] = frame["withdrawn_usd"] + frame["fees_collected_usd"] - released
+        frame["unrealized_pnl_usd"] = frame["value_usd"] + frame["uncollected_fees_usd"] - frame["cost_basis_usd"]
+        frame["total_pnl_usd"] = frame["realized_pnl_usd"] + frame["unrealized_pnl_usd"]
+        frame["impermanent_loss_usd"] = frame["value_usd"] - frame["hodl_value_usd"]
+        frame["impermanent_loss_pct"] = (
+            frame["impermanent_loss_usd"] / frame["hodl_value_usd"].where(frame["hodl_value_usd"] > 0) * 100
+        )
+
+        # Positions with unpriced events (or no deposits on record) get no PnL
+        unpriced = ~frame["priced"].fillna(False).astype(bool) | deposited_liquidity.eq(0)
+        frame.loc[unpriced, PNL_FIELDS] = float("nan")
+        return frame
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            return dict(self.counters)
+
+
+pnl_engine = PnlEngine()
@@ -0,0 +1,172 @@
+"""
+Swap-event-driven Uniswap V3 pool state.
+
+Every pool a tracked position lives in is read once (slot0 and liquidity), then
+kept current from its own events: Swap carries the new sqrtPriceX96, tick and
+in-range liquidity, and Mint/Burn inside the current tick range add or remove
+in-range liquidity. Prices are therefore current at every block without
+polling slot0 per position or per refresh. After a reorg the pools of the
+network are simply re-read: that is one batch, cheaper than journaling every
+swap to undo it. Pools whose read fails are dropped and read again on the next
+block, so they are never served from state the reorg orphaned.
+"""
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from web3 import Web3
+
+from app.backend.abi_codecs import get_codecs
+from app.backend.block_subscriber import is_current
+from app.backend.contract_abis.uniswapv3_position_calculator_minimal_abis import UNISWAP_V3_POOL_ABI
+from app.backend.log_scanner import LogScanner
+from app.backend.rpc_batch import RPCBatch
+from app.backend.web3_provider import get_web3_instance
+
+# Events that move a pool's price or in-range liquidity
+POOL_EVENTS = ["Swap", "Mint", "Burn"]
+
+# Beyond this many blocks behind, re-reading the pools is cheaper than scanning logs
+MAX_LOG_RANGE = 2_000
+
+PoolKey = Tuple[str, str]
+
+
+class PoolTracker:
+    """sqrtPriceX96, tick and in-range liquidity per pool, advanced block by block from pool events."""
+
+    def __init__(self):
+        self.codecs = get_codecs(UNISWAP_V3_POOL_ABI)
+        self.event_topics = [self.codecs.event(name).topic for name in POOL_EVENTS]
+        # (network, pool) -> {"sqrt_price_x96", "tick", "liquidity", "block"}
+        self.pools: Dict[PoolKey, Dict[str, int]] = {}
+        self.synced_blocks: Dict[str, int] = {}
+        # Pools whose last read failed, read again on the next block
+        self.unread: Set[PoolKey] = set()
+        self.counters = {"blocks": 0, "swaps": 0, "mints": 0, "burns": 0, "pool_reads": 0, "read_errors": 0}
+        self.lock = threading.RLock()
+
+    def track_pools(self, network: str, pools: Iterable[str]) -> None:
+        """Start following pools that are not tracked yet, reading their state once"""
+        with self.lock:
+            new_pools = sorted({Web3.to_checksum_address(p) for p in pools} - {p for n, p in self.pools if n == network})
+            if new_pools:
+                self._read_pools(network, new_pools)
+
+    def _read_pools(self, network: str, pools: List[str]) -> None:
+        """
+        Read slot0 and liquidity of pools pinned to one block, in a single batch.
+        Pools that cannot be read are dropped (any older state of theirs may be
+        orphaned) and queued for another read on the next block.
+        """
+        try:
+            web3 = get_web3_instance(network)
+            block_number = web3.eth.block_number
+            with RPCBatch(web3, block_identifier=block_number) as batch:
+                calls = [
+                    (pool, batch.fast_call(pool, UNISWAP_V3_POOL_ABI, "slot0"),
+                     batch.fast_call(pool, UNISWAP_V3_POOL_ABI, "liquidity"))
+                    for pool in pools
+                ]
+        except Exception as e:
+            print(f"Error reading {len(pools)} pools on {network}: {e}")
+            for pool in pools:
+                self.pools.pop((network, pool), None)
+                self.unread.add((network, pool))
+            self.counters["read_errors"] += len(pools)
+            return
+
+        for pool, slot0_call, liquidity_call in calls:
+            try:
+                slot0 = slot0_call.result()
+                self.pools[(network, pool)] = {
+                    "sqrt_price_x96": slot0[0],
+                    "tick": slot0[1],
+                    "liquidity": liquidity_call.result(),
+                    "block": block_number
+                }
+                self.unread.discard((network, pool))
+            except Exception as e:
+                print(f"Error reading pool {pool} on {network}: {e}")
+                self.pools.pop((network, pool), None)
+                self.unread.add((network, pool))
+                self.counters["read_errors"] += 1
+        self.counters["pool_reads"] += len(pools)
+        self.synced_blocks[network] = min(self.synced_blocks.get(network, block_number), block_number)
+
+    def on_block(self, network: str, block_number: int) -> None:
+        """Apply Swap/Mint/Burn events of the tracked pools up to block_number"""
+        with self.lock:
+            retry = sorted(pool for n, pool in self.unread if n == network)
+            if retry:
+                self._read_pools(network, retry)
+            synced = self.synced_blocks.get(network)
+            if synced is None or block_number <= synced:
+                return
+            pools = [pool for n, pool in self.pools if n == network]
+            if block_number - synced > MAX_LOG_RANGE:
+                print(f"Pool tracker on {network} is {block_number - synced} blocks behind, re-reading pools")
+                self.synced_blocks.pop(network)
+                self._read_pools(network, pools)
+                return
+
+            logs = LogScanner(network, pools, [self.event_topics]).scan(synced + 1, block_number) if pools else []
+            for log in logs:
+                self._apply_log(network, log)
+
+            for pool in pools:
+                state = self.pools[(network, pool)]
+                state["block"] = max(state["block"], block_number)
+            self.synced_blocks[network] = block_number
+            self.counters["blocks"] += 1
+
+    def rollback(self, network: str, block_number: int) -> None:
+        """Discard state derived from blocks after block_number (orphaned by a reorg) by re-reading the pools"""
+        with self.lock:
+            synced = self.synced_blocks.get(network)
+            if synced is None or block_number >= synced:
+                return
+            pools = [pool for n, pool in self.pools if n == network]
+            self.synced_blocks.pop(network)
+            self._read_pools(network, pools)
+
+    def _apply_log(self, network: str, log: Dict[str, Any]) -> None:
+        state = self.pools.get((network, Web3.to_checksum_address(log["address"])))
+        # Pools read after this log's block already include it
+        if state is None or int(log["blockNumber"], 16) <= state["block"]:
+            return
+        decoded = self.codecs.decode_log(log)
+        if decoded is None:
+            return
+        event, args = decoded
+
+        if event == "Swap":
+            state["sqrt_price_x96"] = args["sqrtPriceX96"]
+            state["tick"] = args["tick"]
+            state["liquidity"] = args["liquidity"]
+            self.counters["swaps"] += 1
+        elif args["tickLower"] <= state["tick"] < args["tickUpper"]:
+            # Mint/Burn only change in-range liquidity when the range spans the current tick
+            delta = args["amount"] if event == "Mint" else -args["amount"]
+            state["liquidity"] = max(0, state["liquidity"] + delta)
+            self.counters["mints" if event == "Mint" else "burns"] += 1
+
+    def current_price(self, network: str, pool: str) -> Optional[Tuple[int, int]]:
+        """(sqrtPriceX96, tick) of a tracked pool if the tracker's block is current, else None"""
+        with self.lock:
+            state = self.pools.get((network, Web3.to_checksum_address(pool)))
+            synced = self.synced_blocks.get(network)
+            if state is None or synced is None or not is_current({network: synced}):
+                return None
+            return state["sqrt_price_x96"], state["tick"]
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "pools": len(self.pools),
+                "synced_blocks": dict(self.synced_blocks),
+                "unread": len(self.unread),
+                **self.counters
+            }
+
+
+pool_tracker = PoolTracker()
@@ -0,0 +1,234 @@
+"""
+Local ledger of Uniswap V3 position liquidity events.
+
+Cost basis and PnL need every IncreaseLiquidity, DecreaseLiquidity and Collect
+of a position since it was minted. PositionLedger scans them once with the log
+scanner, filtered by token ID, and keeps them in SQLite together with the block
+each position is synced to; later syncs only scan the blocks after that. The
+mint block is found by bisecting on positions(), which reverts before the mint,
+on the archive node; token IDs are minted in order, so the mint blocks already
+known for lower and higher IDs bound the search.
+"""
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.backend.abi_codecs import get_codecs
+from app.backend.contract_abis.uniswapv3_position_calculator_minimal_abis import POSITION_MANAGER_ABI
+from app.backend.contract_registry import fast_call
+from app.backend.log_scanner import LogScanner
+
+# POSITION_LEDGER_DB_PATH overrides the location of the ledger
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                               "data", "position_ledger.sqlite")
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS events (
+        network TEXT NOT NULL,
+        manager TEXT NOT NULL,
+        token_id INTEGER NOT NULL,
+        block INTEGER NOT NULL,
+        log_index INTEGER NOT NULL,
+        event TEXT NOT NULL,
+        liquidity TEXT NOT NULL,
+        amount0 TEXT NOT NULL,
+        amount1 TEXT NOT NULL,
+        PRIMARY KEY (network, manager, token_id, block, log_index)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS positions (
+        network TEXT NOT NULL,
+        manager TEXT NOT NULL,
+        token_id INTEGER NOT NULL,
+        mint_block INTEGER NOT NULL,
+        synced_block INTEGER NOT NULL,
+        PRIMARY KEY (network, manager, token_id)
+    ) WITHOUT ROWID
+    """,
+]
+
+# Events that move liquidity or tokens in or out of a position
+LEDGER_EVENTS = ["IncreaseLiquidity", "DecreaseLiquidity", "Collect"]
+
+# Error fragments of a positions() call on a token ID that is not minted yet
+NOT_MINTED_FRAGMENTS = ["revert", "invalid token id", "only got 0 bytes"]
+
+# (token_id, block, log_index, event, liquidity, amount0, amount1), amounts in raw token units
+LedgerEvent = Tuple[int, int, int, str, int, int, int]
+
+
+def token_topic(token_id: int) -> str:
+    """Indexed tokenId topic of a position event"""
+    return "0x" + token_id.to_bytes(32, "big").hex()
+
+
+class PositionLedger:
+    """Liquidity events per (network, position manager, token ID), synced incrementally."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("POSITION_LEDGER_DB_PATH", DEFAULT_DB_PATH)
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+        self.codecs = get_codecs(POSITION_MANAGER_ABI)
+        self.event_topics = [self.codecs.event(name).topic for name in LEDGER_EVENTS]
+        self.counters = {"syncs": 0, "scans": 0, "events": 0, "mint_searches": 0, "mint_probes": 0}
+        self.lock = threading.Lock()
+        # Serialises syncs so concurrent requests do not scan the same range twice
+        self.sync_lock = threading.Lock()
+
+    # Mint blocks
+
+    def _is_minted(self, network: str, manager: str, token_id: int, block: int) -> bool:
+        self.counters["mint_probes"] += 1
+        try:
+            fast_call(network, manager, POSITION_MANAGER_ABI, "positions", token_id, block_identifier=block)
+            return True
+        except Exception as e:
+            if any(fragment in str(e).lower() for fragment in NOT_MINTED_FRAGMENTS):
+                return False
+            raise
+
+    def _mint_block(self, network: str, manager: str, token_id: int, head: int) -> int:
+        """First block at which a token ID exists"""
+        with self.lock:
+            low, high = self.connection.execute(
+                "SELECT (SELECT MAX(mint_block) FROM positions WHERE network = ? AND manager = ? AND token_id < ?), "
+                "(SELECT MIN(mint_block) FROM positions WHERE network = ? AND manager = ? AND token_id > ?)",
+                (network, manager, token_id, network, manager, token_id)
+            ).fetchone()
+        low, high = low or 0, min(high if high is not None else head, head)
+        self.counters["mint_searches"] += 1
+        while low < high:
+            middle = (low + high) // 2
+            if self._is_minted(network, manager, token_id, middle):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    # Sync
+
+    def sync(self, network: str, manager: str, token_ids: Iterable[int], head: int) -> None:
+        """Bring the events of some positions up to `head`, scanning only blocks not synced yet"""
+        token_ids = sorted(set(token_ids))
+        if not token_ids:
+            return
+        with self.sync_lock:
+            self.counters["syncs"] += 1
+            synced = self._synced_blocks(network, manager, token_ids)
+            for token_id in token_ids:
+                if token_id not in synced:
+                    mint_block = self._mint_block(network, manager, token_id, head)
+                    synced[token_id] = mint_block - 1
+                    with self.lock:
+                        self.connection.execute(
+                            "INSERT OR REPLACE INTO positions VALUES (?, ?, ?, ?, ?)",
+                            (network, manager, token_id, mint_block, mint_block - 1)
+                        )
+                        self.connection.commit()
+
+            behind = [token_id for token_id in token_ids if synced[token_id] < head]
+            if not behind:
+                return
+            from_block = min(synced[token_id] for token_id in behind) + 1
+            topics = [self.event_topics, [token_topic(token_id) for token_id in behind]]
+            rows = []
+            for log in LogScanner(network, manager, topics, self.codecs).scan(from_block, head):
+                args = log["args"]
+                block = int(log["blockNumber"], 16)
+                # Positions synced further than the scan start already have these events
+                if args["tokenId"] not in synced or block <= synced[args["tokenId"]]:
+                    continue
+                rows.append((
+                    network, manager, args["tokenId"], block, int(log["logIndex"], 16), log["event"],
+                    str(args.get("liquidity", 0)), str(args["amount0"]), str(args["amount1"])
+                ))
+
+            with self.lock:
+                self.connection.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self.connection.executemany(
+                    "UPDATE positions SET synced_block = ? WHERE network = ? AND manager = ? AND token_id = ?",
+                    [(head, network, manager, token_id) for token_id in behind]
+                )
+                self.connection.commit()
+                self.counters["scans"] += 1
+                self.counters["events"] += len(rows)
+
+    def _synced_blocks(self, network: str, manager: str, token_ids: List[int]) -> Dict[int, int]:
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT token_id, synced_block FROM positions WHERE network = ? AND manager = ? "
+                f"AND token_id IN ({','.join('?' * len(token_ids))})",
+                [network, manager, *token_ids]
+            ).fetchall()
+        return dict(rows)
+
+    # Reads
+
+    def events(self, network: str, manager: str, token_ids: Iterable[int]) -> List[LedgerEvent]:
+        """Stored events of some positions in (token ID, block, log index) order"""
+        token_ids = sorted(set(token_ids))
+        if not token_ids:
+            return []
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT token_id, block, log_index, event, liquidity, amount0, amount1 FROM events "
+                f"WHERE network = ? AND manager = ? AND token_id IN ({','.join('?' * len(token_ids))}) "
+                f"ORDER BY token_id, block, log_index",
+                [network, manager, *token_ids]
+            ).fetchall()
+        return [
+            (token_id, block, log_index, event, int(liquidity), int(amount0), int(amount1))
+            for token_id, block, log_index, event, liquidity, amount0, amount1 in rows
+        ]
+
+    # Reorgs
+
+    def invalidate_after(self, network: str, block_number: int) -> None:
+        """Drop events after block_number (orphaned by a reorg) and rewind the positions synced past it"""
+        with self.lock:
+            self.connection.execute("DELETE FROM events WHERE network = ? AND block > ?", (network, block_number))
+            self.connection.execute("DELETE FROM positions WHERE network = ? AND mint_block > ?", (network, block_number))
+            self.connection.execute(
+                "UPDATE positions SET synced_block = ? WHERE network = ? AND synced_block > ?",
+                (block_number, network, block_number)
+            )
+            self.connection.commit()
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT p.network, COUNT(DISTINCT p.manager || ':' || p.token_id), MIN(p.synced_block), "
+                "(SELECT COUNT(*) FROM events e WHERE e.network = p.network) FROM positions p GROUP BY p.network"
+            ).fetchall()
+            counters = dict(self.counters)
+        return {
+            "path": self.path,
+            "networks": [
+                {"network": network, "positions": positions, "min_synced_block": synced, "events": events}
+                for network, positions, synced, events in rows
+            ],
+            **counters
+        }
+
+
+_ledger: Optional[PositionLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_position_ledger() -> PositionLedger:
+    """Process-wide ledger, opened on first use"""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = PositionLedger()
+        return _ledger
@@ -0,0 +1,353 @@
+"""
+Event-driven incremental Uniswap V3 position state.
+
+A position's liquidity and owed fees only change through IncreaseLiquidity,
+DecreaseLiquidity and Collect events of its token ID, and its owner only
+through Transfer. PositionTracker reads every tracked position once, then on
+each new block fetches the events of the tracked token IDs and the Transfers
+from or to tracked wallets from the position managers, re-reads only
+the positions they touch and picks up minted/transferred token IDs of tracked
+wallets. Pool prices come from the Swap-driven PoolTracker and are applied
+locally to the cached position state, so per-block cost follows activity, not
+portfolio size.
+
+Each update with position events journals the state from before the blocks it
+covers, for the last REORG_WINDOW blocks, so a reorg is undone by restoring the
+state from before the first update that reached past the last common block and
+replaying events from there instead of re-reading everything.
+"""
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from web3 import Web3
+
+from app.backend.abi_codecs import get_codecs
+from app.backend.block_subscriber import is_current
+from app.backend.consts import UNISWAP_V3_POSITIONS_NFT_IDS
+from app.backend.contract_abis.uniswapv3_position_calculator_minimal_abis import POSITION_MANAGER_ABI
+from app.backend.log_scanner import LogScanner
+from app.backend.pool_tracker import pool_tracker
+from app.backend.position_ledger import token_topic
+from app.backend.reorg_detector import REORG_WINDOW
+from app.backend.web3_provider import get_web3_instance
+from app.backend.web3_uniswap_position_calculator import (
+    build_position_details,
+    get_token_ids,
+    read_position
+)
+
+# Events that change a position (indexed by tokenId)
+POSITION_EVENTS = ["IncreaseLiquidity", "DecreaseLiquidity", "Collect"]
+
+# Beyond this many blocks behind, a full re-read is cheaper than scanning logs
+MAX_LOG_RANGE = 2_000
+
+PositionKey = Tuple[str, str, int]
+
+
+def position_manager_addresses(wallet_info: Dict[str, Any]) -> List[str]:
+    """Checksummed position manager addresses of a wallet's configured NFT IDs"""
+    return [
+        Web3.to_checksum_address(UNISWAP_V3_POSITIONS_NFT_IDS[nft_id]["address"])
+        for nft_id in wallet_info["nft_ids"]
+        if nft_id in UNISWAP_V3_POSITIONS_NFT_IDS
+    ]
+
+
+def wallet_key(wallet_info: Dict[str, Any]) -> str:
+    return f"{wallet_info['network']}:{wallet_info['address'].lower()}"
+
+
+def address_topic(address: str) -> str:
+    """Indexed address topic of an event (Transfer from/to)"""
+    return "0x" + address.lower()[2:].rjust(64, "0")
+
+
+class PositionTracker:
+    """Cached position and pool state per network, advanced block by block from position manager events."""
+
+    def __init__(self):
+        self.codecs = get_codecs(POSITION_MANAGER_ABI)
+        self.event_topics = [self.codecs.event(name).topic for name in POSITION_EVENTS]
+        self.transfer_topic = self.codecs.event("Transfer").topic
+        # Tracked wallets: wallet key -> {"wallet_info", "token_ids": {manager: {token_id: None}}}
+        self.wallets: Dict[str, Dict[str, Any]] = {}
+        self.positions: Dict[PositionKey, Dict[str, Any]] = {}
+        self.synced_blocks: Dict[str, int] = {}
+        # network -> {"since": oldest block rollbacks can reach,
+        #             "entries": {first block of an update: {"to": its last block, "state": state before it}}}
+        self.journals: Dict[str, Dict[str, Any]] = {}
+        self.counters = {"blocks": 0, "logs": 0, "positions_reread": 0, "full_syncs": 0, "rollbacks": 0}
+        self.lock = threading.RLock()
+
+    # Wallet tracking
+
+    def track_wallet(self, wallet_info: Dict[str, Any]) -> None:
+        """Start tracking a wallet, reading all of its positions once"""
+        network = wallet_info["network"]
+        # Logs are scanned from the block before the reads, so nothing in between is missed
+        start_block = get_web3_instance(network).eth.block_number
+        token_ids = {}
+        for manager in position_manager_addresses(wallet_info):
+            token_ids[manager] = {token_id: None for token_id in get_token_ids(wallet_info["address"], manager, network)}
+
+        states = {
+            (network, manager, token_id): self._read_position(network, manager, token_id)
+            for manager, ids in token_ids.items() for token_id in ids
+        }
+
+        with self.lock:
+            self.wallets[wallet_key(wallet_info)] = {"wallet_info": wallet_info, "token_ids": token_ids}
+            self.positions.update(states)
+            self.counters["positions_reread"] += len(states)
+            self.synced_blocks[network] = min(self.synced_blocks.get(network, start_block), start_block)
+            self.journals[network] = {"since": self.synced_blocks[network], "entries": {}}
+            self.counters["full_syncs"] += 1
+        self._track_pools(network)
+
+    def resync(self, network: str) -> None:
+        """Re-read every tracked wallet of a network from scratch"""
+        with self.lock:
+            wallets = [w["wallet_info"] for w in self.wallets.values() if w["wallet_info"]["network"] == network]
+            self.synced_blocks.pop(network, None)
+        for wallet_info in wallets:
+            self.track_wallet(wallet_info)
+
+    def _wallets_on(self, network: str) -> Dict[str, Dict[str, Any]]:
+        """Tracked wallets of a network by lowercase address"""
+        return {
+            w["wallet_info"]["address"].lower(): w
+            for w in self.wallets.values() if w["wallet_info"]["network"] == network
+        }
+
+    # Per-block updates
+
+    def on_block(self, network: str, block_number: int) -> None:
+        """
+        Apply pool and position manager events up to block_number.
+
+        Logs are fetched and touched positions re-read without holding the lock,
+        so readers are not blocked on RPCs; the results are applied in one step
+        unless the network was resynced or rolled back in the meantime.
+        """
+        pool_tracker.on_block(network, block_number)
+        with self.lock:
+            synced = self.synced_blocks.get(network)
+            if synced is None or block_number <= synced:
+                return
+            # What the log filters need, copied so the scan can run without the lock
+            wallets = self._wallets_on(network)
+            addresses = set(wallets)
+            token_ids: Dict[str, Set[int]] = {}
+            for w in wallets.values():
+                for manager, ids in w["token_ids"].items():
+                    token_ids.setdefault(manager, set()).update(ids)
+
+        if block_number - synced > MAX_LOG_RANGE:
+            print(f"Position tracker on {network} is {block_number - synced} blocks behind, resyncing")
+            self.resync(network)
+            return
+
+        logs = self._fetch_logs(network, token_ids, addresses, synced + 1, block_number)
+        states = {key: self._read_position(*key) for key in self._touched(network, addresses, logs)}
+
+        with self.lock:
+            wallets = self._wallets_on(network)
+            # A resync, rollback or newly tracked wallet in the meantime invalidates the scan
+            if self.synced_blocks.get(network) != synced or set(wallets) != addresses:
+                return
+            if logs:
+                self._journal(network, synced + 1, block_number)
+            affected: Set[PositionKey] = set()
+            for log in logs:
+                affected |= self._apply_log(network, wallets, log)
+
+            for key in affected:
+                self.positions[key] = states[key]
+            self.counters["positions_reread"] += len(affected)
+            self.counters["logs"] += len(logs)
+            self.synced_blocks[network] = block_number
+            self.counters["blocks"] += 1
+        if affected:
+            self._track_pools(network)
+
+    # Reorgs
+
+    def _network_state(self, network: str) -> Dict[str, Any]:
+        """Copy of the positions and token ownership of a network (position states are replaced, never mutated)"""
+        return {
+            "positions": {key: state for key, state in self.positions.items() if key[0] == network},
+            "token_ids": {
+                key: {manager: dict(ids) for manager, ids in w["token_ids"].items()}
+                for key, w in self.wallets.items() if w["wallet_info"]["network"] == network
+            }
+        }
+
+    def _journal(self, network: str, from_block: int, to_block: int) -> None:
+        """Remember the state before an update covering from_block..to_block, forgetting blocks older than REORG_WINDOW"""
+        journal = self.journals.setdefault(network, {"since": self.synced_blocks[network], "entries": {}})
+        journal["entries"][from_block] = {"to": to_block, "state": self._network_state(network)}
+        oldest = to_block - REORG_WINDOW
+        if journal["since"] < oldest:
+            # Restoring an entry rewinds to the block before it, so entries starting too far back are
+            # dropped, and forks inside the ranges they covered can no longer be rolled back
+            dropped = [entry["to"] for b, entry in journal["entries"].items() if b - 1 < oldest]
+            journal["entries"] = {b: entry for b, entry in journal["entries"].items() if b - 1 >= oldest}
+            journal["since"] = max([oldest, *dropped])
+
+    def rollback(self, network: str, block_number: int) -> None:
+        """
+        Undo everything derived from blocks after block_number (orphaned by a
+        reorg); the next on_block() replays the canonical events from there.
+        Reorgs deeper than the journal resync the network.
+        """
+        pool_tracker.rollback(network, block_number)
+        with self.lock:
+            synced = self.synced_blocks.get(network)
+            if synced is None or block_number >= synced:
+                return
+            journal = self.journals.get(network)
+            too_deep = journal is None or block_number < journal["since"]
+            if not too_deep:
+                # Updates reaching past the fork are undone from the state before the first of them;
+                # it may start before the fork, so replay resumes from the block that state belongs to
+                changed = sorted(b for b, entry in journal["entries"].items() if entry["to"] > block_number)
+                resume_from = block_number
+                if changed:
+                    state = journal["entries"][changed[0]]["state"]
+                    for key in [key for key in self.positions if key[0] == network]:
+                        self.positions.pop(key)
+                    self.positions.update(state["positions"])
+                    for key, token_ids in state["token_ids"].items():
+                        if key in self.wallets:
+                            self.wallets[key]["token_ids"] = {manager: dict(ids) for manager, ids in token_ids.items()}
+                    for b in changed:
+                        journal["entries"].pop(b)
+                    resume_from = min(block_number, changed[0] - 1)
+                self.synced_blocks[network] = resume_from
+                self.counters["rollbacks"] += 1
+        if too_deep:
+            print(f"Reorg on {network} is deeper than the position journal, resyncing")
+            self.resync(network)
+
+    def _fetch_logs(
+        self,
+        network: str,
+        token_ids: Dict[str, Set[int]],
+        addresses: Set[str],
+        from_block: int,
+        to_block: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Position events of the tracked token IDs (per position manager) and
+        Transfers from or to the tracked wallet addresses, in (block, log index)
+        order; the rest of the position managers' traffic is filtered out by the node.
+        """
+        managers = sorted(token_ids)
+        if not managers:
+            return []
+        token_topics = sorted({token_topic(token_id) for ids in token_ids.values() for token_id in ids})
+        wallet_topics = [address_topic(address) for address in sorted(addresses)]
+        queries = [[self.transfer_topic, wallet_topics], [self.transfer_topic, None, wallet_topics]]
+        if token_topics:
+            queries.append([self.event_topics, token_topics])
+
+        # Transfers between two tracked wallets match both Transfer queries
+        logs: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        for topics in queries:
+            for log in LogScanner(network, managers, topics).scan(from_block, to_block):
+                logs[(int(log["blockNumber"], 16), int(log["logIndex"], 16))] = log
+        return [logs[position] for position in sorted(logs)]
+
+    def _touched(self, network: str, addresses: Set[str], logs: List[Dict[str, Any]]) -> Set[PositionKey]:
+        """Positions the logs may touch: every position event, and Transfers to tracked wallets"""
+        touched = set()
+        for log in logs:
+            decoded = self.codecs.decode_log(log)
+            if decoded is None:
+                continue
+            event, args = decoded
+            if event != "Transfer" or args["to"].lower() in addresses:
+                touched.add((network, Web3.to_checksum_address(log["address"]), args["tokenId"]))
+        return touched
+
+    def _apply_log(self, network: str, wallets: Dict[str, Dict[str, Any]], log: Dict[str, Any]) -> Set[PositionKey]:
+        """Update token ownership from a log; return the tracked positions it touches"""
+        decoded = self.codecs.decode_log(log)
+        if decoded is None:
+            return set()
+        event, args = decoded
+        manager = Web3.to_checksum_address(log["address"])
+        key = (network, manager, args["tokenId"])
+
+        if event != "Transfer":
+            return {key} if key in self.positions else set()
+
+        # Minted to / transferred between / away from tracked wallets
+        touched = set()
+        sender = wallets.get(args["from"].lower())
+        if sender is not None and manager in sender["token_ids"]:
+            sender["token_ids"][manager].pop(args["tokenId"], None)
+            self.positions.pop(key, None)
+        receiver = wallets.get(args["to"].lower())
+        if receiver is not None and manager in receiver["token_ids"]:
+            receiver["token_ids"][manager][args["tokenId"]] = None
+            touched.add(key)
+        return touched
+
+    def _read_position(self, network: str, manager: str, token_id: int) -> Dict[str, Any]:
+        """Position state read from the chain, or an error entry (called without the lock)"""
+        try:
+            return read_position(token_id, manager, network)
+        except Exception as e:
+            return {"error": f"Error calculating position details for token ID {token_id}: {str(e)}"}
+
+    def _track_pools(self, network: str) -> None:
+        """Have the pool tracker follow every pool with a tracked position on a network (reads new pools, call without the lock)"""
+        with self.lock:
+            pools = {
+                state["pool_address"] for (net, _, _), state in self.positions.items()
+                if net == network and "pool_address" in state
+            }
+        pool_tracker.track_pools(network, pools)
+
+    # Reads
+
+    def wallet_positions(self, wallet_info: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Position details of a tracked wallet valued at the cached pool prices.
+
+        Returns None when the wallet is not tracked or the tracker's block is no
+        longer current, so callers fall back to reading positions directly.
+        """
+        network = wallet_info["network"]
+        with self.lock:
+            tracked = self.wallets.get(wallet_key(wallet_info))
+            synced = self.synced_blocks.get(network)
+            if tracked is None or synced is None or not is_current({network: synced}):
+                return None
+
+            positions = []
+            for manager, token_ids in tracked["token_ids"].items():
+                for token_id in token_ids:
+                    state = self.positions.get((network, manager, token_id))
+                    if state is None or "error" in state:
+                        positions.append(state or {"error": f"Position {token_id} not loaded"})
+                        continue
+                    price = pool_tracker.current_price(network, state["pool_address"])
+                    if price is None:
+                        return None
+                    positions.append(build_position_details(state, *price))
+            return positions
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "wallets": len(self.wallets),
+                "positions": len(self.positions),
+                "synced_blocks": dict(self.synced_blocks),
+                **self.counters
+            }
+
+
+position_tracker = PositionTracker()
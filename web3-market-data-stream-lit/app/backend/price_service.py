@@ -0,0 +1,160 @@
+"""
+Shared token price oracle.
+
+Pages and reports ask the backend for prices instead of querying CoinMetrics
+themselves. Prices are cached per symbol for PRICE_TTL seconds, and concurrent
+requests for the same symbols wait on the one CoinMetrics query already in
+flight, so any number of pages, reruns and reports cost at most one batched
+query per symbol set per TTL. Symbols CoinMetrics does not know (left out of
+the response with ignore_unsupported_errors), and symbols whose query failed,
+are cached as missing for the same TTL. Waiting on a query in flight is
+bounded by FETCH_TIMEOUT, after which the symbol is treated like a failed query.
+
+Symbols CoinMetrics cannot price (or the whole query when it fails) fall back
+to prices routed through the Uniswap pools already read, and symbols listed in
+ONCHAIN_PRIMARY_SYMBOLS are priced on-chain first, so valuations never stall on
+a missing external price.
+"""
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.backend.coinmetrics import REQUEST_TIMEOUT, CoinMetricsService
+from app.backend.onchain_prices import ONCHAIN_PRIMARY_SYMBOLS, onchain_price_engine
+
+# Seconds a fetched price is served before CoinMetrics is asked again
+PRICE_TTL = 1.0
+
+# Cached CoinMetrics prices younger than this anchor on-chain routes
+ANCHOR_MAX_AGE = 60.0
+
+# Seconds a request waits on a CoinMetrics query in flight before falling back on-chain
+FETCH_TIMEOUT = 2 * REQUEST_TIMEOUT
+
+
+class PriceService:
+    """Latest USD price per token symbol with TTL caching and request coalescing."""
+
+    def __init__(self, ttl: float = PRICE_TTL):
+        self.ttl = ttl
+        self.coinmetrics = CoinMetricsService()
+        # symbol -> (price or None when unknown, fetched_at)
+        self.prices: Dict[str, Tuple[Optional[float], float]] = {}
+        # symbol -> time its last CoinMetrics query failed
+        self.failures: Dict[str, float] = {}
+        # symbol -> future of the query currently fetching it
+        self.in_flight: Dict[str, Future] = {}
+        # symbol -> on-chain price last served in place of a CoinMetrics one
+        self.onchain_prices: Dict[str, float] = {}
+        self.counters = {"requests": 0, "hits": 0, "coalesced": 0, "fetches": 0, "errors": 0, "onchain": 0}
+        self.lock = threading.Lock()
+
+    def get_prices(self, symbols: Iterable[str]) -> Dict[str, Optional[float]]:
+        """Price per requested symbol (upper-cased); None for symbols without a price"""
+        symbols = sorted({symbol.upper() for symbol in symbols if symbol})
+        # Long-tail tokens configured as on-chain first skip CoinMetrics when a route exists
+        result: Dict[str, Optional[float]] = self._onchain([s for s in symbols if s in ONCHAIN_PRIMARY_SYMBOLS])
+        symbols = [symbol for symbol in symbols if symbol not in result]
+        waiting: Dict[str, Future] = {}
+        to_fetch: List[str] = []
+        now = time.time()
+
+        with self.lock:
+            self.counters["requests"] += 1
+            for symbol in symbols:
+                cached = self.prices.get(symbol)
+                if cached is not None and now - cached[1] < self.ttl:
+                    result[symbol] = cached[0]
+                    self.counters["hits"] += 1
+                elif now - self.failures.get(symbol, 0.0) < self.ttl:
+                    result[symbol] = None
+                    self.counters["hits"] += 1
+                elif symbol in self.in_flight:
+                    waiting[symbol] = self.in_flight[symbol]
+                    self.counters["coalesced"] += 1
+                else:
+                    to_fetch.append(symbol)
+            if to_fetch:
+                future: Future = Future()
+                for symbol in to_fetch:
+                    self.in_flight[symbol] = future
+                    waiting[symbol] = future
+
+        if to_fetch:
+            self._fetch(to_fetch, future)
+
+        for symbol, pending in waiting.items():
+            try:
+                result[symbol] = pending.result(timeout=FETCH_TIMEOUT).get(symbol)
+            except Exception as e:
+                print(f"Error fetching price for {symbol}: {e}")
+                result[symbol] = None
+
+        missing = [symbol for symbol, price in result.items() if price is None]
+        if missing:
+            result.update(self._onchain(missing, result))
+        return result
+
+    def _onchain(self, symbols: List[str], known: Optional[Dict[str, Optional[float]]] = None) -> Dict[str, float]:
+        """On-chain prices of symbols, anchored on stablecoins and recent CoinMetrics prices"""
+        if not symbols:
+            return {}
+        now = time.time()
+        with self.lock:
+            anchors = {
+                symbol: price for symbol, (price, fetched_at) in self.prices.items()
+                if price is not None and now - fetched_at < ANCHOR_MAX_AGE
+            }
+        anchors.update({symbol: price for symbol, price in (known or {}).items() if price is not None})
+        try:
+            prices = onchain_price_engine.usd_prices(symbols, anchors)
+        except Exception as e:
+            print(f"Error pricing {symbols} on-chain: {e}")
+            return {}
+        with self.lock:
+            self.onchain_prices.update(prices)
+            self.counters["onchain"] += len(prices)
+        return prices
+
+    def _fetch(self, symbols: List[str], future: Future) -> None:
+        """Fetch symbols in one CoinMetrics query and settle the future other requests wait on"""
+        try:
+            prices = self.coinmetrics.fetch_latest_prices(symbols)
+        except Exception as e:
+            failed_at = time.time()
+            with self.lock:
+                self.counters["errors"] += 1
+                for symbol in symbols:
+                    # Kept apart from self.prices so older prices still anchor on-chain routes
+                    self.failures[symbol] = failed_at
+                    self.in_flight.pop(symbol, None)
+            future.set_exception(e)
+            return
+
+        fetched_at = time.time()
+        with self.lock:
+            self.counters["fetches"] += 1
+            for symbol in symbols:
+                self.prices[symbol] = (prices.get(symbol), fetched_at)
+                self.failures.pop(symbol, None)
+                self.in_flight.pop(symbol, None)
+        future.set_result(prices)
+
+    def summary(self) -> Dict[str, Any]:
+        now = time.time()
+        with self.lock:
+            return {
+                "ttl": self.ttl,
+                "prices": {
+                    symbol: {"price": price, "age": round(now - fetched_at, 3)}
+                    for symbol, (price, fetched_at) in self.prices.items()
+                },
+                "onchain_prices": dict(self.onchain_prices),
+                "failures": {symbol: round(now - failed_at, 3) for symbol, failed_at in self.failures.items()},
+                "in_flight": sorted(self.in_flight),
+                **self.counters
+            }
+
+
+price_service = PriceService()
@@ -0,0 +1,203 @@
+"""
+Adaptive rate limiting and concurrency control for upstream providers.
+
+Each provider (an RPC endpoint or the CoinMetrics API) gets a token bucket for
+request rate and an in-flight limit, both adapted with AIMD: every success
+ramps them up additively, every 429/timeout halves them. This keeps us at the
+highest throughput a provider sustains without being throttled.
+"""
+import asyncio
+import contextlib
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+import requests
+
+# Default limits per provider kind: starting/min/max rate (req/s) and concurrency
+LIMITER_DEFAULTS = {
+    "rpc": {"rate": 25.0, "min_rate": 1.0, "max_rate": 300.0,
+            "concurrency": 8, "min_concurrency": 1, "max_concurrency": 64},
+    "coinmetrics": {"rate": 5.0, "min_rate": 0.5, "max_rate": 50.0,
+                    "concurrency": 4, "min_concurrency": 1, "max_concurrency": 16},
+}
+
+# Multiplicative decrease applied on throttling
+BACKOFF_FACTOR = 0.5
+
+# JSON-RPC error codes providers use to signal rate limiting
+THROTTLE_RPC_ERROR_CODES = {429, -32005, -32029}
+
+
+def is_throttle_error(error: BaseException) -> bool:
+    """Whether an exception means the provider is overloaded or throttling us"""
+    if isinstance(error, (requests.Timeout, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 429
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429
+    return False
+
+
+def is_throttle_response(response: Dict[str, Any]) -> bool:
+    """Whether a JSON-RPC response carries a rate-limit error"""
+    error = response.get("error") if isinstance(response, dict) else None
+    return isinstance(error, dict) and error.get("code") in THROTTLE_RPC_ERROR_CODES
+
+
+class LimiterSlot:
+    """Permission to send one request; lets the caller report throttling seen in a response."""
+
+    def __init__(self):
+        self.throttled_flag = False
+        self.failed_flag = False
+
+    def throttled(self) -> None:
+        self.throttled_flag = True
+
+    def failed(self, error: BaseException) -> None:
+        """Report an error that was handled inside the slot"""
+        if is_throttle_error(error):
+            self.throttled_flag = True
+        else:
+            self.failed_flag = True
+
+
+class AdaptiveLimiter:
+    """Token bucket plus concurrency limit for one provider, adapted with AIMD."""
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        min_rate: float,
+        max_rate: float,
+        concurrency: int,
+        min_concurrency: int,
+        max_concurrency: int
+    ):
+        self.name = name
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.concurrency = float(concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.tokens = rate
+        self.last_refill = time.monotonic()
+        self.inflight = 0
+        self.throttle_count = 0
+        self.lock = threading.Lock()
+        self.slot_released = threading.Condition(self.lock)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        # Burst capacity is one second's worth of requests
+        self.tokens = min(self.rate, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def _try_acquire(self) -> float:
+        """Take a concurrency slot and a token if available; otherwise return seconds to wait"""
+        if self.inflight >= int(self.concurrency):
+            return -1.0
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.inflight += 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def on_success(self) -> None:
+        with self.lock:
+            # Additive increase: +1 concurrency per window of successes, +0.1 req/s per success
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self.rate = min(self.max_rate, self.rate + 0.1)
+
+    def on_throttle(self) -> None:
+        with self.lock:
+            self.throttle_count += 1
+            self.concurrency = max(self.min_concurrency, self.concurrency * BACKOFF_FACTOR)
+            self.rate = max(self.min_rate, self.rate * BACKOFF_FACTOR)
+            self.tokens = min(self.tokens, 0)
+        print(f"Rate limiter {self.name}: throttled, backing off to {self.rate:.1f} req/s, "
+              f"{int(self.concurrency)} concurrent")
+
+    def _release(self, slot: LimiterSlot, error: Optional[BaseException]) -> None:
+        with self.lock:
+            self.inflight -= 1
+            self.slot_released.notify()
+        if slot.throttled_flag or (error is not None and is_throttle_error(error)):
+            self.on_throttle()
+        elif error is None and not slot.failed_flag:
+            self.on_success()
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[LimiterSlot]:
+        """Block until a request may be sent, then track its outcome"""
+        with self.lock:
+            while True:
+                wait = self._try_acquire()
+                if wait == 0:
+                    break
+                self.slot_released.wait(timeout=None if wait < 0 else wait)
+
+        slot = LimiterSlot()
+        try:
+            yield slot
+        except BaseException as e:
+            self._release(slot, e)
+            raise
+        self._release(slot, None)
+
+    @contextlib.asynccontextmanager
+    async def async_slot(self) -> AsyncIterator[LimiterSlot]:
+        """asyncio variant of slot() that never blocks the event loop"""
+        while True:
+            with self.lock:
+                wait = self._try_acquire()
+            if wait == 0:
+                break
+            await asyncio.sleep(0.01 if wait < 0 else wait)
+
+        slot = LimiterSlot()
+        try:
+            yield slot
+        except BaseException as e:
+            self._release(slot, e)
+            raise
+        self._release(slot, None)
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "name": self.name,
+                "rate": round(self.rate, 2),
+                "concurrency": int(self.concurrency),
+                "inflight": self.inflight,
+                "throttle_count": self.throttle_count,
+            }
+
+
+# Limiters by provider name
+limiters: Dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str, kind: str) -> AdaptiveLimiter:
+    """Get or create the limiter for a provider, using the defaults for its kind"""
+    with _limiters_lock:
+        if name not in limiters:
+            limiters[name] = AdaptiveLimiter(name, **LIMITER_DEFAULTS[kind])
+        return limiters[name]
+
+
+def get_rpc_limiter(network: str, url: str) -> AdaptiveLimiter:
+    """Limiter for one RPC endpoint; named by host so API keys never end up in logs"""
+    return get_limiter(f"rpc:{network}:{urlparse(url).hostname}", "rpc")
+
+
+def get_coinmetrics_limiter() -> AdaptiveLimiter:
+    return get_limiter("coinmetrics", "coinmetrics")
@@ -0,0 +1,115 @@
+"""
+Chain reorganisation detection.
+
+Incremental state (position and pool trackers, block-keyed caches) is advanced
+at the chain head with no confirmation delay. ReorgDetector keeps the canonical
+hash of the last REORG_WINDOW blocks of each network; when a new head does not
+build on the recorded chain it walks back to the last common block, so callers
+roll back only what was derived from the orphaned blocks and replay from there.
+Heights skipped between two heads (coalesced bursts, polling) are fetched in one
+batch; headers are only walked back one by one when a recorded hash disagrees.
+"""
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from app.backend.rpc_batch import RPCBatch
+from app.backend.web3_provider import get_web3_instance
+
+# Blocks of hashes kept per network (deeper reorgs trigger a full resync)
+REORG_WINDOW = 64
+
+
+class ReorgDetector:
+    """Canonical block hashes of recent blocks per network."""
+
+    def __init__(self, window: int = REORG_WINDOW):
+        self.window = window
+        self.hashes: Dict[str, Dict[int, str]] = {}
+        self.counters = {"heads": 0, "headers": 0, "gap_batches": 0, "reorgs": 0, "deepest_reorg": 0}
+        self.lock = threading.Lock()
+
+    def _header(self, network: str, block_number: int) -> Tuple[str, str]:
+        """(hash, parentHash) of the canonical block at a height"""
+        header = get_web3_instance(network).manager.request_blocking("eth_getBlockByNumber", [hex(block_number), False])
+        self.counters["headers"] += 1
+        return str(header["hash"]).lower(), str(header["parentHash"]).lower()
+
+    def _headers(self, network: str, numbers: Iterable[int]) -> Dict[int, Tuple[str, str]]:
+        """(hash, parentHash) of several canonical blocks in one batch"""
+        with RPCBatch(get_web3_instance(network)) as batch:
+            calls = [
+                (number, batch.add("eth_getBlockByNumber", [hex(number), False],
+                                   lambda header: (str(header["hash"]).lower(), str(header["parentHash"]).lower())))
+                for number in numbers
+            ]
+        self.counters["headers"] += len(calls)
+        self.counters["gap_batches"] += 1
+        return {number: call.result() for number, call in calls}
+
+    def check(self, network: str, block_number: int) -> Optional[int]:
+        """
+        Record a new head of a network.
+
+        Returns the last block the recorded chain and the new canonical chain
+        have in common if recorded blocks were orphaned, else None. When the
+        common block is older than the window, the oldest height checked minus
+        one is returned, which is beyond what callers can roll back.
+        """
+        with self.lock:
+            self.counters["heads"] += 1
+            hashes = self.hashes.setdefault(network, {})
+            block_hash, parent_hash = self._header(network, block_number)
+            reorged = block_number in hashes and hashes[block_number] != block_hash
+            # Heights above the new head belong to an abandoned longer chain
+            for number in [n for n in hashes if n > block_number]:
+                hashes.pop(number)
+                reorged = True
+            hashes[block_number] = block_hash
+
+            fork = None
+            below = [n for n in hashes if n < block_number]
+            if below:
+                number, canonical = block_number - 1, parent_hash
+                # Heights skipped since the last recorded head were never recorded: fetch them in one
+                # batch and link them down from the new head
+                start = max(max(below) + 1, block_number - self.window + 1)
+                if start < block_number - 1:
+                    headers = self._headers(network, range(start, block_number))
+                    while number >= start and headers.get(number, ("", ""))[0] == canonical:
+                        canonical = headers[number][1]
+                        hashes[number] = headers[number][0]
+                        number -= 1
+                # Walk back along the canonical chain until it meets a recorded block; without a
+                # reorg the last recorded block is the parent and this takes no further calls
+                lowest = min(hashes)
+                while number >= lowest and number > block_number - self.window:
+                    recorded = hashes.get(number)
+                    if recorded == canonical:
+                        break
+                    reorged = reorged or recorded is not None
+                    hashes[number] = canonical
+                    canonical = self._header(network, number)[1]
+                    number -= 1
+                fork = number if reorged else None
+            elif reorged:
+                fork = block_number - 1
+
+            for number in [n for n in hashes if n <= block_number - self.window]:
+                hashes.pop(number)
+
+            if fork is not None:
+                self.counters["reorgs"] += 1
+                self.counters["deepest_reorg"] = max(self.counters["deepest_reorg"], block_number - fork)
+                print(f"Reorg on {network}: blocks after {fork} replaced (new head {block_number})")
+            return fork
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "window": self.window,
+                "recorded": {network: len(hashes) for network, hashes in self.hashes.items()},
+                **self.counters
+            }
+
+
+reorg_detector = ReorgDetector()
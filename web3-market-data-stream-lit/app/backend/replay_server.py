@@ -0,0 +1,318 @@
+"""
+Record/replay stand-in for the RPC providers and the CoinMetrics API.
+
+Record mode proxies requests to the real upstreams and captures every response
+to fixture files; replay mode serves those fixtures with optional injected
+latency and errors, so the backend can be exercised and benchmarked without
+network access or API keys. A WebSocket endpoint per network emits synthetic
+newHeads at a configurable block time for the block subscription driver.
+
+Usage:
+    python -m app.backend.replay_server record --fixtures fixtures/default
+    python -m app.backend.replay_server replay --fixtures fixtures/default --latency-ms 40 --error-rate 0.01
+
+Then point the backend at it:
+    RPC_URL_OVERRIDE=http://127.0.0.1:8545/rpc/{network}
+    COINMETRICS_API_URL=http://127.0.0.1:8545/v4/timeseries/asset-metrics
+    WS_URL_OVERRIDE=ws://127.0.0.1:8545/ws/{network}
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from app.backend.consts import RPCS
+
+COINMETRICS_UPSTREAM_URL = "https://api.coinmetrics.io/v4/timeseries/asset-metrics"
+
+# CoinMetrics parameters that change on every call and are left out of fixture keys
+VOLATILE_COINMETRICS_PARAMS = {"api_key", "start_time", "end_time", "start_inclusive"}
+
+
+def rpc_key(method: str, params: Any) -> str:
+    return json.dumps([method, params], sort_keys=True)
+
+
+def rpc_blockless_key(method: str, params: Any) -> Optional[str]:
+    """Fallback key for calls pinned to a block, so replays match regardless of the block"""
+    if method in ("eth_call", "eth_getBalance") and isinstance(params, list) and len(params) == 2:
+        return rpc_key(method, [params[0], "*"])
+    return None
+
+
+def coinmetrics_key(query: Dict[str, str]) -> str:
+    return json.dumps({k: v for k, v in sorted(query.items()) if k not in VOLATILE_COINMETRICS_PARAMS})
+
+
+class ReplayServer:
+    """aiohttp application serving JSON-RPC and CoinMetrics fixtures."""
+
+    def __init__(
+        self,
+        mode: str,
+        fixtures_dir: str,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        error_rate: float = 0,
+        error_status: int = 429,
+        seed: Optional[int] = None,
+        block_time: float = 0
+    ):
+        self.mode = mode
+        self.fixtures_dir = fixtures_dir
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.block_time = block_time
+        self.started_at = time.monotonic()
+        self.rpc_fixtures: Dict[str, Dict[str, Any]] = {}
+        self.coinmetrics_fixtures: Dict[str, Any] = {}
+        self.counters: Counter = Counter()
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.load()
+
+    # Fixture files
+
+    def _rpc_path(self, network: str) -> str:
+        return os.path.join(self.fixtures_dir, f"rpc_{network}.json")
+
+    def _coinmetrics_path(self) -> str:
+        return os.path.join(self.fixtures_dir, "coinmetrics.json")
+
+    def load(self) -> None:
+        if not os.path.isdir(self.fixtures_dir):
+            return
+        for filename in os.listdir(self.fixtures_dir):
+            if filename.startswith("rpc_") and filename.endswith(".json"):
+                with open(os.path.join(self.fixtures_dir, filename)) as f:
+                    self.rpc_fixtures[filename[4:-5]] = json.load(f)
+        if os.path.exists(self._coinmetrics_path()):
+            with open(self._coinmetrics_path()) as f:
+                self.coinmetrics_fixtures = json.load(f)
+        print(f"Loaded fixtures for networks {list(self.rpc_fixtures)} "
+              f"and {len(self.coinmetrics_fixtures)} CoinMetrics queries from {self.fixtures_dir}")
+
+    def save(self) -> None:
+        os.makedirs(self.fixtures_dir, exist_ok=True)
+        for network, fixtures in self.rpc_fixtures.items():
+            with open(self._rpc_path(network), "w") as f:
+                json.dump(fixtures, f, indent=1, sort_keys=True)
+        with open(self._coinmetrics_path(), "w") as f:
+            json.dump(self.coinmetrics_fixtures, f, indent=1, sort_keys=True)
+        print(f"Saved fixtures to {self.fixtures_dir}")
+
+    # Fault injection
+
+    async def _inject_latency(self) -> None:
+        delay = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    def _should_fail(self) -> bool:
+        return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    # JSON-RPC
+
+    async def _record_rpc(self, network: str, payload: Any) -> Any:
+        upstream = RPCS[network] if isinstance(RPCS[network], str) else RPCS[network][0]
+        async with self.session.post(upstream, json=payload) as response:
+            body = await response.json(content_type=None)
+
+        requests = payload if isinstance(payload, list) else [payload]
+        responses = body if isinstance(body, list) else [body]
+        by_id = {r.get("id"): r for r in responses if isinstance(r, dict)}
+        fixtures = self.rpc_fixtures.setdefault(network, {})
+        for request in requests:
+            response = by_id.get(request.get("id"))
+            if response is None:
+                continue
+            stored = {k: v for k, v in response.items() if k != "id"}
+            fixtures[rpc_key(request["method"], request.get("params", []))] = stored
+            blockless = rpc_blockless_key(request["method"], request.get("params", []))
+            if blockless:
+                fixtures[blockless] = stored
+        return body
+
+    # Synthetic chain head
+
+    def head_block(self, network: str) -> int:
+        """Recorded block number plus one block per block_time seconds since startup"""
+        recorded = self.rpc_fixtures.get(network, {}).get(rpc_key("eth_blockNumber", []), {}).get("result", "0x1")
+        return int(recorded, 16) + int((time.monotonic() - self.started_at) / self.block_time)
+
+    def _replay_rpc_one(self, network: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        fixtures = self.rpc_fixtures.get(network, {})
+        method, params = request.get("method"), request.get("params", [])
+        if method == "eth_blockNumber" and self.block_time > 0:
+            return {"jsonrpc": "2.0", "id": request.get("id"), "result": hex(self.head_block(network))}
+        stored = fixtures.get(rpc_key(method, params))
+        if stored is None and rpc_blockless_key(method, params):
+            stored = fixtures.get(rpc_blockless_key(method, params))
+        if stored is None:
+            self.counters["rpc_fixture_misses"] += 1
+            stored = {"jsonrpc": "2.0", "error": {"code": -32000, "message": f"No fixture for {method}"}}
+        return {**stored, "id": request.get("id")}
+
+    async def handle_rpc(self, request: web.Request) -> web.Response:
+        network = request.match_info["network"]
+        payload = await request.json()
+        requests = payload if isinstance(payload, list) else [payload]
+        self.counters["rpc_http_requests"] += 1
+        for rpc_request in requests:
+            self.counters[f"rpc:{network}:{rpc_request.get('method')}"] += 1
+
+        await self._inject_latency()
+        if self._should_fail():
+            self.counters["injected_errors"] += 1
+            return web.Response(status=self.error_status, text="Injected failure")
+
+        if self.mode == "record":
+            return web.json_response(await self._record_rpc(network, payload))
+
+        responses = [self._replay_rpc_one(network, rpc_request) for rpc_request in requests]
+        return web.json_response(responses if isinstance(payload, list) else responses[0])
+
+    async def handle_ws(self, request: web.Request) -> web.WebSocketResponse:
+        """JSON-RPC over WebSocket: eth_subscribe("newHeads") streams synthetic heads, other calls are replayed"""
+        network = request.match_info["network"]
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.counters[f"ws_connections:{network}"] += 1
+        emitter: Optional[asyncio.Task] = None
+
+        async def emit_heads(subscription_id: str) -> None:
+            last = None
+            while not ws.closed:
+                head = self.head_block(network)
+                if head != last:
+                    last = head
+                    self.counters[f"ws_heads:{network}"] += 1
+                    await ws.send_json({"jsonrpc": "2.0", "method": "eth_subscription", "params": {
+                        "subscription": subscription_id,
+                        "result": {"number": hex(head), "timestamp": hex(int(time.time()))}
+                    }})
+                await asyncio.sleep(min(self.block_time, 1.0))
+
+        try:
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                rpc_request = json.loads(message.data)
+                if rpc_request.get("method") == "eth_subscribe":
+                    if rpc_request.get("params") != ["newHeads"] or self.block_time <= 0:
+                        await ws.send_json({"jsonrpc": "2.0", "id": rpc_request.get("id"),
+                                            "error": {"code": -32601, "message": "Only newHeads with --block-time"}})
+                        continue
+                    subscription_id = hex(self.random.getrandbits(64))
+                    await ws.send_json({"jsonrpc": "2.0", "id": rpc_request.get("id"), "result": subscription_id})
+                    emitter = asyncio.create_task(emit_heads(subscription_id))
+                else:
+                    self.counters[f"rpc:{network}:{rpc_request.get('method')}"] += 1
+                    await ws.send_json(self._replay_rpc_one(network, rpc_request))
+        finally:
+            if emitter is not None:
+                emitter.cancel()
+        return ws
+
+    # CoinMetrics
+
+    async def handle_coinmetrics(self, request: web.Request) -> web.Response:
+        query = dict(request.query)
+        self.counters[f"coinmetrics:{query.get('metrics')}"] += 1
+
+        await self._inject_latency()
+        if self._should_fail():
+            self.counters["injected_errors"] += 1
+            return web.Response(status=self.error_status, text="Injected failure")
+
+        key = coinmetrics_key(query)
+        if self.mode == "record":
+            async with self.session.get(COINMETRICS_UPSTREAM_URL, params=query) as response:
+                body = await response.json(content_type=None)
+                if response.status != 200:
+                    return web.json_response(body, status=response.status)
+            self.coinmetrics_fixtures[key] = body
+            return web.json_response(body)
+
+        if key not in self.coinmetrics_fixtures:
+            self.counters["coinmetrics_fixture_misses"] += 1
+            return web.json_response({"error": {"type": "not_found", "message": "No fixture"}}, status=404)
+        return web.json_response(self.coinmetrics_fixtures[key])
+
+    # Control endpoints used by benchmarks
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.counters))
+
+    async def handle_reset(self, request: web.Request) -> web.Response:
+        self.counters.clear()
+        return web.json_response({"status": "success"})
+
+    async def handle_save(self, request: web.Request) -> web.Response:
+        self.save()
+        return web.json_response({"status": "success"})
+
+    async def on_startup(self, app: web.Application) -> None:
+        self.session = aiohttp.ClientSession()
+
+    async def on_cleanup(self, app: web.Application) -> None:
+        if self.mode == "record":
+            self.save()
+        await self.session.close()
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 ** 2)
+        app.router.add_post("/rpc/{network}", self.handle_rpc)
+        app.router.add_get("/ws/{network}", self.handle_ws)
+        app.router.add_get("/v4/timeseries/asset-metrics", self.handle_coinmetrics)
+        app.router.add_get("/__stats", self.handle_stats)
+        app.router.add_post("/__reset", self.handle_reset)
+        app.router.add_post("/__save", self.handle_save)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Record/replay stand-in for RPC and CoinMetrics")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--fixtures", default="fixtures/default", help="Directory holding fixture files")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8545)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Injected latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Uniform jitter around the injected latency")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=429, help="HTTP status of injected errors")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible latency/error injection")
+    parser.add_argument("--block-time", type=float, default=0,
+                        help="Seconds per synthetic block for eth_blockNumber and newHeads (0 replays recorded values)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    server = ReplayServer(
+        mode=args.mode,
+        fixtures_dir=args.fixtures,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+        block_time=args.block_time
+    )
+    print(f"Starting {args.mode} server on http://{args.host}:{args.port}")
+    web.run_app(server.build_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+JSON-RPC batch transport.
+
+Two ways of getting independent reads into a single HTTP request:
+
+* RPCBatch - explicitly group contract calls and balance reads, then send them
+  as one JSON-RPC batch array with per-call results and errors.
+* BatchingMiddleware - transparently coalesce eth_call/eth_getBalance requests
+  issued concurrently from different threads within a short window.
+"""
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from eth_utils.abi import collapse_if_tuple
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.middleware.base import Web3Middleware
+from web3.types import RPCEndpoint, RPCResponse
+
+from app.backend.abi_codecs import get_codecs
+from app.backend.eth_call_cache import eth_call_cache
+
+# Methods that are safe to coalesce into a batch
+BATCHABLE_METHODS = {"eth_call", "eth_getBalance"}
+
+# How long concurrent requests are collected before a batch is sent (seconds)
+BATCH_WINDOW = 0.002
+
+# Upper bound on the size of a single JSON-RPC batch
+MAX_BATCH_SIZE = 50
+
+# Longest a coalesced caller waits for its batch, including individual retries (seconds)
+COALESCED_TIMEOUT = 120.0
+
+
+class RPCError(Exception):
+    """A JSON-RPC error returned for a single call of a batch"""
+
+    def __init__(self, method: str, error: Any):
+        self.method = method
+        self.error = error
+        message = error.get("message", error) if isinstance(error, dict) else error
+        super().__init__(f"{method} failed: {message}")
+
+
+def batch_responses(method: str, responses: Any, count: int) -> List[RPCResponse]:
+    """
+    Per-call responses of a batch of `count` requests.
+
+    Providers answer a rejected batch (e.g. a batch-level throttle) with a single
+    error object instead of a list; that, or a list of the wrong length, raises.
+    """
+    if isinstance(responses, list) and len(responses) == count:
+        return responses
+    error = responses.get("error", responses) if isinstance(responses, dict) else responses
+    raise RPCError(method, error)
+
+
+def to_block_param(block_identifier: Union[str, int]) -> str:
+    """Convert a block number or tag to a JSON-RPC block parameter"""
+    if isinstance(block_identifier, int):
+        return hex(block_identifier)
+    return block_identifier
+
+
+class BatchCall:
+    """Handle for one call of an RPCBatch, resolved once the batch is executed."""
+
+    def __init__(self, method: str, params: List[Any], decoder: Optional[Callable[[Any], Any]] = None):
+        self.method = method
+        self.params = params
+        self.decoder = decoder
+        self._value: Any = None
+        self._error: Optional[Exception] = None
+        self._done = False
+
+    def _resolve(self, response: RPCResponse) -> None:
+        self._done = True
+        if "error" in response and response["error"]:
+            self._error = RPCError(self.method, response["error"])
+            return
+        try:
+            result = response.get("result")
+            self._value = self.decoder(result) if self.decoder else result
+        except Exception as e:
+            self._error = e
+
+    def _fail(self, error: Exception) -> None:
+        self._done = True
+        self._error = error
+
+    def result(self) -> Any:
+        """Decoded result of the call, raising its error if it failed"""
+        if not self._done:
+            raise RuntimeError(f"Batch containing {self.method} has not been executed")
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+def decode_function_result(web3: Web3, outputs: List[Dict[str, Any]], result: str) -> Any:
+    """Decode eth_call return data the same way web3's ContractFunction.call() does"""
+    output_types = [collapse_if_tuple(output) for output in outputs]
+    decoded = web3.codec.decode(output_types, HexBytes(result))
+    values = [
+        Web3.to_checksum_address(value) if output_type == "address" else value
+        for output_type, value in zip(output_types, decoded)
+    ]
+    return values[0] if len(values) == 1 else values
+
+
+class RPCBatch:
+    """Group independent reads on one network and send them as a single JSON-RPC batch."""
+
+    def __init__(self, web3: Web3, block_identifier: Union[str, int] = "latest"):
+        self.web3 = web3
+        self.network = getattr(web3.provider, "network", str(web3.provider))
+        self.block_identifier = block_identifier
+        self.calls: List[BatchCall] = []
+
+    def __enter__(self) -> "RPCBatch":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.execute()
+
+    def add(self, method: str, params: List[Any], decoder: Optional[Callable[[Any], Any]] = None) -> BatchCall:
+        """Queue a raw JSON-RPC request"""
+        call = BatchCall(method, params, decoder)
+        self.calls.append(call)
+        return call
+
+    def call(self, function: Any, block_identifier: Optional[Union[str, int]] = None) -> BatchCall:
+        """Queue a contract function call, e.g. batch.call(token.functions.decimals())"""
+        block = self.block_identifier if block_identifier is None else block_identifier
+        outputs = function.abi.get("outputs", [])
+        return self.add(
+            "eth_call",
+            [{"to": function.address, "data": function._encode_transaction_data()}, to_block_param(block)],
+            lambda result: decode_function_result(self.web3, outputs, result)
+        )
+
+    def fast_call(
+        self,
+        address: str,
+        abi: List[Dict[str, Any]],
+        function_name: str,
+        *args: Any,
+        block_identifier: Optional[Union[str, int]] = None
+    ) -> BatchCall:
+        """Queue a call encoded with precompiled codecs, skipping web3 contract objects entirely"""
+        block = self.block_identifier if block_identifier is None else block_identifier
+        codec = get_codecs(abi)[function_name]
+        return self.add("eth_call", [{"to": address, "data": codec.encode(*args)}, to_block_param(block)], codec.decode)
+
+    def get_balance(self, address: str, block_identifier: Optional[Union[str, int]] = None) -> BatchCall:
+        """Queue a native balance read"""
+        block = self.block_identifier if block_identifier is None else block_identifier
+        return self.add(
+            "eth_getBalance",
+            [Web3.to_checksum_address(address), to_block_param(block)],
+            lambda result: int(result, 16)
+        )
+
+    def _fetch_block_number(self) -> int:
+        return int(self.web3.provider.make_request(RPCEndpoint("eth_blockNumber"), [])["result"], 16)
+
+    def execute(self) -> List[BatchCall]:
+        """Send all queued calls, MAX_BATCH_SIZE at a time, and resolve their handles"""
+        pending = []
+        cache_keys = {}
+        for call in self.calls:
+            if call._done:
+                continue
+            # Serve repeated reads from the eth_call cache before they reach the wire
+            if call.method == "eth_call":
+                cache_entry = eth_call_cache.make_key(self.network, call.params, self._fetch_block_number)
+                if cache_entry is not None:
+                    key, call.params = cache_entry
+                    cached = eth_call_cache.get(key)
+                    if cached is not None:
+                        call._resolve(cached)
+                        continue
+                    cache_keys[id(call)] = key
+            pending.append(call)
+
+        for start in range(0, len(pending), MAX_BATCH_SIZE):
+            chunk = pending[start:start + MAX_BATCH_SIZE]
+            requests = [(RPCEndpoint(call.method), call.params) for call in chunk]
+            try:
+                responses = batch_responses(
+                    "batch", self.web3.provider.make_batch_request(requests), len(requests)
+                )
+            except Exception as e:
+                print(f"RPC batch of {len(chunk)} calls failed on network {self.network}: {e}")
+                for call in chunk:
+                    call._fail(e)
+                continue
+
+            for call, response in zip(chunk, responses):
+                if id(call) in cache_keys:
+                    eth_call_cache.put(cache_keys[id(call)], response)
+                call._resolve(response)
+        return self.calls
+
+
+class RequestCoalescer:
+    """Collects concurrent requests of one network into JSON-RPC batches."""
+
+    def __init__(self, network: str, window: float = BATCH_WINDOW, max_batch_size: int = MAX_BATCH_SIZE):
+        self.network = network
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._queue: List[Tuple[RPCEndpoint, Any, Future]] = []
+        self._timer: Optional[threading.Timer] = None
+
+    def request(
+        self,
+        method: RPCEndpoint,
+        params: Any,
+        send_single: Callable[[RPCEndpoint, Any], RPCResponse],
+        send_batch: Callable[[List[Tuple[RPCEndpoint, Any]]], List[RPCResponse]]
+    ) -> RPCResponse:
+        with self._lock:
+            self._inflight += 1
+            alone = self._inflight == 1
+        try:
+            # A lone caller gains nothing from waiting for company
+            if alone:
+                return send_single(method, params)
+
+            future: Future = Future()
+            flush_now = False
+            with self._lock:
+                self._queue.append((method, params, future))
+                if len(self._queue) >= self.max_batch_size:
+                    flush_now = True
+                elif self._timer is None:
+                    self._timer = threading.Timer(self.window, self.flush, args=(send_single, send_batch))
+                    self._timer.daemon = True
+                    self._timer.start()
+            if flush_now:
+                self.flush(send_single, send_batch)
+            try:
+                return future.result(timeout=COALESCED_TIMEOUT)
+            except FutureTimeoutError:
+                raise TimeoutError(f"{method} on network {self.network} got no response within {COALESCED_TIMEOUT}s")
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+    def flush(
+        self,
+        send_single: Callable[[RPCEndpoint, Any], RPCResponse],
+        send_batch: Callable[[List[Tuple[RPCEndpoint, Any]]], List[RPCResponse]]
+    ) -> None:
+        with self._lock:
+            queued, self._queue = self._queue, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not queued:
+            return
+
+        try:
+            self._send(queued, send_single, send_batch)
+        finally:
+            # Nothing may leave a caller waiting, whatever went wrong above
+            for method, _, future in queued:
+                if not future.done():
+                    future.set_exception(RPCError(method, "coalesced batch was not resolved"))
+
+    def _send(
+        self,
+        queued: List[Tuple[RPCEndpoint, Any, Future]],
+        send_single: Callable[[RPCEndpoint, Any], RPCResponse],
+        send_batch: Callable[[List[Tuple[RPCEndpoint, Any]]], List[RPCResponse]]
+    ) -> None:
+        if len(queued) == 1:
+            method, params, future = queued[0]
+            try:
+                future.set_result(send_single(method, params))
+            except Exception as e:
+                future.set_exception(e)
+            return
+
+        try:
+            responses = batch_responses(
+                "batch", send_batch([(method, params) for method, params, _ in queued]), len(queued)
+            )
+        except Exception as e:
+            # Transport failure or batch-level error - isolate it by retrying the calls one at a time
+            print(f"Coalesced batch of {len(queued)} failed on network {self.network}, retrying individually: {e}")
+            for method, params, future in queued:
+                try:
+                    future.set_result(send_single(method, params))
+                except Exception as single_error:
+                    future.set_exception(single_error)
+            return
+
+        for (_, _, future), response in zip(queued, responses):
+            future.set_result(response)
+
+
+# One coalescer per network, shared by every middleware instance web3 creates
+coalescers: Dict[str, RequestCoalescer] = {}
+_coalescers_lock = threading.Lock()
+
+
+def get_coalescer(network: str) -> RequestCoalescer:
+    """Get or create the request coalescer for a network"""
+    with _coalescers_lock:
+        if network not in coalescers:
+            coalescers[network] = RequestCoalescer(network)
+        return coalescers[network]
+
+
+class BatchingMiddleware(Web3Middleware):
+    """Web3 middleware that coalesces concurrent eth_call/eth_getBalance requests into batches."""
+
+    def wrap_make_request(self, make_request: Callable[[RPCEndpoint, Any], RPCResponse]):
+        provider = self._w3.provider
+        coalescer = get_coalescer(getattr(provider, "network", str(provider)))
+
+        def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+            if method not in BATCHABLE_METHODS:
+                return make_request(method, params)
+            return coalescer.request(method, params, make_request, provider.make_batch_request)
+
+        return middleware
@@ -0,0 +1,253 @@
+"""
+Multi-provider JSON-RPC router.
+
+Routes every request to the endpoint with the best rolling latency/error score
+and optionally hedges slow requests to a second endpoint once the primary has
+been outstanding longer than its own latency percentile. Each endpoint is
+wrapped in its own adaptive rate limiter.
+"""
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+from web3 import HTTPProvider
+from web3.providers import JSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from app.backend.metrics import observe_rpc_batch, observe_rpc_call
+from app.backend.rate_limiter import get_rpc_limiter, is_throttle_response
+
+# Number of recent requests kept per endpoint for latency/error statistics
+STATS_WINDOW = 200
+
+# Minimum samples before an endpoint's percentile is trusted for hedging
+MIN_HEDGE_SAMPLES = 20
+
+# Hedge delay used until enough samples have been collected (seconds)
+DEFAULT_HEDGE_DELAY = 0.5
+
+# Every error in the window adds this many "latencies" worth of penalty to the score
+ERROR_PENALTY = 10.0
+
+# Request outcomes older than this (seconds) no longer count, so failing endpoints are retried
+OUTCOME_TTL = 60.0
+
+
+class RPCThrottledError(Exception):
+    """An endpoint answered with a rate-limit error"""
+
+
+class RPCBatchRejectedError(Exception):
+    """An endpoint answered a batch with a single batch-level error instead of per-call responses"""
+
+
+class EndpointStats:
+    """Rolling latency and error statistics for a single RPC endpoint."""
+
+    def __init__(self, url: str, window: int = STATS_WINDOW):
+        self.url = url
+        self.latencies = deque(maxlen=window)
+        # (monotonic time, ok) of recent requests
+        self.outcomes = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool) -> None:
+        """Record the latency and outcome of one request"""
+        with self.lock:
+            self.outcomes.append((time.monotonic(), ok))
+            if ok:
+                self.latencies.append(latency)
+
+    def _expire(self) -> None:
+        """Forget outcomes older than OUTCOME_TTL (called with the lock held)"""
+        cutoff = time.monotonic() - OUTCOME_TTL
+        while self.outcomes and self.outcomes[0][0] < cutoff:
+            self.outcomes.popleft()
+
+    def error_rate(self) -> float:
+        """Fraction of failed requests in the window"""
+        with self.lock:
+            self._expire()
+            if not self.outcomes:
+                return 0.0
+            return sum(1 for _, ok in self.outcomes if not ok) / len(self.outcomes)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Latency percentile in seconds, or None if there are not enough samples"""
+        with self.lock:
+            if len(self.latencies) < MIN_HEDGE_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+        return ordered[index]
+
+    def score(self) -> float:
+        """
+        Lower is better. Endpoints without recent history score 0 so they get
+        explored; one that has only failed is avoided until its failures expire.
+        """
+        with self.lock:
+            self._expire()
+            if not self.latencies:
+                return 0.0 if not self.outcomes else float("inf")
+            ordered = sorted(self.latencies)
+        median = ordered[len(ordered) // 2]
+        return median * (1 + ERROR_PENALTY * self.error_rate())
+
+    def summary(self) -> Dict[str, Any]:
+        """Snapshot of the endpoint statistics for diagnostics"""
+        error_rate = self.error_rate()
+        return {
+            "url": self.url,
+            "samples": len(self.outcomes),
+            "error_rate": error_rate,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+        }
+
+
+class RPCRouter(JSONBaseProvider):
+    """Web3 provider that spreads requests across several HTTP endpoints of one network."""
+
+    def __init__(
+        self,
+        network: str,
+        urls: List[str],
+        hedge: bool = True,
+        hedge_percentile: float = 95,
+        request_timeout: float = 10,
+        **kwargs: Any
+    ):
+        if not urls:
+            raise ValueError(f"No RPC URLs configured for network: {network}")
+        super().__init__(**kwargs)
+        self.network = network
+        self.urls = list(urls)
+        self.hedge = hedge and len(self.urls) > 1
+        self.hedge_percentile = hedge_percentile
+        self.providers = {
+            url: HTTPProvider(url, request_kwargs={"timeout": request_timeout})
+            for url in self.urls
+        }
+        self.stats = {url: EndpointStats(url) for url in self.urls}
+        self.limiters = {url: get_rpc_limiter(network, url) for url in self.urls}
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(4, 4 * len(self.urls)),
+            thread_name_prefix=f"rpc-{network}"
+        )
+
+    def __str__(self) -> str:
+        return f"RPCRouter({self.network}, {len(self.urls)} endpoints)"
+
+    def ranked_endpoints(self) -> List[str]:
+        """Endpoints ordered from best to worst score"""
+        return sorted(self.urls, key=lambda url: self.stats[url].score())
+
+    def hedge_delay(self, url: str) -> float:
+        """How long to wait on `url` before sending the same request elsewhere"""
+        delay = self.stats[url].percentile(self.hedge_percentile)
+        return DEFAULT_HEDGE_DELAY if delay is None else delay
+
+    def _send(self, url: str, method: RPCEndpoint, params: Any) -> RPCResponse:
+        """Send a request to one endpoint within its rate limits and record its latency/outcome"""
+        with self.limiters[url].slot() as slot:
+            started = time.perf_counter()
+            try:
+                response = self.providers[url].make_request(method, params)
+            except Exception:
+                self._record(url, method, params, started, False)
+                raise
+            if is_throttle_response(response):
+                slot.throttled()
+                self._record(url, method, params, started, False)
+                raise RPCThrottledError(f"{self.network} endpoint rate limited {method}: {response['error']}")
+            self._record(url, method, params, started, True)
+            return response
+
+    def _record(self, url: str, method: RPCEndpoint, params: Any, started: float, ok: bool) -> None:
+        latency = time.perf_counter() - started
+        self.stats[url].record(latency, ok)
+        observe_rpc_call(self.network, method, params, latency, ok)
+
+    def _send_with_failover(self, endpoints: List[str], method: RPCEndpoint, params: Any) -> RPCResponse:
+        """Try endpoints in order until one succeeds"""
+        last_error: Optional[Exception] = None
+        for url in endpoints:
+            try:
+                return self._send(url, method, params)
+            except Exception as e:
+                print(f"RPC {method} failed on {self.network} endpoint {url}: {e}")
+                last_error = e
+        raise last_error
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        endpoints = self.ranked_endpoints()
+        if not self.hedge:
+            return self._send_with_failover(endpoints, method, params)
+
+        primary, secondary = endpoints[0], endpoints[1]
+        tried = [primary]
+        pending = {self._executor.submit(self._send, primary, method, params)}
+        done, pending = wait(pending, timeout=self.hedge_delay(primary))
+
+        if not done:
+            # Primary is slower than usual - race it against the next best endpoint
+            tried.append(secondary)
+            pending.add(self._executor.submit(self._send, secondary, method, params))
+
+        last_error: Optional[Exception] = None
+        while True:
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    last_error = e
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+        # Every attempt so far failed, fall back to the endpoints not tried yet
+        remaining = [url for url in endpoints if url not in tried]
+        if not remaining:
+            raise last_error
+        return self._send_with_failover(remaining, method, params)
+
+    def make_batch_request(self, requests: List[Tuple[RPCEndpoint, Any]]) -> List[RPCResponse]:
+        """Send a JSON-RPC batch to the best endpoint, failing over in rank order"""
+        last_error: Optional[Exception] = None
+        for url in self.ranked_endpoints():
+            with self.limiters[url].slot() as slot:
+                started = time.perf_counter()
+                try:
+                    responses = self.providers[url].make_batch_request(requests)
+                    if not isinstance(responses, list) or len(responses) != len(requests):
+                        # e.g. a -32005 throttle of the whole batch: fail over like a transport error
+                        error = responses.get("error", responses) if isinstance(responses, dict) else responses
+                        if is_throttle_response(responses):
+                            raise RPCThrottledError(f"{self.network} endpoint rate limited a batch: {error}")
+                        raise RPCBatchRejectedError(f"{self.network} endpoint rejected a batch: {error}")
+                except Exception as e:
+                    if isinstance(e, RPCThrottledError):
+                        slot.throttled()
+                    else:
+                        slot.failed(e)
+                    self.stats[url].record(time.perf_counter() - started, False)
+                    observe_rpc_batch(self.network, requests, time.perf_counter() - started, False)
+                    print(f"RPC batch of {len(requests)} failed on {self.network} endpoint {url}: {e}")
+                    last_error = e
+                    continue
+                if any(is_throttle_response(response) for response in responses):
+                    slot.throttled()
+                self.stats[url].record(time.perf_counter() - started, True)
+                observe_rpc_batch(self.network, requests, time.perf_counter() - started, True)
+                return responses
+        raise last_error
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return any(provider.is_connected(show_traceback) for provider in self.providers.values())
+
+    def endpoint_summary(self) -> List[Dict[str, Any]]:
+        """Per-endpoint statistics, best first"""
+        return [self.stats[url].summary() for url in self.ranked_endpoints()]
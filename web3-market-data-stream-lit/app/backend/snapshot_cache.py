@@ -0,0 +1,149 @@
+"""
+Per-wallet position snapshots tagged with the blocks they were computed at.
+
+Block listeners recompute a wallet's snapshot when one of its networks gets a
+new head; endpoints serve the snapshot while its blocks are current (the head,
+or superseded less than HEAD_TOLERANCE seconds ago) and compute live otherwise
+(no subscription yet, or the refresh is too far behind).
+
+On startup the cache is seeded with the last persisted snapshot of each wallet,
+marked stale: endpoints serve it at once and recompute it in the background, so
+a restart does not make the first dashboard load wait for on-chain reads.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from app.backend.block_subscriber import current_heads, is_current
+
+SnapshotKey = Tuple[str, str]
+
+
+class SnapshotCache:
+    """Latest computed result per (kind, key) with the block heads it reflects."""
+
+    def __init__(self):
+        self.entries: Dict[SnapshotKey, Dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        # Stale snapshots being recomputed in the background
+        self.refreshing: Set[SnapshotKey] = set()
+        self.lock = threading.Lock()
+
+    def get(self, kind: str, key: str, networks: Iterable[str]) -> Optional[Any]:
+        """Snapshot whose blocks on every network are still current"""
+        with self.lock:
+            entry = self.entries.get((kind, key))
+            if (entry is not None and not entry["stale"] and all(n in entry["blocks"] for n in networks)
+                    and is_current({n: entry["blocks"][n] for n in networks})):
+                self.hits += 1
+                return entry["data"]
+            self.misses += 1
+            return None
+
+    def get_stale(self, kind: str, key: str) -> Optional[Any]:
+        """A persisted snapshot loaded at startup and not recomputed yet"""
+        with self.lock:
+            entry = self.entries.get((kind, key))
+            if entry is not None and entry["stale"]:
+                self.stale_hits += 1
+                return entry["data"]
+            return None
+
+    def put(self, kind: str, key: str, heads: Dict[str, int], data: Any) -> None:
+        with self.lock:
+            self.entries[(kind, key)] = {"blocks": heads, "data": data, "taken_at": time.time(), "stale": False}
+
+    def put_stale(self, kind: str, key: str, heads: Dict[str, int], data: Any, taken_at: float) -> None:
+        """Seed a persisted snapshot, served until it is recomputed"""
+        with self.lock:
+            if (kind, key) not in self.entries:
+                self.entries[(kind, key)] = {"blocks": heads, "data": data, "taken_at": taken_at, "stale": True}
+
+    def invalidate_after(self, network: str, block_number: int) -> None:
+        """Drop snapshots computed at blocks of a network after block_number (orphaned by a reorg)"""
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if entry["blocks"].get(network, -1) > block_number]:
+                self.entries.pop(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "stale_entries": sum(1 for entry in self.entries.values() if entry["stale"]),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits
+            }
+
+
+snapshot_cache = SnapshotCache()
+
+
+def request_copy(data: Any) -> Any:
+    """
+    Copy of a cached snapshot that a request can annotate.
+
+    Endpoints add top-level fields (wallet, TWAP, fee APR, PnL) to each position,
+    so the positions of a list, or the wallet dict, are copied one level deep.
+    """
+    if isinstance(data, list):
+        return [dict(item) if isinstance(item, dict) else item for item in data]
+    if isinstance(data, dict):
+        return dict(data)
+    return data
+
+
+def cached_snapshot(
+    kind: str,
+    key: str,
+    networks: Iterable[str],
+    compute: Callable[[], Any],
+    allow_stale: bool = True
+) -> Any:
+    """Serve a snapshot computed at the current heads of `networks`, computing and storing it if needed"""
+    networks = list(networks)
+    stale = snapshot_cache.get_stale(kind, key) if allow_stale else None
+    if stale is not None:
+        refresh_in_background(kind, key, networks, compute)
+        return request_copy(stale)
+
+    heads = current_heads(networks)
+    if heads is None:
+        return compute()
+
+    data = snapshot_cache.get(kind, key, networks)
+    if data is None:
+        data = compute()
+        snapshot_cache.put(kind, key, heads, data)
+    return request_copy(data)
+
+
+def refresh_snapshot(kind: str, key: str, networks: Iterable[str], compute: Callable[[], Any]) -> None:
+    """Recompute a snapshot for the current heads (called from block listeners)"""
+    heads = current_heads(networks)
+    data = compute()
+    if heads is not None:
+        snapshot_cache.put(kind, key, heads, data)
+
+
+def refresh_in_background(kind: str, key: str, networks: Iterable[str], compute: Callable[[], Any]) -> None:
+    """Recompute a stale snapshot on a background thread, once at a time per snapshot"""
+    with snapshot_cache.lock:
+        if (kind, key) in snapshot_cache.refreshing:
+            return
+        snapshot_cache.refreshing.add((kind, key))
+
+    def refresh():
+        try:
+            heads = current_heads(networks)
+            data = compute()
+            snapshot_cache.put(kind, key, heads or {}, data)
+        except Exception as e:
+            print(f"Error refreshing stale {kind} snapshot {key}: {e}")
+        finally:
+            with snapshot_cache.lock:
+                snapshot_cache.refreshing.discard((kind, key))
+
+    threading.Thread(target=refresh, name=f"refresh-{kind}-snapshot", daemon=True).start()
@@ -0,0 +1,390 @@
+"""
+Persisted history of wallet position snapshots.
+
+Every completed Uniswap and Aave wallet snapshot is valued in USD and appended
+to SQLite, one row per position plus one per wallet, at most once per
+HISTORY_INTERVAL per wallet. NAV and position histories are served from the
+store with downsampling done in SQL (the last snapshot of each wallet per time
+bucket), so historical views never trigger on-chain reads. Valuing and writing
+happen on a background thread, off the request or block listener that produced
+the snapshot. The latest full snapshot of each wallet is also kept, so a
+restarted backend can serve it (as stale) before its first on-chain read.
+
+Aave aTokens are valued 1:1 at their underlying, the last part of the token ID
+in consts (AAVE_ATOKEN_ARBITRUM_USDC -> USDC).
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.backend.block_subscriber import current_heads
+
+# SNAPSHOT_HISTORY_DB_PATH overrides the location of the store
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                               "data", "snapshot_history.sqlite")
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS positions (
+        kind TEXT NOT NULL,
+        portfolio TEXT NOT NULL,
+        strategy TEXT NOT NULL,
+        wallet TEXT NOT NULL,
+        position TEXT NOT NULL,
+        taken_at INTEGER NOT NULL,
+        network TEXT NOT NULL,
+        block INTEGER,
+        label TEXT NOT NULL,
+        value_usd REAL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (kind, portfolio, strategy, wallet, position, taken_at)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS wallets (
+        kind TEXT NOT NULL,
+        portfolio TEXT NOT NULL,
+        strategy TEXT NOT NULL,
+        wallet TEXT NOT NULL,
+        taken_at INTEGER NOT NULL,
+        value_usd REAL NOT NULL,
+        positions INTEGER NOT NULL,
+        unpriced INTEGER NOT NULL,
+        PRIMARY KEY (kind, portfolio, strategy, wallet, taken_at)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS latest (
+        kind TEXT NOT NULL,
+        portfolio TEXT NOT NULL,
+        strategy TEXT NOT NULL,
+        wallet TEXT NOT NULL,
+        taken_at INTEGER NOT NULL,
+        blocks TEXT NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (kind, portfolio, strategy, wallet)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS wallets_by_time ON wallets (taken_at)",
+    "CREATE INDEX IF NOT EXISTS positions_by_time ON positions (taken_at)",
+]
+
+# Minimum seconds between two recorded snapshots of a wallet
+HISTORY_INTERVAL = int(os.getenv("SNAPSHOT_HISTORY_INTERVAL", "60"))
+
+# Points per series returned by default by the history endpoints
+DEFAULT_POINTS = 500
+
+WalletKey = Tuple[str, str, str]
+
+# (kind, portfolio, strategy, wallet, taken_at, blocks per network, snapshot)
+LatestSnapshot = Tuple[str, str, str, str, int, Dict[str, int], Any]
+
+
+def wallet_fields(wallet_info: Dict[str, Any]) -> Tuple[str, str, str]:
+    return wallet_info["portfolio"], wallet_info.get("strategy", ""), wallet_info["address"].lower()
+
+
+def wallet_networks(wallet_info: Dict[str, Any]) -> List[str]:
+    """Networks of a Uniswap (one network) or Aave (several) wallet"""
+    return wallet_info.get("networks") or [wallet_info["network"]]
+
+
+def bucket_seconds(start: int, end: int, points: int) -> int:
+    """Bucket width that splits [start, end] into at most `points` buckets, never below HISTORY_INTERVAL"""
+    return max(HISTORY_INTERVAL, math.ceil((end - start) / max(points, 1)), 1)
+
+
+class SnapshotHistory:
+    """Append-only store of valued wallet snapshots with downsampled NAV and position queries."""
+
+    def __init__(self, path: Optional[str] = None, interval: int = HISTORY_INTERVAL):
+        self.path = path or os.getenv("SNAPSHOT_HISTORY_DB_PATH", DEFAULT_DB_PATH)
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+        self.interval = interval
+        self.last_recorded: Dict[Tuple[str, WalletKey], float] = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot-history")
+        self.counters = {"recorded": 0, "skipped": 0, "rows": 0, "errors": 0}
+        self.lock = threading.Lock()
+
+    # Recording
+
+    def record(
+        self,
+        kind: str,
+        wallet_info: Dict[str, Any],
+        data: Any,
+        blocks: Optional[Dict[str, int]] = None
+    ) -> None:
+        """
+        Queue a completed snapshot of a wallet ("uniswap" position list or "aave"
+        wallet dict), tagged with the blocks it was computed at (the current heads
+        when not given).
+        """
+        if blocks is None:
+            blocks = current_heads(wallet_networks(wallet_info)) or {}
+        now = time.time()
+        key = (kind, wallet_fields(wallet_info))
+        with self.lock:
+            if now - self.last_recorded.get(key, 0.0) < self.interval:
+                self.counters["skipped"] += 1
+                return
+            self.last_recorded[key] = now
+        # Rows are extracted now: endpoints keep adding fields to the snapshot objects afterwards
+        rows = self._position_rows(kind, wallet_info, data)
+        snapshot = json.dumps(data, default=str)
+        self.executor.submit(self._write, kind, wallet_info, int(now), blocks, rows, snapshot)
+
+    @staticmethod
+    def _position_rows(kind: str, wallet_info: Dict[str, Any], data: Any) -> List[Dict[str, Any]]:
+        """Position id, network, label, priced (symbol, amount) legs and JSON of each position in a snapshot"""
+        rows = []
+        if kind == "uniswap":
+            for position in data:
+                if "error" in position:
+                    continue
+                token0, token1 = position["token0"], position["token1"]
+                rows.append({
+                    "position": str(position["token_id"]),
+                    "network": wallet_info["network"],
+                    "label": f"{token0['symbol']}/{token1['symbol']}",
+                    "legs": [
+                        (token0["symbol"], float(token0["amount"]) + float(token0["uncollected_fees"])),
+                        (token1["symbol"], float(token1["amount"]) + float(token1["uncollected_fees"])),
+                    ],
+                    "data": json.dumps(position, default=str),
+                })
+        elif kind == "aave":
+            for token in data.get("tokens", []):
+                if token.get("error"):
+                    continue
+                underlying = str(token.get("token_id", token["symbol"])).rsplit("_", 1)[-1]
+                rows.append({
+                    "position": str(token.get("token_id", token["address"])),
+                    "network": token.get("network", ""),
+                    "label": token["symbol"],
+                    "legs": [(underlying, float(token["amount"]))],
+                    "data": json.dumps(token, default=str),
+                })
+        return rows
+
+    def _write(
+        self,
+        kind: str,
+        wallet_info: Dict[str, Any],
+        taken_at: int,
+        heads: Dict[str, int],
+        rows: List[Dict[str, Any]],
+        snapshot: str
+    ) -> None:
+        try:
+            # Imported here: valuation is the only part of recording that needs prices
+            from app.backend.price_service import price_service
+            prices = price_service.get_prices({symbol for row in rows for symbol, _ in row["legs"]})
+            portfolio, strategy, wallet = wallet_fields(wallet_info)
+
+            position_rows = []
+            total, unpriced = 0.0, 0
+            for row in rows:
+                legs = [amount * prices[symbol.upper()] if prices.get(symbol.upper()) is not None else None
+                        for symbol, amount in row["legs"]]
+                value = sum(legs) if None not in legs else None
+                if value is None:
+                    unpriced += 1
+                else:
+                    total += value
+                position_rows.append((
+                    kind, portfolio, strategy, wallet, row["position"], taken_at, row["network"],
+                    heads.get(row["network"]), row["label"], value, row["data"]
+                ))
+
+            with self.lock:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO positions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", position_rows
+                )
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO wallets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (kind, portfolio, strategy, wallet, taken_at, total, len(rows), unpriced)
+                )
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO latest VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (kind, portfolio, strategy, wallet, taken_at, json.dumps(heads), snapshot)
+                )
+                self.connection.commit()
+                self.counters["recorded"] += 1
+                self.counters["rows"] += len(position_rows)
+        except Exception as e:
+            print(f"Error recording {kind} snapshot of {wallet_info.get('address')}: {e}")
+            with self.lock:
+                self.counters["errors"] += 1
+
+    # Queries
+
+    def latest(self) -> List[LatestSnapshot]:
+        """Most recent full snapshot of every recorded wallet"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT kind, portfolio, strategy, wallet, taken_at, blocks, data FROM latest"
+            ).fetchall()
+        return [
+            (kind, portfolio, strategy, wallet, taken_at, json.loads(blocks), json.loads(data))
+            for kind, portfolio, strategy, wallet, taken_at, blocks, data in rows
+        ]
+
+    @staticmethod
+    def _filters(
+        portfolio: Optional[str],
+        strategy: Optional[str],
+        wallet: Optional[str],
+        kind: Optional[str]
+    ) -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        for column, value in (("portfolio", portfolio), ("strategy", strategy), ("wallet", wallet), ("kind", kind)):
+            if value:
+                clauses.append(f" AND {column} = ?")
+                params.append(value.lower() if column == "wallet" else value)
+        return "".join(clauses), params
+
+    def nav(
+        self,
+        start: int,
+        end: int,
+        points: int = DEFAULT_POINTS,
+        portfolio: Optional[str] = None,
+        strategy: Optional[str] = None,
+        kind: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        NAV per (portfolio, strategy) over [start, end] in at most `points` buckets.
+
+        Each bucket sums the last snapshot of every wallet in it; wallets without
+        a snapshot in a bucket carry their previous value forward.
+        """
+        bucket = bucket_seconds(start, end, points)
+        filters, params = self._filters(portfolio, strategy, None, kind)
+        with self.lock:
+            rows = self.connection.execute(
+                f"""
+                WITH last AS (
+                    SELECT kind, portfolio, strategy, wallet, taken_at / ? AS bucket, MAX(taken_at) AS taken_at
+                    FROM wallets WHERE taken_at BETWEEN ? AND ?{filters}
+                    GROUP BY kind, portfolio, strategy, wallet, bucket
+                )
+                SELECT w.portfolio, w.strategy, w.kind, w.wallet, l.bucket, w.value_usd, w.unpriced
+                FROM last l JOIN wallets w USING (kind, portfolio, strategy, wallet, taken_at)
+                ORDER BY l.bucket
+                """,
+                [bucket, start, end, *params]
+            ).fetchall()
+
+        series: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for portfolio_name, strategy_name, wallet_kind, wallet, index, value, unpriced in rows:
+            entry = series.setdefault((portfolio_name, strategy_name), {"wallets": {}, "points": []})
+            entry["wallets"][(wallet_kind, wallet)] = (value, unpriced)
+            point = {
+                "time": index * bucket,
+                "nav_usd": sum(v for v, _ in entry["wallets"].values()),
+                "unpriced_positions": sum(u for _, u in entry["wallets"].values())
+            }
+            # Rows of one bucket arrive together; the last one has every wallet of the bucket
+            if entry["points"] and entry["points"][-1]["time"] == point["time"]:
+                entry["points"][-1] = point
+            else:
+                entry["points"].append(point)
+
+        return {
+            "bucket_seconds": bucket,
+            "series": [
+                {"portfolio": portfolio_name, "strategy": strategy_name, "points": entry["points"]}
+                for (portfolio_name, strategy_name), entry in sorted(series.items())
+            ]
+        }
+
+    def positions(
+        self,
+        start: int,
+        end: int,
+        points: int = DEFAULT_POINTS,
+        portfolio: Optional[str] = None,
+        strategy: Optional[str] = None,
+        wallet: Optional[str] = None,
+        kind: Optional[str] = None,
+        details: bool = False
+    ) -> Dict[str, Any]:
+        """Value (and optionally the stored position) of every position over [start, end], last per bucket"""
+        bucket = bucket_seconds(start, end, points)
+        filters, params = self._filters(portfolio, strategy, wallet, kind)
+        with self.lock:
+            rows = self.connection.execute(
+                f"""
+                WITH last AS (
+                    SELECT kind, portfolio, strategy, wallet, position, taken_at / ? AS bucket, MAX(taken_at) AS taken_at
+                    FROM positions WHERE taken_at BETWEEN ? AND ?{filters}
+                    GROUP BY kind, portfolio, strategy, wallet, position, bucket
+                )
+                SELECT p.kind, p.portfolio, p.strategy, p.wallet, p.position, p.network, p.label,
+                       p.taken_at, p.block, p.value_usd, p.data
+                FROM last l JOIN positions p USING (kind, portfolio, strategy, wallet, position, taken_at)
+                ORDER BY p.taken_at
+                """,
+                [bucket, start, end, *params]
+            ).fetchall()
+
+        series: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        for kind_name, portfolio_name, strategy_name, wallet_address, position, network, label, taken_at, block, value, data in rows:
+            entry = series.setdefault((kind_name, portfolio_name, strategy_name, wallet_address, position), {
+                "kind": kind_name,
+                "portfolio": portfolio_name,
+                "strategy": strategy_name,
+                "wallet_address": wallet_address,
+                "position": position,
+                "network": network,
+                "label": label,
+                "points": []
+            })
+            point = {"time": taken_at, "block": block, "value_usd": value}
+            if details:
+                point["details"] = json.loads(data)
+            entry["points"].append(point)
+        return {"bucket_seconds": bucket, "series": list(series.values())}
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            wallets = self.connection.execute(
+                "SELECT kind, COUNT(*), COUNT(DISTINCT wallet), MIN(taken_at), MAX(taken_at) FROM wallets GROUP BY kind"
+            ).fetchall()
+            counters = dict(self.counters)
+        return {
+            "path": self.path,
+            "interval": self.interval,
+            "kinds": [
+                {"kind": kind, "snapshots": snapshots, "wallets": count, "first": first, "last": last}
+                for kind, snapshots, count, first, last in wallets
+            ],
+            **counters
+        }
+
+
+_history: Optional[SnapshotHistory] = None
+_history_lock = threading.Lock()
+
+
+def get_snapshot_history() -> SnapshotHistory:
+    """Process-wide store, opened on first use"""
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = SnapshotHistory()
+        return _history
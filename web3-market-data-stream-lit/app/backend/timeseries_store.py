@@ -0,0 +1,143 @@
+"""
+Local time-series store for CoinMetrics data.
+
+Every fetched point is kept in SQLite, clustered by (asset, metric, frequency,
+time), so fetches only need to ask CoinMetrics for points newer than the last
+stored timestamp of each series and history accumulates for analytics.
+"""
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+# TIMESERIES_DB_PATH overrides the location of the store
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                               "data", "timeseries.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    asset TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    frequency TEXT NOT NULL,
+    time TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (asset, metric, frequency, time)
+) WITHOUT ROWID
+"""
+
+
+class TimeSeriesStore:
+    """Points per (asset, metric, frequency) series, keyed by CoinMetrics ISO timestamps."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("TIMESERIES_DB_PATH", DEFAULT_DB_PATH)
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+        self.lock = threading.Lock()
+
+    def put_records(self, metric: str, frequency: str, records: Iterable[Dict[str, Any]]) -> int:
+        """Store CoinMetrics records ({"asset", "time", <metric>: value}); returns how many were written"""
+        rows = []
+        for record in records:
+            if "asset" not in record or "time" not in record or record.get(metric) is None:
+                continue
+            try:
+                value = float(record[metric])
+            except (TypeError, ValueError):
+                value = None
+            rows.append((record["asset"], metric, frequency, record["time"], value))
+        if not rows:
+            return 0
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?)", rows)
+            self.connection.commit()
+        return len(rows)
+
+    def last_times(self, metric: str, frequency: str, assets: List[str]) -> Dict[str, str]:
+        """Latest stored timestamp per asset (assets without data are left out)"""
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT asset, MAX(time) FROM points WHERE metric = ? AND frequency = ? "
+                f"AND asset IN ({','.join('?' * len(assets))}) GROUP BY asset",
+                [metric, frequency, *assets]
+            ).fetchall()
+        return {asset: last for asset, last in rows if last is not None}
+
+    def first_times(self, metric: str, frequency: str, assets: List[str]) -> Dict[str, str]:
+        """Earliest stored timestamp per asset (assets without data are left out)"""
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT asset, MIN(time) FROM points WHERE metric = ? AND frequency = ? "
+                f"AND asset IN ({','.join('?' * len(assets))}) GROUP BY asset",
+                [metric, frequency, *assets]
+            ).fetchall()
+        return {asset: first for asset, first in rows if first is not None}
+
+    def get_records(
+        self,
+        metric: str,
+        frequency: str,
+        assets: List[str],
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        limit_per_asset: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Stored points as CoinMetrics-shaped records, oldest first; limit_per_asset keeps the latest ones"""
+        records = []
+        with self.lock:
+            for asset in assets:
+                query = "SELECT time, value FROM points WHERE asset = ? AND metric = ? AND frequency = ?"
+                params: List[Any] = [asset, metric, frequency]
+                if start_time:
+                    query += " AND time >= ?"
+                    params.append(start_time)
+                if end_time:
+                    query += " AND time <= ?"
+                    params.append(end_time)
+                query += " ORDER BY time DESC"
+                if limit_per_asset:
+                    query += " LIMIT ?"
+                    params.append(limit_per_asset)
+                rows = self.connection.execute(query, params).fetchall()
+                records.extend(
+                    {"asset": asset, "time": time, metric: None if value is None else repr(value)}
+                    for time, value in reversed(rows)
+                )
+        return records
+
+    def clear(self) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM points")
+            self.connection.commit()
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            series = self.connection.execute(
+                "SELECT asset, metric, frequency, COUNT(*), MIN(time), MAX(time) FROM points "
+                "GROUP BY asset, metric, frequency"
+            ).fetchall()
+        return {
+            "path": self.path,
+            "series": [
+                {"asset": a, "metric": m, "frequency": f, "points": n, "first": first, "last": last}
+                for a, m, f, n, first, last in series
+            ]
+        }
+
+
+_store: Optional[TimeSeriesStore] = None
+_store_lock = threading.Lock()
+
+
+def get_timeseries_store() -> TimeSeriesStore:
+    """Process-wide store, opened on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TimeSeriesStore()
+        return _store
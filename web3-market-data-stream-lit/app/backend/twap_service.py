@@ -0,0 +1,153 @@
+"""
+Time-weighted average prices from the pools' own oracles.
+
+Spot slot0 prices move with every swap and can be pushed around within a
+block. Each Uniswap V3 pool records tick cumulatives, so observe([window, 0])
+gives the arithmetic mean tick over the window in a single call. TwapService
+reads it for every requested pool of a network in one JSON-RPC batch pinned to
+the current head and caches the ticks per block, so TWAP marks cost one batch
+per network per block however many requests ask for them. Reads pinned to a
+past block skip the per-block cache and are kept by the eth_call cache instead.
+"""
+import threading
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from web3 import Web3
+
+from app.backend.block_subscriber import current_heads
+from app.backend.contract_abis.uniswapv3_position_calculator_minimal_abis import UNISWAP_V3_POOL_ABI
+from app.backend.rpc_batch import RPCBatch
+from app.backend.web3_provider import get_web3_instance
+from app.backend.web3_uniswap_position_calculator import (
+    format_with_decimals,
+    get_sqrt_ratio_at_tick,
+    get_token_amounts_from_liquidity
+)
+
+# Default TWAP window (seconds)
+TWAP_WINDOW = 1800
+
+
+class TwapService:
+    """Mean tick per (pool, window), read in one batch per network and cached per block."""
+
+    def __init__(self):
+        # (network, window) -> {"block": int, "ticks": {pool: tick or None}}
+        self.cache: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self.counters = {"hits": 0, "batches": 0, "observe_calls": 0, "errors": 0}
+        self.lock = threading.Lock()
+
+    def mean_ticks(
+        self,
+        network: str,
+        pools: Iterable[str],
+        window: int = TWAP_WINDOW,
+        block: Optional[int] = None
+    ) -> Dict[str, Optional[int]]:
+        """
+        Mean tick over the last `window` seconds per pool at the current head (or at `block`).
+
+        Pools whose oracle does not reach back far enough (observation
+        cardinality too small) map to None.
+        """
+        pools = sorted({Web3.to_checksum_address(pool) for pool in pools})
+        if block is not None:
+            return self._observe(network, pools, window, block)
+        heads = current_heads([network])
+        block = heads[network] if heads is not None else get_web3_instance(network).eth.block_number
+
+        with self.lock:
+            entry = self.cache.get((network, window))
+            if entry is None or entry["block"] != block:
+                entry = {"block": block, "ticks": {}}
+                self.cache[(network, window)] = entry
+            ticks = {pool: entry["ticks"][pool] for pool in pools if pool in entry["ticks"]}
+            missing = [pool for pool in pools if pool not in ticks]
+            self.counters["hits"] += len(ticks)
+
+        if missing:
+            read = self._observe(network, missing, window, block)
+            with self.lock:
+                entry["ticks"].update(read)
+            ticks.update(read)
+        return ticks
+
+    def _observe(self, network: str, pools: List[str], window: int, block: int) -> Dict[str, Optional[int]]:
+        """observe([window, 0]) on every pool in one batch pinned to a block"""
+        with RPCBatch(get_web3_instance(network), block_identifier=block) as batch:
+            calls = [(pool, batch.fast_call(pool, UNISWAP_V3_POOL_ABI, "observe", [window, 0])) for pool in pools]
+
+        ticks: Dict[str, Optional[int]] = {}
+        errors = 0
+        for pool, call in calls:
+            try:
+                tick_cumulatives = call.result()[0]
+                # Floor division rounds towards negative infinity, like OracleLibrary.consult
+                ticks[pool] = (tick_cumulatives[1] - tick_cumulatives[0]) // window
+            except Exception as e:
+                print(f"Error reading {window}s TWAP of pool {pool} on {network}: {e}")
+                ticks[pool] = None
+                errors += 1
+        with self.lock:
+            self.counters["batches"] += 1
+            self.counters["observe_calls"] += len(pools)
+            self.counters["errors"] += errors
+        return ticks
+
+    def invalidate_after(self, network: str, block_number: int) -> None:
+        """Drop ticks read at blocks after block_number (orphaned by a reorg)"""
+        with self.lock:
+            for key in [key for key, entry in self.cache.items() if key[0] == network and entry["block"] > block_number]:
+                self.cache.pop(key)
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "cached": [
+                    {"network": network, "window": window, "block": entry["block"], "pools": len(entry["ticks"])}
+                    for (network, window), entry in self.cache.items()
+                ],
+                **self.counters
+            }
+
+
+twap_service = TwapService()
+
+
+def twap_details(position: Dict[str, Any], mean_tick: int, window: int) -> Dict[str, Any]:
+    """Value a position (as returned by build_position_details) at a TWAP tick instead of the spot price"""
+    token0, token1 = position["token0"], position["token1"]
+    tick_lower = position["position"]["tick_lower"]
+    tick_upper = position["position"]["tick_upper"]
+    amount0, amount1 = get_token_amounts_from_liquidity(
+        int(position["position"]["liquidity"]), tick_lower, tick_upper, get_sqrt_ratio_at_tick(mean_tick)
+    )
+    decimals_shift = Decimal(10) ** (token0["decimals"] - token1["decimals"])
+    spot_sqrt = Decimal(position["pool"]["current_sqrt_price_x96"]) / Decimal(2 ** 96)
+    return {
+        "window": window,
+        "tick": mean_tick,
+        # Price of one token0 in token1
+        "price": float(Decimal("1.0001") ** mean_tick * decimals_shift),
+        "spot_price": float(spot_sqrt * spot_sqrt * decimals_shift),
+        "token0_amount": format_with_decimals(Decimal(amount0) / Decimal(10 ** token0["decimals"]), token0["decimals"]),
+        "token1_amount": format_with_decimals(Decimal(amount1) / Decimal(10 ** token1["decimals"]), token1["decimals"]),
+        "in_range": tick_lower <= mean_tick <= tick_upper
+    }
+
+
+def add_twap_marks(
+    network: str,
+    positions: List[Dict[str, Any]],
+    window: int = TWAP_WINDOW,
+    block: Optional[int] = None
+) -> None:
+    """Attach a "twap" valuation to each valid position of a network (None where the oracle is too short)"""
+    valid = [position for position in positions if "error" not in position]
+    if not valid:
+        return
+    ticks = twap_service.mean_ticks(network, [position["pool"]["address"] for position in valid], window, block)
+    for position in valid:
+        mean_tick = ticks.get(Web3.to_checksum_address(position["pool"]["address"]))
+        position["twap"] = twap_details(position, mean_tick, window) if mean_tick is not None else None
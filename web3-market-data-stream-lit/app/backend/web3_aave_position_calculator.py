@@ -8,26 +8,15 @@ from typing import Dict, List, Tuple, Any, Optional, Union, Generator, Iterator,
 from app.backend.contract_abis.aave_abis import ERC20_ABI
 
 # Import constants to get wallet addresses with aave active protocol
-from app.backend.consts import PORTFOLIOS, TOKENS, RPCS
+from app.backend.consts import PORTFOLIOS, TOKENS
 
-# Dictionary to store web3 instances for different networks
-web3_instances = {}
+# Shared Web3 instances routed across all configured RPC endpoints
+from app.backend.web3_provider import get_web3_instance
+from app.backend.rpc_batch import RPCBatch
+from app.backend.contract_registry import get_contract
 
 T = TypeVar('T')  # Type variable for the contract
 
-def get_web3_instance(network: str) -> Web3:
-    """Get or create a Web3 instance for the specified network"""
-    if network in web3_instances:
-        return web3_instances[network]
-    
-    if network in RPCS:
-        rpc_url = RPCS[network]
-        web3_instance = Web3(Web3.HTTPProvider(rpc_url))
-        web3_instances[network] = web3_instance
-        return web3_instance
-    else:
-        raise ValueError(f"No RPC URL configured for network: {network}")
-
 def get_aave_wallet_addresses() -> List[Dict[str, Any]]:
     """Get wallet addresses from PORTFOLIOS for Aave processing"""
     wallet_addresses = []
@@ -64,9 +53,8 @@ def get_aave_wallet_addresses() -> List[Dict[str, Any]]:
 def web3_contract(address: str, abi: List[Dict], network: str) -> Generator[Any, None, None]:
     """Context manager for web3 contract interactions"""
     try:
-        web3 = get_web3_instance(network)
-        contract = web3.eth.contract(address=address, abi=abi)
-        yield contract
+        # Contracts are built once per (network, address, abi) and reused
+        yield get_contract(network, address, abi)
     except Exception as e:
         print(f"Error with contract {address} on network {network}: {e}")
         raise
@@ -94,30 +82,42 @@ def format_with_decimals(value: Decimal, decimals: int) -> str:
         formatted = formatted.rstrip('0').rstrip('.') if '.' in formatted else formatted
     return formatted
 
-def get_aave_token_balance(wallet_address: str, token_address: str, network: str) -> Dict[str, Any]:
-    """Get balance of an Aave token for a specific wallet"""
+def get_aave_token_balance(
+    wallet_address: str,
+    token_address: str,
+    network: str,
+    block_identifier: Union[str, int] = "latest"
+) -> Dict[str, Any]:
+    """Get balance of an Aave token for a specific wallet (at a past block on an archive node when given one)"""
     try:
         wallet_address = Web3.to_checksum_address(wallet_address)
         token_address = Web3.to_checksum_address(token_address)
         
-        # Get token information
-        token_info = get_token_info(token_address, network)
+        # Get token information and balance in a single JSON-RPC batch
+        with RPCBatch(get_web3_instance(network), block_identifier=block_identifier) as batch:
+            name = batch.fast_call(token_address, ERC20_ABI, "name")
+            symbol = batch.fast_call(token_address, ERC20_ABI, "symbol")
+            decimals = batch.fast_call(token_address, ERC20_ABI, "decimals")
+            balance_call = batch.fast_call(token_address, ERC20_ABI, "balanceOf", wallet_address)
+
+        try:
+            token_info = {"name": name.result(), "symbol": symbol.result(), "decimals": decimals.result()}
+        except Exception as e:
+            print(f"Error fetching token info for {token_address} on network {network}: {e}")
+            token_info = {"name": "Unknown", "symbol": "Unknown", "decimals": 18}
+        balance = balance_call.result()
+        
+        # Convert to human-readable format with proper decimals
+        balance_decimal = Decimal(balance) / Decimal(10 ** token_info['decimals'])
         
-        # Get token balance
-        with web3_contract(token_address, ERC20_ABI, network) as token_contract:
-            balance = token_contract.functions.balanceOf(wallet_address).call()
-            
-            # Convert to human-readable format with proper decimals
-            balance_decimal = Decimal(balance) / Decimal(10 ** token_info['decimals'])
-            
-            return {
-                "address": token_address,
-                "symbol": token_info['symbol'],
-                "name": token_info['name'],
-                "decimals": token_info['decimals'],
-                "amount": format_with_decimals(balance_decimal, token_info['decimals']),
-                "raw_amount": str(balance)
-            }
+        return {
+            "address": token_address,
+            "symbol": token_info['symbol'],
+            "name": token_info['name'],
+            "decimals": token_info['decimals'],
+            "amount": format_with_decimals(balance_decimal, token_info['decimals']),
+            "raw_amount": str(balance)
+        }
     except Exception as e:
         print(f"Error getting Aave token balance for {wallet_address} on network {network}: {e}")
         return {
@@ -130,8 +130,8 @@ def get_aave_token_balance(wallet_address: str, token_address: str, network: str
             "error": str(e)
         }
 
-def get_wallet_aave_positions(wallet_info: Dict[str, Any]) -> Dict[str, Any]:
-    """Get all Aave positions for a specific wallet"""
+def get_wallet_aave_positions(wallet_info: Dict[str, Any], blocks: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """Get all Aave positions for a specific wallet (as of a past block per network when given `blocks`)"""
     wallet_address = wallet_info["address"]
     portfolio = wallet_info["portfolio"]
     strategy = wallet_info.get("strategy", "")
@@ -165,7 +165,8 @@ def get_wallet_aave_positions(wallet_info: Dict[str, Any]) -> Dict[str, Any]:
                         token_balance = get_aave_token_balance(
                             wallet_address, 
                             token_info["address"], 
-                            network
+                            network,
+                            blocks[network] if blocks else "latest"
                         )
                         
                         # Add network information to the token data
@@ -0,0 +1,54 @@
+"""
+Shared Web3 instances for the on-chain calculators.
+
+Every network gets a single Web3 instance backed by an RPCRouter over all of
+the endpoints configured for it in RPCS, with repeated eth_calls served from
+the block-keyed cache and concurrent reads coalesced into JSON-RPC batches.
+"""
+import os
+import threading
+from typing import Dict, List
+
+from web3 import Web3
+
+from app.backend.consts import RPCS
+from app.backend.eth_call_cache import EthCallCacheMiddleware
+from app.backend.rpc_batch import BatchingMiddleware
+from app.backend.rpc_router import RPCRouter
+
+# Dictionary to store web3 instances for different networks
+web3_instances: Dict[str, Web3] = {}
+_web3_instances_lock = threading.Lock()
+
+
+def get_rpc_urls(network: str) -> List[str]:
+    """Get the list of RPC URLs configured for a network (RPCS values may be a URL or a list of URLs)"""
+    # e.g. RPC_URL_OVERRIDE=http://127.0.0.1:8545/rpc/{network} to use the replay server
+    override = os.getenv("RPC_URL_OVERRIDE")
+    if override:
+        return [override.format(network=network)]
+
+    if network not in RPCS:
+        raise ValueError(f"No RPC URL configured for network: {network}")
+
+    urls = RPCS[network]
+    if isinstance(urls, str):
+        urls = [urls]
+    return list(urls)
+
+
+def get_web3_instance(network: str) -> Web3:
+    """Get or create a Web3 instance for the specified network"""
+    if network in web3_instances:
+        return web3_instances[network]
+
+    with _web3_instances_lock:
+        if network not in web3_instances:
+            web3_instance = Web3(RPCRouter(network, get_rpc_urls(network)))
+            # Both sit below web3's formatting layers and see raw JSON-RPC params:
+            # cache hits never reach the batcher, and coalesced requests go
+            # straight to the provider
+            web3_instance.middleware_onion.inject(EthCallCacheMiddleware, name="eth_call_cache", layer=0)
+            web3_instance.middleware_onion.inject(BatchingMiddleware, name="batching", layer=0)
+            web3_instances[network] = web3_instance
+        return web3_instances[network]
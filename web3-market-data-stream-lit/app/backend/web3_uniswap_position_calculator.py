@@ -15,29 +15,15 @@ from app.backend.contract_abis.uniswapv3_position_calculator_minimal_abis import
 )
 
 # Import PORTFOLIOS to get wallet addresses with uniswap active protocol
-from app.backend.consts import PORTFOLIOS, UNISWAP_V3_FACTORY_ADDRESS, UNISWAP_V3_POSITIONS_NFT_IDS, RPCS
+from app.backend.consts import PORTFOLIOS, UNISWAP_V3_FACTORY_ADDRESS, UNISWAP_V3_POSITIONS_NFT_IDS
 
-# Dictionary to store web3 instances for different networks
-web3_instances = {}
-
-# Uniswap V3 Factory address
-UNISWAP_V3_FACTORY_ADDRESS = Web3.to_checksum_address(UNISWAP_V3_FACTORY_ADDRESS)
+# Shared Web3 instances routed across all configured RPC endpoints
+from app.backend.web3_provider import get_web3_instance
+from app.backend.rpc_batch import RPCBatch
+from app.backend.contract_registry import get_contract, fast_call
 
 T = TypeVar('T')  # Type variable for the contract
 
-def get_web3_instance(network: str) -> Web3:
-    """Get or create a Web3 instance for the specified network"""
-    if network in web3_instances:
-        return web3_instances[network]
-    
-    if network in RPCS:
-        rpc_url = RPCS[network]
-        web3_instance = Web3(Web3.HTTPProvider(rpc_url))
-        web3_instances[network] = web3_instance
-        return web3_instance
-    else:
-        raise ValueError(f"No RPC URL configured for network: {network}")
-
 def get_uniswap_wallet_addresses():
     """
     Get wallet addresses with Uniswap V3 positions from the PORTFOLIOS configuration.
@@ -101,9 +87,8 @@ def get_uniswap_wallet_addresses():
 def web3_contract(address: str, abi: List[Dict], network: str) -> Generator[Any, None, None]:
     """Context manager for web3 contract interactions"""
     try:
-        web3 = get_web3_instance(network)
-        contract = web3.eth.contract(address=address, abi=abi)
-        yield contract
+        # Contracts are built once per (network, address, abi) and reused
+        yield get_contract(network, address, abi)
     except Exception as e:
         print(f"Error with contract {address} on network {network}: {e}")
         raise
@@ -111,17 +96,29 @@ def web3_contract(address: str, abi: List[Dict], network: str) -> Generator[Any,
         # Any cleanup if needed in the future
         pass
 
+def get_tokens_info(token_addresses: List[str], network: str) -> List[Dict[str, Union[str, int]]]:
+    """Get name, symbol and decimals for several tokens in a single JSON-RPC batch"""
+    pending = []
+    with RPCBatch(get_web3_instance(network)) as batch:
+        for token_address in token_addresses:
+            pending.append((
+                batch.fast_call(token_address, ERC20_ABI, "name"),
+                batch.fast_call(token_address, ERC20_ABI, "symbol"),
+                batch.fast_call(token_address, ERC20_ABI, "decimals")
+            ))
+
+    tokens_info = []
+    for token_address, (name, symbol, decimals) in zip(token_addresses, pending):
+        try:
+            tokens_info.append({"name": name.result(), "symbol": symbol.result(), "decimals": decimals.result()})
+        except Exception as e:
+            print(f"Error fetching token info for {token_address} on network {network}: {e}")
+            tokens_info.append({"name": "Unknown", "symbol": "Unknown", "decimals": 18})
+    return tokens_info
+
 def get_token_info(token_address: str, network: str) -> Dict[str, Union[str, int]]:
     """Get token name, symbol and decimals"""
-    try:
-        with web3_contract(token_address, ERC20_ABI, network) as token_contract:
-            name = token_contract.functions.name().call()
-            symbol = token_contract.functions.symbol().call()
-            decimals = token_contract.functions.decimals().call()
-            return {"name": name, "symbol": symbol, "decimals": decimals}
-    except Exception as e:
-        print(f"Error fetching token info for {token_address} on network {network}: {e}")
-        return {"name": "Unknown", "symbol": "Unknown", "decimals": 18}
+    return get_tokens_info([token_address], network)[0]
 
 def get_sqrt_ratio_at_tick(tick: int) -> int:
     """Calculate sqrtPriceX96 from tick"""
@@ -167,88 +164,127 @@ def format_with_decimals(value: Decimal, decimals: int) -> str:
         formatted = formatted.rstrip('0').rstrip('.') if '.' in formatted else formatted
     return formatted
 
-def calculate_position_details(token_id: int, position_manager_address: str, network: str) -> Dict[str, Any]:
-    """Calculate full details of a Uniswap V3 position"""
-    try:
-        # Use context managers for contract interactions
-        with web3_contract(position_manager_address, POSITION_MANAGER_ABI, network) as position_manager:
-            # Get position data
-            position = position_manager.functions.positions(token_id).call()
-            
-            token0_address = position[2]
-            token1_address = position[3]
-            fee = position[4]
-            tick_lower = position[5]
-            tick_upper = position[6]
-            liquidity = position[7]
-            tokensOwed0 = position[10]  # Uncollected fees token0
-            tokensOwed1 = position[11]  # Uncollected fees token1
-            
-            # Get token info
-            token0_info = get_token_info(token0_address, network)
-            token1_info = get_token_info(token1_address, network)
-            
-            # Get pool address from factory
-            with web3_contract(UNISWAP_V3_FACTORY_ADDRESS, UNISWAP_V3_FACTORY_ABI, network) as factory:
-                pool_address = factory.functions.getPool(token0_address, token1_address, fee).call()
-                
-                if pool_address == '0x0000000000000000000000000000000000000000':
-                    return {
-                        "error": f"Pool not found for {token0_info['symbol']}/{token1_info['symbol']} with fee {fee/10000}%"
-                    }
-                
-                # Get current price from pool
-                with web3_contract(pool_address, UNISWAP_V3_POOL_ABI, network) as pool_contract:
-                    slot0 = pool_contract.functions.slot0().call()
-                    current_sqrt_price_x96 = slot0[0]
-                    current_tick = slot0[1]
-        
-        # Calculate token amounts
-        amount0, amount1 = get_token_amounts_from_liquidity(liquidity, tick_lower, tick_upper, current_sqrt_price_x96)
-        
-        # Convert to human-readable format with proper decimals
-        amount0_decimal = Decimal(amount0) / Decimal(10 ** token0_info['decimals'])
-        amount1_decimal = Decimal(amount1) / Decimal(10 ** token1_info['decimals'])
-        
-        # Convert uncollected fees to proper decimals
-        fees0_decimal = Decimal(tokensOwed0) / Decimal(10 ** token0_info['decimals'])
-        fees1_decimal = Decimal(tokensOwed1) / Decimal(10 ** token1_info['decimals'])
-        
-        # Store current tick information for reference
-        current_tick_info = current_tick
-            
+def read_position(
+    token_id: int,
+    position_manager_address: str,
+    network: str,
+    block_identifier: Union[str, int] = "latest"
+) -> Dict[str, Any]:
+    """Read the on-chain state of a position that only changes through its own events"""
+    # Get position data (precompiled codecs, no contract object needed)
+    position = fast_call(network, position_manager_address, POSITION_MANAGER_ABI, "positions", token_id,
+                         block_identifier=block_identifier)
+    
+    token0_address = position[2]
+    token1_address = position[3]
+    fee = position[4]
+    
+    # Get token info for both tokens in one batch
+    token0_info, token1_info = get_tokens_info([token0_address, token1_address], network)
+    
+    # Get pool address from factory
+    pool_address = fast_call(
+        network, Web3.to_checksum_address(UNISWAP_V3_FACTORY_ADDRESS), UNISWAP_V3_FACTORY_ABI, "getPool",
+        token0_address, token1_address, fee, block_identifier=block_identifier
+    )
+    
+    if pool_address == '0x0000000000000000000000000000000000000000':
         return {
-            "token_id": token_id,
-            "position_manager": position_manager_address,
-            "token0": {
-                "address": token0_address,
-                "symbol": token0_info['symbol'],
-                "name": token0_info['name'],
-                "decimals": token0_info['decimals'],
-                "amount": format_with_decimals(amount0_decimal, token0_info['decimals']),
-                "uncollected_fees": format_with_decimals(fees0_decimal, token0_info['decimals'])
-            },
-            "token1": {
-                "address": token1_address,
-                "symbol": token1_info['symbol'],
-                "name": token1_info['name'],
-                "decimals": token1_info['decimals'],
-                "amount": format_with_decimals(amount1_decimal, token1_info['decimals']),
-                "uncollected_fees": format_with_decimals(fees1_decimal, token1_info['decimals'])
-            },
-            "pool": {
-                "address": pool_address,
-                "fee": fee / 10000,  # Convert to percentage
-                "current_tick": current_tick,
-                "current_sqrt_price_x96": str(current_sqrt_price_x96),
-            },
-            "position": {
-                "liquidity": str(liquidity),
-                "tick_lower": tick_lower,
-                "tick_upper": tick_upper,
-                "in_range": tick_lower <= current_tick <= tick_upper
-            }
+            "error": f"Pool not found for {token0_info['symbol']}/{token1_info['symbol']} with fee {fee/10000}%"
+        }
+    
+    return {
+        "token_id": token_id,
+        "position_manager": position_manager_address,
+        "token0": {"address": token0_address, **token0_info},
+        "token1": {"address": token1_address, **token1_info},
+        "pool_address": pool_address,
+        "fee": fee,
+        "tick_lower": position[5],
+        "tick_upper": position[6],
+        "liquidity": position[7],
+        "tokens_owed0": position[10],  # Uncollected fees token0
+        "tokens_owed1": position[11],  # Uncollected fees token1
+    }
+
+def read_pool_price(pool_address: str, network: str, block_identifier: Union[str, int] = "latest") -> Tuple[int, int]:
+    """sqrtPriceX96 and tick of a pool, from the Swap-driven pool tracker when it follows the pool at latest"""
+    if block_identifier == "latest":
+        # Imported here: the pool tracker is only loaded once block subscriptions start
+        from app.backend.pool_tracker import pool_tracker
+        price = pool_tracker.current_price(network, pool_address)
+        if price is not None:
+            return price
+    slot0 = fast_call(network, pool_address, UNISWAP_V3_POOL_ABI, "slot0", block_identifier=block_identifier)
+    return slot0[0], slot0[1]
+
+def build_position_details(state: Dict[str, Any], current_sqrt_price_x96: int, current_tick: int) -> Dict[str, Any]:
+    """Value a position read by read_position() at a pool price, without any RPC calls"""
+    token0_info = state["token0"]
+    token1_info = state["token1"]
+    tick_lower = state["tick_lower"]
+    tick_upper = state["tick_upper"]
+    liquidity = state["liquidity"]
+    
+    # Calculate token amounts
+    amount0, amount1 = get_token_amounts_from_liquidity(liquidity, tick_lower, tick_upper, current_sqrt_price_x96)
+    
+    # Convert to human-readable format with proper decimals
+    amount0_decimal = Decimal(amount0) / Decimal(10 ** token0_info['decimals'])
+    amount1_decimal = Decimal(amount1) / Decimal(10 ** token1_info['decimals'])
+    
+    # Convert uncollected fees to proper decimals
+    fees0_decimal = Decimal(state["tokens_owed0"]) / Decimal(10 ** token0_info['decimals'])
+    fees1_decimal = Decimal(state["tokens_owed1"]) / Decimal(10 ** token1_info['decimals'])
+        
+    return {
+        "token_id": state["token_id"],
+        "position_manager": state["position_manager"],
+        "token0": {
+            "address": token0_info['address'],
+            "symbol": token0_info['symbol'],
+            "name": token0_info['name'],
+            "decimals": token0_info['decimals'],
+            "amount": format_with_decimals(amount0_decimal, token0_info['decimals']),
+            "uncollected_fees": format_with_decimals(fees0_decimal, token0_info['decimals'])
+        },
+        "token1": {
+            "address": token1_info['address'],
+            "symbol": token1_info['symbol'],
+            "name": token1_info['name'],
+            "decimals": token1_info['decimals'],
+            "amount": format_with_decimals(amount1_decimal, token1_info['decimals']),
+            "uncollected_fees": format_with_decimals(fees1_decimal, token1_info['decimals'])
+        },
+        "pool": {
+            "address": state["pool_address"],
+            "fee": state["fee"] / 10000,  # Convert to percentage
+            "current_tick": current_tick,
+            "current_sqrt_price_x96": str(current_sqrt_price_x96),
+        },
+        "position": {
+            "liquidity": str(liquidity),
+            "tick_lower": tick_lower,
+            "tick_upper": tick_upper,
+            "in_range": tick_lower <= current_tick <= tick_upper
         }
+    }
+
+def calculate_position_details(
+    token_id: int,
+    position_manager_address: str,
+    network: str,
+    block_identifier: Union[str, int] = "latest"
+) -> Dict[str, Any]:
+    """Calculate full details of a Uniswap V3 position (at a past block on an archive node when given one)"""
+    try:
+        state = read_position(token_id, position_manager_address, network, block_identifier)
+        if "error" in state:
+            return state
+        
+        # Get current price from pool
+        current_sqrt_price_x96, current_tick = read_pool_price(state["pool_address"], network, block_identifier)
+        return build_position_details(state, current_sqrt_price_x96, current_tick)
     
     except Exception as e:
         return {"error": f"Error calculating position details for token ID {token_id}: {str(e)}"}
@@ -268,20 +304,34 @@ def format_decimal_str(decimal_str: str, token_symbol: str, token_decimals: int)
     # Fallback
     return decimal_str
 
-def get_token_ids(wallet_address: str, nft_manager_address: str, network: str) -> Generator[int, None, None]:
+def get_token_ids(
+    wallet_address: str,
+    nft_manager_address: str,
+    network: str,
+    block_identifier: Union[str, int] = "latest"
+) -> Generator[int, None, None]:
     """Generator that yields token IDs owned by the given wallet"""
-    with web3_contract(nft_manager_address, ERC721_ABI, network) as erc721_contract:
-        balance = erc721_contract.functions.balanceOf(wallet_address).call()
-        
-        if balance == 0:
-            return
-            
-        for i in range(balance):
-            token_id = erc721_contract.functions.tokenOfOwnerByIndex(wallet_address, i).call()
-            yield token_id
+    balance = fast_call(network, nft_manager_address, ERC721_ABI, "balanceOf", wallet_address,
+                        block_identifier=block_identifier)
+    
+    if balance == 0:
+        return
+    
+    # Look up every index in JSON-RPC batches instead of one request per token
+    with RPCBatch(get_web3_instance(network), block_identifier=block_identifier) as batch:
+        token_id_calls = [
+            batch.fast_call(nft_manager_address, ERC721_ABI, "tokenOfOwnerByIndex", wallet_address, i)
+            for i in range(balance)
+        ]
+    
+    for token_id_call in token_id_calls:
+        yield token_id_call.result()
 
-def process_positions(wallet_info: Dict[str, Any]) -> Generator[Dict[str, Any], None, None]:
-    """Generator that processes positions and yields position details"""
+def process_positions(
+    wallet_info: Dict[str, Any],
+    block_identifier: Union[str, int] = "latest"
+) -> Generator[Dict[str, Any], None, None]:
+    """Generator that processes positions and yields position details (as of a past block when given one)"""
     wallet_address = wallet_info["address"]
     network = wallet_info["network"]
     
@@ -293,8 +343,10 @@ def process_positions(wallet_info: Dict[str, Any]) -> Generator[Dict[str, Any],
             
             print(f"Checking positions using {nft_id} contract at {position_manager_address} on network {network}")
             
-            for token_id in get_token_ids(wallet_address, position_manager_address, network):
-                position_details = calculate_position_details(token_id, position_manager_address, network)
+            for token_id in get_token_ids(wallet_address, position_manager_address, network, block_identifier):
+                position_details = calculate_position_details(
+                    token_id, position_manager_address, network, block_identifier
+                )
                 yield position_details
         else:
             print(f"Warning: NFT ID '{nft_id}' not found in UNISWAP_V3_POSITIONS_NFT_IDS")
@@ -30,23 +30,14 @@ def render_aave_page(api_service):
     with col2:
         strategy_filter = st.text_input("Filter by Strategy", key="aave_strategy_filter")
     
-    # Function to fetch token prices using CoinMetricsService
+    # Function to fetch token prices from the backend price service
     def fetch_token_prices(token_symbols):
-        """Fetch real-time token prices from CoinMetrics API"""
-        try:
-            # Initialize CoinMetricsService
-            from backend.coinmetrics import CoinMetricsService
-            coinmetrics = CoinMetricsService()
-            
-            # Fetch prices using the synchronous method
-            prices = coinmetrics.fetch_token_prices_sync(token_symbols)
-            
-            return prices
-        except Exception as e:
-            st.error(f"Error fetching token prices: {str(e)}")
-            st.warning("Please make sure the COINMETRICS_API_KEY environment variable is set correctly.")
-            # Return empty dict - the UI will need to handle missing prices
-            return {}
+        """Fetch real-time token prices shared by every page through the backend"""
+        prices, missing = api_service.fetch_token_prices(token_symbols)
+        if missing:
+            st.warning(f"No price available for: {', '.join(missing)}")
+        # Missing symbols are left out - the UI will need to handle missing prices
+        return prices
     
     # Function to fetch AAVE positions data
     def fetch_aave_positions():
@@ -71,6 +62,11 @@ def render_aave_page(api_service):
     with st.spinner("Loading AAVE positions..."):
         positions_data = fetch_aave_positions()
     
+    # Right after a backend restart the last persisted snapshot is served while it refreshes
+    if positions_data and positions_data.get("stale"):
+        as_of = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime(positions_data["stale_since"]))
+        st.info(f"Showing positions as of {as_of} while they refresh in the background. Reload for live data.")
+    
     # Display raw API response in debug mode
     if debug_mode and positions_data:
         st.subheader("Raw API Response")
@@ -55,6 +55,25 @@ class ApiService:
         # Return combined data
         return {"data": all_data, "asset_statuses": asset_statuses}
         
+    def fetch_token_prices(self, token_symbols):
+        """Fetch latest token prices from the backend price service.
+        
+        Returns a (prices, missing) tuple keyed by the symbols as requested.
+        """
+        token_symbols = list(token_symbols)
+        data = self.get("prices", {"symbols": token_symbols})
+        if not data or "prices" not in data:
+            if data and "error" in data:
+                st.error(data["error"])
+            return {}, token_symbols
+        # The backend keys prices by upper-case symbol
+        prices = {
+            symbol: data["prices"][symbol.upper()]
+            for symbol in token_symbols if symbol.upper() in data["prices"]
+        }
+        missing = [symbol for symbol in token_symbols if symbol not in prices]
+        return prices, missing
+        
     def fetch_eth_balance(self, address, chain):
         """Fetch ETH balance for a single address."""
         try:
@@ -7,9 +7,11 @@ import os
 # Direct import using explicit file path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import backend.consts as consts
-from backend.coinmetrics import CoinMetricsService
 PORTFOLIOS = consts.PORTFOLIOS
 
+# Fee APR windows shown in the positions table
+FEE_APR_WINDOWS = ["1d", "7d"]
+
 def plot_tick_range(current_tick, lower_tick, upper_tick):
     """
     Create a visual representation of a Uniswap V3 position's tick range.
@@ -97,26 +99,18 @@ def render_uniswap_page(api_service):
     with col2:
         strategy_filter = st.text_input("Filter by Strategy", key="strategy_filter")
             
-    # Function to fetch token prices using CoinMetricsService
+    # Function to fetch token prices from the backend price service
     def fetch_token_prices(token_symbols):
-        """Fetch real-time token prices from CoinMetrics API"""
-        try:
-            # Initialize CoinMetricsService
-            coinmetrics = CoinMetricsService()
-            
-            # Fetch prices using the synchronous method
-            prices = coinmetrics.fetch_token_prices_sync(token_symbols)
-            
-            return prices
-        except Exception as e:
-            st.error(f"Error fetching token prices: {str(e)}")
-            st.warning("Please make sure the COINMETRICS_API_KEY environment variable is set correctly.")
-            # Return empty dict - the UI will need to handle missing prices
-            return {}
+        """Fetch real-time token prices shared by every page through the backend"""
+        prices, missing = api_service.fetch_token_prices(token_symbols)
+        if missing:
+            st.warning(f"No price available for: {', '.join(missing)}")
+        # Missing symbols are left out - the UI will need to handle missing prices
+        return prices
     
     # Function to fetch Uniswap positions data - moved up to use in both table and positions
     def fetch_uniswap_positions():
-        params = {}
+        params = {'apr_windows': FEE_APR_WINDOWS, 'pnl': True}
         if portfolio_filter:
             params['portfolio'] = portfolio_filter
         if strategy_filter:
@@ -133,6 +127,11 @@ def render_uniswap_page(api_service):
     with st.spinner("Loading Uniswap positions..."):
         positions_data = fetch_uniswap_positions()
     
+    # Right after a backend restart the last persisted snapshot is served while it refreshes
+    if positions_data and positions_data.get("stale"):
+        as_of = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime(positions_data["stale_since"]))
+        st.info(f"Showing positions as of {as_of} while they refresh in the background. Reload for live data.")
+    
     # Store the selected position ID in session state if not already there
     if 'selected_position_id' not in st.session_state:
         st.session_state.selected_position_id = None
@@ -193,6 +192,15 @@ def render_uniswap_page(api_service):
                 token1_value_usd = token1_amount * token1_price
                 total_value_usd = token0_value_usd + token1_value_usd
                 
+                # Fee APR per window (None when the range did not exist for the whole window)
+                fee_aprs = {
+                    f"Fee APR {window}": ((position.get('fee_apr') or {}).get(window) or {}).get('apr')
+                    for window in FEE_APR_WINDOWS
+                }
+                
+                # PnL from deposits, withdrawals and collected fees (None when prices are missing)
+                pnl = position.get('pnl') or {}
+                
                 # Add to table data
                 position_table_data.append({
                     "Portfolio": position.get('portfolio', 'Unknown'),
@@ -207,7 +215,11 @@ def render_uniswap_page(api_service):
                     "Price Status": price_status,
                     "Position ID": position['token_id'],
                     "Wallet": position['wallet_address'],
-                    "Fee Tier": f"{position['pool']['fee']}%"
+                    "Fee Tier": f"{position['pool']['fee']}%",
+                    **fee_aprs,
+                    "Unrealized PnL": pnl.get('unrealized_pnl_usd'),
+                    "Realized PnL": pnl.get('realized_pnl_usd'),
+                    "IL %": pnl.get('impermanent_loss_pct')
                 })
         
         # Create a DataFrame
@@ -235,7 +247,14 @@ def render_uniswap_page(api_service):
                     "Token0 USD": st.column_config.NumberColumn("Token0 USD", width="medium", format="$%.2f"),
                     "Token1 USD": st.column_config.NumberColumn("Token1 USD", width="medium", format="$%.2f"),
                     "Total USD": st.column_config.NumberColumn("Total USD", width="medium", format="$%.2f"),
-                    "Fee Tier": st.column_config.TextColumn("Fee Tier", width="small")
+                    "Fee Tier": st.column_config.TextColumn("Fee Tier", width="small"),
+                    **{
+                        f"Fee APR {window}": st.column_config.NumberColumn(f"Fee APR {window}", width="small", format="%.2f%%")
+                        for window in FEE_APR_WINDOWS
+                    },
+                    "Unrealized PnL": st.column_config.NumberColumn("Unrealized PnL", width="medium", format="$%.2f"),
+                    "Realized PnL": st.column_config.NumberColumn("Realized PnL", width="medium", format="$%.2f"),
+                    "IL %": st.column_config.NumberColumn("IL %", width="small", format="%.2f%%")
                 },
                 use_container_width=True,
                 hide_index=True
@@ -0,0 +1,112 @@
+"""
+Cold-start profile of the backend.
+
+Imports app.backend.main under `python -X importtime` and reports the slowest
+modules and top-level packages, then optionally starts uvicorn and measures
+how long it takes until /api/health/ready answers and until heavy modules are
+preloaded.
+
+Usage:
+    python benchmarks/import_profile.py
+    python benchmarks/import_profile.py --module app.backend.web3_uniswap_position_calculator --top 40
+    python benchmarks/import_profile.py --startup
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import requests
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child_env() -> Dict[str, str]:
+    env = os.environ.copy()
+    backend_path = os.path.join(project_root, "app", "backend")
+    env["PYTHONPATH"] = f"{project_root}:{os.path.join(project_root, 'app')}:{backend_path}:" + env.get("PYTHONPATH", "")
+    return env
+
+
+def import_times(module: str) -> List[Tuple[str, int, int]]:
+    """(module, self_us, cumulative_us) for every module imported by `import <module>` in a fresh interpreter"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=project_root, env=child_env(), capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def report_imports(module: str, top: int) -> None:
+    rows = import_times(module)
+    total_us = max(cumulative for _, _, cumulative in rows)
+
+    print(f"import {module}: {total_us / 1000:.1f}ms across {len(rows)} modules\n")
+
+    print(f"Slowest {top} modules by cumulative time:")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: -r[2])[:top]:
+        print(f"  {cumulative_us / 1000:>9.1f}ms  (self {self_us / 1000:>7.1f}ms)  {name}")
+
+    # Self time summed per top-level package shows which dependencies dominate
+    by_package: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+    print(f"\nSlowest {top} top-level packages by self time:")
+    for package, self_us in sorted(by_package.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"  {self_us / 1000:>9.1f}ms  {package}")
+
+
+def report_startup(port: int, timeout: float) -> None:
+    """Start uvicorn and time until the backend is ready and until it is warm"""
+    cmd = [sys.executable, "-m", "uvicorn", "app.backend.main:app", "--port", str(port)]
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=project_root, env=child_env(),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    ready_after = None
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                response = requests.get(f"http://127.0.0.1:{port}/api/health/ready", timeout=0.5)
+                if response.status_code == 200:
+                    if ready_after is None:
+                        ready_after = time.perf_counter() - started
+                    if response.json().get("warm"):
+                        print(f"\nuvicorn ready after {ready_after:.2f}s, warm after {time.perf_counter() - started:.2f}s")
+                        return
+            except requests.RequestException:
+                pass
+            time.sleep(0.05)
+        print(f"\nBackend not warm within {timeout}s (ready after {ready_after})")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import-time and cold-start profile of the backend")
+    parser.add_argument("--module", default="app.backend.main", help="Module to profile")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--startup", action="store_true", help="Also time uvicorn until ready and warm")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    report_imports(args.module, args.top)
+    if args.startup:
+        report_startup(args.port, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+End-to-end benchmarks for the backend hot paths.
+
+Runs process_positions, get_wallet_aave_positions, CoinMetricsService.fetch_market_data
+and generate_excel_report against the replay server for synthetic portfolios of
+10/100/1,000 wallets, reporting latency percentiles, upstream call counts and
+peak memory, optionally compared against a stored baseline.
+
+Usage:
+    python benchmarks/run_benchmarks.py --fixtures fixtures/default --latency-ms 40
+    python benchmarks/run_benchmarks.py --fixtures fixtures/default --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --fixtures fixtures/default --compare benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+
+def start_replay_server(args: argparse.Namespace) -> subprocess.Popen:
+    """Start the replay server in a subprocess and wait until it answers"""
+    cmd = [
+        sys.executable, "-m", "app.backend.replay_server", "replay",
+        "--fixtures", args.fixtures,
+        "--port", str(args.port),
+        "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate),
+        "--seed", "1"
+    ]
+    proc = subprocess.Popen(cmd, cwd=project_root)
+    for _ in range(100):
+        try:
+            requests.get(f"{args.replay_url}/__stats", timeout=0.5)
+            return proc
+        except requests.RequestException:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("Replay server did not start")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def synthetic_wallets(wallets: List[Dict[str, Any]], count: int) -> List[Dict[str, Any]]:
+    """Repeat the recorded wallets up to `count` entries, each under its own strategy name"""
+    if not wallets:
+        return []
+    return [
+        {**wallets[i % len(wallets)], "strategy": f"{wallets[i % len(wallets)].get('strategy', 'wallet')}_{i}"}
+        for i in range(count)
+    ]
+
+
+def run_benchmark(
+    name: str,
+    func: Callable[[], Any],
+    iterations: int,
+    replay_url: str,
+    reset_caches: Callable[[], None]
+) -> Dict[str, Any]:
+    """Time `func` over several iterations, counting upstream calls and peak memory"""
+    latencies = []
+    requests.post(f"{replay_url}/__reset")
+    tracemalloc.start()
+    for _ in range(iterations):
+        reset_caches()
+        started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - started)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    counters = requests.get(f"{replay_url}/__stats").json()
+
+    rpc_calls = sum(v for k, v in counters.items() if k.startswith("rpc:"))
+    coinmetrics_calls = sum(v for k, v in counters.items() if k.startswith("coinmetrics:"))
+    result = {
+        "name": name,
+        "iterations": iterations,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p90_ms": percentile(latencies, 90) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "rpc_calls": rpc_calls / iterations,
+        "rpc_http_requests": counters.get("rpc_http_requests", 0) / iterations,
+        "coinmetrics_calls": coinmetrics_calls / iterations,
+        "peak_memory_mb": peak / 1024 ** 2,
+    }
+    print(f"{name:<45} p50 {result['p50_ms']:>9.1f}ms  p99 {result['p99_ms']:>9.1f}ms  "
+          f"rpc {result['rpc_calls']:>8.1f} ({result['rpc_http_requests']:.1f} http)  "
+          f"cm {result['coinmetrics_calls']:>5.1f}  mem {result['peak_memory_mb']:>7.1f}MB")
+    return result
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, max_regression: float) -> bool:
+    """Print deltas against a baseline; return False if any latency or call count regressed too much"""
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+
+    ok = True
+    print(f"\nComparison against {baseline_path} (allowed regression {max_regression:.0%}):")
+    for result in results:
+        base = baseline.get(result["name"])
+        if base is None:
+            print(f"  {result['name']}: no baseline")
+            continue
+        for field in ("p50_ms", "p99_ms", "rpc_calls", "peak_memory_mb"):
+            if not base[field]:
+                continue
+            change = (result[field] - base[field]) / base[field]
+            regressed = change > max_regression
+            ok = ok and not regressed
+            print(f"  {result['name']:<45} {field:<15} {base[field]:>10.1f} -> {result[field]:>10.1f} "
+                  f"({change:+.1%}){'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Backend end-to-end benchmarks on replayed fixtures")
+    parser.add_argument("--fixtures", default="fixtures/default", help="Replay fixtures directory")
+    parser.add_argument("--port", type=int, default=8546)
+    parser.add_argument("--no-server", action="store_true", help="Use an already running replay server")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--sizes", default="10,100,1000", help="Synthetic portfolio sizes (wallets)")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warm", action="store_true", help="Keep caches between iterations")
+    parser.add_argument("--only", default=None, help="Comma separated benchmark name prefixes to run")
+    parser.add_argument("--save-baseline", default=None, help="Write results to this JSON file")
+    parser.add_argument("--compare", default=None, help="Compare results against this baseline JSON file")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+    args.replay_url = f"http://127.0.0.1:{args.port}"
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+
+    # Route every upstream call to the replay server before backend modules read their config
+    os.environ["RPC_URL_OVERRIDE"] = f"{args.replay_url}/rpc/{{network}}"
+    os.environ["COINMETRICS_API_URL"] = f"{args.replay_url}/v4/timeseries/asset-metrics"
+    os.environ.setdefault("COINMETRICS_API_KEY", "replay")
+    os.environ.setdefault("TIMESERIES_DB_PATH", ":memory:")
+    os.environ.setdefault("CALL_HISTORY_DB_PATH", ":memory:")
+    os.environ.setdefault("BLOCK_INDEX_DB_PATH", ":memory:")
+    os.environ.setdefault("POSITION_LEDGER_DB_PATH", ":memory:")
+    os.environ.setdefault("SNAPSHOT_HISTORY_DB_PATH", ":memory:")
+
+    server: Optional[subprocess.Popen] = None if args.no_server else start_replay_server(args)
+    try:
+        from app.backend import main as backend
+        from app.backend.coinmetrics import CoinMetricsService
+        from app.backend.consts import DEFAULT_ASSETS, METRIC_FREQUENCIES
+        from app.backend.eth_call_cache import eth_call_cache
+        from app.backend.timeseries_store import get_timeseries_store
+        from app.backend import web3_aave_position_calculator as aave_calculator
+        from app.backend import web3_uniswap_position_calculator as uniswap_calculator
+        from app.backend.web3_aave_position_calculator import get_aave_wallet_addresses, get_wallet_aave_positions
+        from app.backend.web3_uniswap_position_calculator import get_uniswap_wallet_addresses, process_positions
+
+        def reset_caches() -> None:
+            if not args.warm:
+                eth_call_cache.block_cache.clear()
+                eth_call_cache.permanent_cache.clear()
+                get_timeseries_store().clear()
+
+        uniswap_wallets = get_uniswap_wallet_addresses()
+        aave_wallets = get_aave_wallet_addresses()
+        coinmetrics = CoinMetricsService()
+        only = args.only.split(",") if args.only else None
+
+        benchmarks: List[tuple] = [(
+            "fetch_market_data",
+            lambda: asyncio.run(coinmetrics.fetch_market_data(
+                list(METRIC_FREQUENCIES), METRIC_FREQUENCIES, DEFAULT_ASSETS
+            ))
+        )]
+        for size in [int(s) for s in args.sizes.split(",")]:
+            uniswap = synthetic_wallets(uniswap_wallets, size)
+            aave = synthetic_wallets(aave_wallets, size)
+            benchmarks.append((
+                f"process_positions[{size}]",
+                lambda wallets=uniswap: [list(process_positions(w)) for w in wallets]
+            ))
+            benchmarks.append((
+                f"get_wallet_aave_positions[{size}]",
+                lambda wallets=aave: [get_wallet_aave_positions(w) for w in wallets]
+            ))
+
+            def excel_report(uniswap=uniswap, aave=aave):
+                # The report reads wallets from PORTFOLIOS; substitute the synthetic portfolio
+                uniswap_calculator.get_uniswap_wallet_addresses = lambda: [dict(w) for w in uniswap]
+                aave_calculator.get_aave_wallet_addresses = lambda: [dict(w) for w in aave]
+                return asyncio.run(backend.generate_excel_report(
+                    portfolio=None, include_aave=True, include_uniswap=True
+                ))
+            benchmarks.append((f"generate_excel_report[{size}]", excel_report))
+
+        results = []
+        for name, func in benchmarks:
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            results.append(run_benchmark(name, func, args.iterations, args.replay_url, reset_caches))
+
+        if args.save_baseline:
+            with open(args.save_baseline, "w") as f:
+                json.dump({"created_at": time.strftime("%Y-%m-%d %H:%M:%S"), "args": vars(args), "results": results},
+                          f, indent=2)
+            print(f"\nSaved baseline to {args.save_baseline}")
+
+        if args.compare and not compare(results, args.compare, args.max_regression):
+            sys.exit(1)
+    finally:
+        if server is not None:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
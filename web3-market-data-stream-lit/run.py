@@ -3,6 +3,8 @@ import subprocess
 import sys
 import signal
 import time
+import urllib.error
+import urllib.request
 from contextlib import ExitStack
 
 # Resolve project paths
@@ -12,12 +14,31 @@ backend_path = os.path.join(app_path, "backend")
 
 # Prepare environment with updated PYTHONPATH
 env = os.environ.copy()
-env["PYTHONPATH"] = f"{app_path}:{backend_path}:" + env.get("PYTHONPATH", "")
+env["PYTHONPATH"] = f"{project_root}:{app_path}:{backend_path}:" + env.get("PYTHONPATH", "")
 
 # Commands
 backend_cmd = ["python", "-m", "uvicorn", "app.backend.main:app", "--reload", "--port", "8000"]
 frontend_cmd = ["streamlit", "run", "app/frontend/main.py"]
 
+BACKEND_READY_URL = "http://127.0.0.1:8000/api/health/ready"
+BACKEND_READY_TIMEOUT = 60  # seconds
+
+def wait_for_backend(backend_proc, timeout=BACKEND_READY_TIMEOUT):
+    """Poll the readiness endpoint until the backend accepts requests"""
+    started = time.time()
+    while time.time() - started < timeout:
+        if backend_proc.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(BACKEND_READY_URL, timeout=1) as response:
+                if response.status == 200:
+                    print(f"Backend ready after {time.time() - started:.2f}s")
+                    return True
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.1)
+    return False
+
 # Clean shutdown handler
 def shutdown_handler(processes):
     print("\nShutting down processes...")
@@ -35,7 +56,8 @@ def main():
         processes.append(backend_proc)
         stack.callback(backend_proc.terminate)
 
-        time.sleep(2)  # Give backend time to start
+        if not wait_for_backend(backend_proc):
+            print(f"Backend not ready after {BACKEND_READY_TIMEOUT}s, starting frontend anyway")
 
         print("Starting Streamlit frontend...")
         frontend_proc = subprocess.Popen(frontend_cmd, cwd=project_root, env=env)